@@ -0,0 +1,335 @@
+import os
+import sqlite3
+import time
+
+# --- Configuration ---
+ACCESS_DB = 'building_access_full.db'
+# Partition written by single-building runs (create_databases, the plain sync)
+DEFAULT_BUILDING = os.getenv("TTLOCK_BUILDING_ID", "main")
+# Owner columns create_databases may provide (only the ones found in the CSV are filled)
+OWNER_COLUMNS = ['owner_name', 'monthly_fee', 'debt', 'payment_partner']
+# ---------------------
+
+# Every table carries the building_id of the account/building it came from,
+# so several buildings can share one file and be replaced independently.
+SCHEMA = """
+    CREATE TABLE locks (
+        lock_id INTEGER PRIMARY KEY,
+        lock_name TEXT,
+        building_id TEXT NOT NULL
+    );
+
+    -- One row per line of the owners CSV (an apartment can have several owners)
+    CREATE TABLE owners (
+        owner_row INTEGER PRIMARY KEY,
+        building_id TEXT NOT NULL,
+        apt_id TEXT NOT NULL,
+        owner_name TEXT,
+        monthly_fee,
+        debt,
+        payment_partner TEXT
+    );
+
+    -- One row per registry label (keyName / cardName) and building
+    CREATE TABLE persons (
+        person_id INTEGER PRIMARY KEY,
+        label TEXT,
+        apt_id TEXT,
+        building_id TEXT NOT NULL
+    );
+
+    -- keyId / cardId are unique across TTLock, so they double as the rowid
+    CREATE TABLE ekeys (
+        key_id INTEGER PRIMARY KEY,
+        person_id INTEGER NOT NULL REFERENCES persons (person_id),
+        lock_id INTEGER REFERENCES locks (lock_id),
+        username TEXT,
+        status TEXT,
+        building_id TEXT NOT NULL
+    );
+    CREATE INDEX idx_ekeys_person ON ekeys (person_id);
+    CREATE INDEX idx_ekeys_lock ON ekeys (lock_id);
+    CREATE INDEX idx_ekeys_username ON ekeys (username);
+
+    CREATE TABLE cards (
+        card_id INTEGER PRIMARY KEY,
+        person_id INTEGER NOT NULL REFERENCES persons (person_id),
+        lock_id INTEGER REFERENCES locks (lock_id),
+        card_number TEXT,
+        start_date INTEGER,
+        end_date INTEGER,
+        create_date INTEGER,
+        building_id TEXT NOT NULL
+    );
+    CREATE INDEX idx_cards_person ON cards (person_id);
+    CREATE INDEX idx_cards_lock ON cards (lock_id);
+    CREATE INDEX idx_cards_number ON cards (card_number);
+"""
+
+# Indexes that involve building_id (also (re)created when an old file is upgraded)
+BUILDING_INDEXES = """
+    CREATE INDEX IF NOT EXISTS idx_owners_apt ON owners (apt_id, building_id);
+    CREATE INDEX IF NOT EXISTS idx_persons_apt ON persons (apt_id, building_id);
+    CREATE INDEX IF NOT EXISTS idx_persons_building ON persons (building_id);
+    CREATE INDEX IF NOT EXISTS idx_ekeys_building ON ekeys (building_id);
+    CREATE INDEX IF NOT EXISTS idx_cards_building ON cards (building_id);
+"""
+
+PARTITIONED_TABLES = ("locks", "owners", "persons", "ekeys", "cards")
+
+# When each building's credentials were fetched from TTLock (epoch ms), so
+# the blocker can tell a stale synced status from a change it made since
+SYNC_TABLE = """
+    CREATE TABLE IF NOT EXISTS building_syncs (
+        building_id TEXT PRIMARY KEY,
+        synced_at INTEGER NOT NULL
+    )
+"""
+
+# Every eKey and card with its lock, building and apartment, in blocker target columns
+CREDENTIALS_SQL = """
+    SELECT 'ekey' AS kind, e.key_id AS id, e.lock_id AS lockId, p.building_id, p.apt_id, p.label,
+           e.status, NULL AS startDate, NULL AS endDate, s.synced_at
+    FROM ekeys e JOIN persons p USING (person_id)
+    LEFT JOIN building_syncs s ON s.building_id = p.building_id
+    UNION ALL
+    SELECT 'card', c.card_id, c.lock_id, p.building_id, p.apt_id, p.label, NULL, c.start_date, c.end_date,
+           s.synced_at
+    FROM cards c JOIN persons p USING (person_id)
+    LEFT JOIN building_syncs s ON s.building_id = p.building_id
+"""
+
+
+def _compat_view_sql(owner_cols) -> str:
+    """
+    access_with_owners, column for column as the old wide table:
+    eKey rows first, then card rows, each left-joined to the owners of the
+    same apartment in the same building.
+    (eKey rows never carried a lockId there, so the view keeps it NULL, and
+    there was no card id: read that from the tables, e.g. CREDENTIALS_SQL.)
+    """
+    owner_select = "".join(f", o.{c}" for c in owner_cols)
+    return f"""
+        CREATE VIEW access_with_owners AS
+        SELECT p.apt_id, p.label AS original_label, 'ekey' AS type, e.username, e.key_id, e.status,
+               NULL AS lockId, NULL AS cardNumber, NULL AS startDate,
+               NULL AS endDate, NULL AS createDate{owner_select}
+        FROM ekeys e
+        JOIN persons p ON p.person_id = e.person_id
+        LEFT JOIN owners o ON o.apt_id = p.apt_id AND o.building_id = p.building_id
+        UNION ALL
+        SELECT p.apt_id, p.label, 'card', NULL, NULL, NULL,
+               c.lock_id, c.card_number, c.start_date,
+               c.end_date, c.create_date{owner_select}
+        FROM cards c
+        JOIN persons p ON p.person_id = c.person_id
+        LEFT JOIN owners o ON o.apt_id = p.apt_id AND o.building_id = p.building_id
+    """
+
+
+def _py(v):
+    """pandas/numpy cell -> plain Python value sqlite3 can bind."""
+    if v is None or v != v:  # NaN
+        return None
+    return v.item() if hasattr(v, "item") else v
+
+
+def _insert(conn, building_id, persons, locks, ekeys, cards, df_owners, owner_cols, synced_at):
+    """Inserts one building's rows (person ids must already be free)."""
+    conn.execute("INSERT OR REPLACE INTO building_syncs VALUES (?, ?)",
+                 (building_id, int(time.time() * 1000) if synced_at is None else int(synced_at)))
+    conn.executemany("INSERT OR REPLACE INTO locks VALUES (?, ?, ?)",
+                     ((lock_id, name, building_id) for lock_id, name in locks.items()))
+    if df_owners is not None:
+        conn.executemany(
+            f"INSERT INTO owners (building_id, apt_id{''.join(', ' + c for c in owner_cols)}) "
+            f"VALUES ({', '.join('?' * (len(owner_cols) + 2))})",
+            [(building_id,) + tuple(_py(v) for v in row)
+             for row in df_owners[['apt_id'] + owner_cols].itertuples(index=False, name=None)],
+        )
+    conn.executemany("INSERT INTO persons VALUES (?, ?, ?, ?)", (p + (building_id,) for p in persons))
+    conn.executemany(
+        "INSERT INTO ekeys (key_id, person_id, lock_id, username, status, building_id) "
+        "VALUES (?, ?, ?, ?, ?, ?)", (e + (building_id,) for e in ekeys)
+    )
+    conn.executemany(
+        "INSERT INTO cards (card_id, person_id, lock_id, card_number, start_date, end_date, create_date, "
+        "building_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (c + (building_id,) for c in cards)
+    )
+
+
+def write_access_db(persons, locks, ekeys, cards, df_owners, db_path=ACCESS_DB, building_id=DEFAULT_BUILDING,
+                    synced_at=None):
+    """
+    Writes the normalized access database.
+
+    persons: [(person_id, label, apt_id)]
+    locks:   {lock_id: lock_name}
+    ekeys:   [(key_id, person_id, lock_id, username, status)]
+    cards:   [(card_id, person_id, lock_id, card_number, start, end, create)]
+
+    The file is built next to `db_path` and swapped in at the end, so readers
+    never see a half-built database and no space from old runs is left behind.
+    Everything goes into partition `building_id`; other buildings are not
+    kept (use replace_building to update one building in place).
+    synced_at is when the rows were fetched from TTLock (epoch ms, default now).
+    Returns the number of rows in the access_with_owners view.
+    """
+    owner_cols = [c for c in OWNER_COLUMNS if c in df_owners.columns]
+    tmp_path = f"{db_path}.building"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        with conn:
+            conn.executescript(SCHEMA + BUILDING_INDEXES + SYNC_TABLE)
+            _insert(conn, building_id, persons, locks, ekeys, cards, df_owners, owner_cols, synced_at)
+            conn.execute(_compat_view_sql(owner_cols))
+        conn.execute("ANALYZE")
+        rows = conn.execute("SELECT COUNT(*) FROM access_with_owners").fetchone()[0]
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, db_path)
+    return rows
+
+
+def _execute_script(conn, script):
+    """
+    Runs a ;-separated script statement by statement: unlike executescript
+    it doesn't COMMIT first, so it stays inside the caller's transaction.
+    """
+    for statement in script.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def _upgrade(conn):
+    """
+    Creates the schema in a file without one (empty, or holding only the
+    wide access_with_owners table of the original scripts, which is kept as
+    access_with_owners_old), or adds building_id to a file written before
+    buildings existed (its rows become DEFAULT_BUILDING). Files from before
+    building_syncs get the (empty) table: their sync times are unknown.
+    Returns the owner columns present.
+    """
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.execute(SYNC_TABLE)
+    if "persons" not in tables:
+        if "access_with_owners" in tables:
+            # The view takes over its name
+            conn.execute("ALTER TABLE access_with_owners RENAME TO access_with_owners_old")
+        _execute_script(conn, SCHEMA.replace("CREATE TABLE ", "CREATE TABLE IF NOT EXISTS ")
+                        .replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ") + BUILDING_INDEXES)
+        conn.execute(_compat_view_sql(OWNER_COLUMNS))
+        return list(OWNER_COLUMNS)
+
+    # Keep the owner columns the existing view exposes
+    view_cols = [name for _, name, *_ in conn.execute("PRAGMA table_info(access_with_owners)")]
+    owner_cols = [name for name in view_cols if name in OWNER_COLUMNS]
+    if "card_id" in view_cols:
+        # Views from before it matched the old table exactly
+        conn.execute("DROP VIEW access_with_owners")
+        conn.execute(_compat_view_sql(owner_cols))
+    if "building_id" not in {name for _, name, *_ in conn.execute("PRAGMA table_info(persons)")}:
+        for table in PARTITIONED_TABLES:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN building_id TEXT NOT NULL DEFAULT '{DEFAULT_BUILDING}'")
+        # The apartment indexes gain building_id as second column
+        conn.execute("DROP INDEX IF EXISTS idx_owners_apt")
+        conn.execute("DROP INDEX IF EXISTS idx_persons_apt")
+        _execute_script(conn, BUILDING_INDEXES)
+        conn.execute("DROP VIEW IF EXISTS access_with_owners")
+        conn.execute(_compat_view_sql(owner_cols))
+    return owner_cols
+
+
+def replace_building(building_id, persons, locks, ekeys, cards, df_owners=None, db_path=ACCESS_DB,
+                     synced_at=None):
+    """
+    Replaces one building's partition of the access database in place,
+    leaving every other building untouched. Same row shapes as
+    write_access_db; person ids only need to be unique within the call
+    (they are renumbered). Owners are replaced only if df_owners is given.
+    synced_at is when the rows were fetched from TTLock (epoch ms, default now).
+    Runs in one transaction, so readers see either the old or the new
+    building. Returns the number of eKeys + cards written.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            owner_cols = _upgrade(conn)
+            if df_owners is not None:
+                owner_cols = [c for c in owner_cols if c in df_owners.columns]
+            for table in PARTITIONED_TABLES:
+                if table != "owners" or df_owners is not None:
+                    conn.execute(f"DELETE FROM {table} WHERE building_id = ?", (building_id,))
+
+            # Shift this building's person ids past the ones already in the file
+            offset = conn.execute("SELECT COALESCE(MAX(person_id), 0) FROM persons").fetchone()[0]
+            persons = [(pid + offset, label, apt) for pid, label, apt in persons]
+            ekeys = [(e[0], e[1] + offset) + tuple(e[2:]) for e in ekeys]
+            cards = [(c[0], c[1] + offset) + tuple(c[2:]) for c in cards]
+            _insert(conn, building_id, persons, locks, ekeys, cards, df_owners, owner_cols, synced_at)
+    finally:
+        conn.close()
+    return len(ekeys) + len(cards)
+
+
+def open_access_db(db_path=ACCESS_DB):
+    """Opens the access DB with its schema brought up to date (see _upgrade)."""
+    conn = sqlite3.connect(db_path)
+    with conn:
+        _upgrade(conn)
+    return conn
+
+
+def buildings(db_path=ACCESS_DB) -> list:
+    """Building ids present in the access database."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return [b for (b,) in conn.execute("SELECT DISTINCT building_id FROM persons ORDER BY building_id")]
+    finally:
+        conn.close()
+
+
+# ==========================================
+# Common queries (index lookups, no full scans)
+# ==========================================
+def credentials_for_apartment(apt_id, db_path=ACCESS_DB, building_id=None):
+    """
+    Every eKey and card of apartment `apt_id` (in `building_id`, or in any
+    building if None): (type, label, id, lock_id, lock_name, detail).
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("""
+            SELECT 'ekey', p.label, e.key_id, e.lock_id, l.lock_name, e.status
+            FROM persons p JOIN ekeys e ON e.person_id = p.person_id
+            LEFT JOIN locks l ON l.lock_id = e.lock_id
+            WHERE p.apt_id = ?1 AND (?2 IS NULL OR p.building_id = ?2)
+            UNION ALL
+            SELECT 'card', p.label, c.card_id, c.lock_id, l.lock_name, c.card_number
+            FROM persons p JOIN cards c ON c.person_id = p.person_id
+            LEFT JOIN locks l ON l.lock_id = c.lock_id
+            WHERE p.apt_id = ?1 AND (?2 IS NULL OR p.building_id = ?2)
+        """, (str(apt_id), building_id)).fetchall()
+    finally:
+        conn.close()
+
+
+def persons_on_lock(lock_id, db_path=ACCESS_DB):
+    """Everyone holding an eKey or card for `lock_id`: (type, label, apt_id, id)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("""
+            SELECT 'ekey', p.label, p.apt_id, e.key_id
+            FROM ekeys e JOIN persons p ON p.person_id = e.person_id
+            WHERE e.lock_id = ?
+            UNION ALL
+            SELECT 'card', p.label, p.apt_id, c.card_id
+            FROM cards c JOIN persons p ON p.person_id = c.person_id
+            WHERE c.lock_id = ?
+        """, (lock_id, lock_id)).fetchall()
+    finally:
+        conn.close()
@@ -0,0 +1,235 @@
+import sqlite3
+
+from label_parser import default_parser
+
+# Registry categories -> (credential kind, id field)
+KINDS = {"ekeys": ("ekey", "keyId"), "cards": ("card", "cardId")}
+
+
+class AccessIndex:
+    """
+    In-memory inverted index over the access registry.
+
+    Every lock gets a dense bit number (in the order locks are first seen),
+    so the set of locks a person or apartment reaches is one Python int and
+    set questions are bitwise operations:
+
+        idx.persons_with(all_of=["Parking 1"], none_of=["I Hall Door"])
+        idx.locks_of_apartment("34")
+
+    Alongside the masks it keeps lock -> persons and apartment -> persons.
+    Credentials are counted per (person, lock), so adding or removing one
+    eKey / card only flips a bit when the person's first credential on that
+    lock appears or their last one goes away.
+    """
+
+    def __init__(self, parser=default_parser):
+        self.parser = parser
+        self.lock_bit = {}      # lock_id -> bit number
+        self.lock_ids = []      # bit number -> lock_id
+        self.lock_names = {}    # lock_id -> name
+        self.person_mask = {}   # label -> bitmask of locks
+        self.person_apt = {}    # label -> apt_id (None if the label has no apartment)
+        self.apt_mask = {}      # apt_id -> bitmask of locks
+        self.lock_persons = {}  # lock_id -> {label}
+        self.apt_persons = {}   # apt_id -> {label}
+        self._credentials = {}  # (kind, cred_id) -> (label, lock_id)
+        self._counts = {}       # (label, lock_id) -> number of credentials
+
+    # ==========================================
+    # Building
+    # ==========================================
+    @classmethod
+    def from_registry(cls, registry, parser=default_parser, person_apts=None):
+        """
+        Builds the index from a {"ekeys": {label: [...]}, "cards": {label: [...]}}
+        registry of dict records or compact EKey / Card records.
+        `person_apts` ({label: apt_id}, e.g. identity.identity_map("label"))
+        are apartments already known for labels; only the others are parsed.
+        """
+        idx = cls(parser)
+        idx.person_apt.update(person_apts or {})
+        for category, (kind, id_field) in KINDS.items():
+            for label, items in registry.get(category, {}).items():
+                for item in items:
+                    if isinstance(item, dict):
+                        idx.add(kind, item.get(id_field), label, item.get("lockId"), item.get("lockName"))
+                    else:  # records.EKey / records.Card
+                        idx.add(kind, item.id, label, item.lock.lock_id, item.lock.name)
+        return idx
+
+    @classmethod
+    def from_db(cls, db_path="building_access_full.db", parser=default_parser, building_id=None):
+        """
+        Builds the index from the normalized tables written by create_databases,
+        for one building or (building_id=None) every building in the file.
+        """
+        idx = cls(parser)
+        conn = sqlite3.connect(db_path)
+        try:
+            # Optional building filter, e.g. " WHERE building_id = ?"
+            where, params = (" WHERE {}building_id = ?", (building_id,)) if building_id is not None else ("", ())
+            idx.lock_names.update(conn.execute("SELECT lock_id, lock_name FROM locks" + where.format(""), params))
+            # Apartments were already parsed when the DB was written
+            idx.person_apt.update(conn.execute("SELECT label, apt_id FROM persons" + where.format(""), params))
+            rows = conn.execute(f"""
+                SELECT 'ekey', e.key_id, p.label, e.lock_id FROM ekeys e JOIN persons p USING (person_id)
+                {where.format("e.")}
+                UNION ALL
+                SELECT 'card', c.card_id, p.label, c.lock_id FROM cards c JOIN persons p USING (person_id)
+                {where.format("c.")}
+            """, params * 2).fetchall()
+        finally:
+            conn.close()
+        for kind, cred_id, label, lock_id in rows:
+            idx.add(kind, cred_id, label, lock_id)
+        return idx
+
+    def _bit(self, lock_id) -> int:
+        bit = self.lock_bit.get(lock_id)
+        if bit is None:
+            bit = self.lock_bit[lock_id] = len(self.lock_ids)
+            self.lock_ids.append(lock_id)
+        return bit
+
+    def _apartment(self, label):
+        if label not in self.person_apt:
+            apt = self.parser.parse(label)
+            # parse_label returns ("Unknown", None) for empty labels
+            self.person_apt[label] = apt if isinstance(apt, str) else None
+        return self.person_apt[label]
+
+    def _refresh_apartment(self, apt):
+        """Recomputes an apartment's mask from its persons (after a bit was cleared)."""
+        mask = 0
+        for label in self.apt_persons.get(apt, ()):
+            mask |= self.person_mask.get(label, 0)
+        if mask:
+            self.apt_mask[apt] = mask
+        else:
+            self.apt_mask.pop(apt, None)
+            self.apt_persons.pop(apt, None)
+
+    # ==========================================
+    # Incremental updates
+    # ==========================================
+    def add(self, kind: str, cred_id, label: str, lock_id, lock_name=None):
+        """Adds one eKey / card. Re-adding a known credential moves it to the new person/lock."""
+        if lock_id is None:
+            return
+        if cred_id is not None:
+            if self._credentials.get((kind, cred_id)) == (label, lock_id):
+                return
+            self.remove(kind, cred_id)
+            self._credentials[(kind, cred_id)] = (label, lock_id)
+        if lock_name is not None:
+            self.lock_names[lock_id] = lock_name
+
+        key = (label, lock_id)
+        self._counts[key] = self._counts.get(key, 0) + 1
+        if self._counts[key] > 1:
+            return
+        bit = 1 << self._bit(lock_id)
+        self.person_mask[label] = self.person_mask.get(label, 0) | bit
+        self.lock_persons.setdefault(lock_id, set()).add(label)
+        apt = self._apartment(label)
+        if apt is not None:
+            self.apt_mask[apt] = self.apt_mask.get(apt, 0) | bit
+            self.apt_persons.setdefault(apt, set()).add(label)
+
+    def remove(self, kind: str, cred_id) -> bool:
+        """Removes one eKey / card by id. Returns False if it wasn't indexed."""
+        entry = self._credentials.pop((kind, cred_id), None)
+        if entry is None:
+            return False
+        label, lock_id = entry
+        self._counts[entry] -= 1
+        if self._counts[entry]:
+            return True
+        del self._counts[entry]
+
+        mask = self.person_mask[label] & ~(1 << self.lock_bit[lock_id])
+        if mask:
+            self.person_mask[label] = mask
+        else:
+            del self.person_mask[label]
+        persons = self.lock_persons[lock_id]
+        persons.discard(label)
+        if not persons:
+            del self.lock_persons[lock_id]
+        apt = self.person_apt.get(label)
+        if apt is not None:
+            if not mask:
+                self.apt_persons[apt].discard(label)
+            self._refresh_apartment(apt)
+        return True
+
+    def apply_changes(self, changes):
+        """Applies a delta_sync change set ({"added": [...], "removed": [...], "modified": [...]})."""
+        for change in changes.get("removed", []):
+            self.remove(change["kind"], change["id"])
+        for change in changes.get("added", []) + changes.get("modified", []):
+            # add() moves a known credential if its person changed
+            self.add(change["kind"], change["id"], change["person"], change["lockId"],
+                     change.get("record", {}).get("lockName"))
+
+    # ==========================================
+    # Queries
+    # ==========================================
+    def lock_mask(self, locks) -> int:
+        """
+        Bitmask for lock ids and/or lock names. An unknown lock raises
+        KeyError: silently dropping it would turn e.g. all_of=["Parkng 1"]
+        into "everyone".
+        """
+        by_name = {name: lock_id for lock_id, name in self.lock_names.items()}
+        mask = 0
+        for lock in locks:
+            lock_id = lock if lock in self.lock_bit else by_name.get(lock)
+            if lock_id not in self.lock_bit:
+                raise KeyError(f"unknown lock {lock!r}")
+            mask |= 1 << self.lock_bit[lock_id]
+        return mask
+
+    def locks_in(self, mask: int) -> list:
+        """Lock ids whose bits are set in `mask`, in bit order."""
+        out = []
+        while mask:
+            low = mask & -mask
+            out.append(self.lock_ids[low.bit_length() - 1])
+            mask ^= low
+        return out
+
+    def locks_of_person(self, label) -> list:
+        return self.locks_in(self.person_mask.get(label, 0))
+
+    def locks_of_apartment(self, apt_id) -> list:
+        return self.locks_in(self.apt_mask.get(str(apt_id), 0))
+
+    def persons_on_lock(self, lock) -> set:
+        """Persons with a credential on `lock` (id or name); empty for an unknown lock."""
+        try:
+            mask = self.lock_mask([lock])
+        except KeyError:
+            return set()
+        return set(self.lock_persons.get(self.locks_in(mask)[0], ()))
+
+    def persons_with(self, all_of=(), none_of=(), any_of=()) -> list:
+        """
+        Persons that can open every lock in `all_of`, none in `none_of` and at
+        least one of `any_of`. Raises KeyError if any of the locks is unknown.
+        """
+        need, deny, some = self.lock_mask(all_of), self.lock_mask(none_of), self.lock_mask(any_of)
+        return [label for label, mask in self.person_mask.items()
+                if mask & need == need and not mask & deny and (not any_of or mask & some)]
+
+    def apartments_with(self, all_of=(), none_of=(), any_of=()) -> list:
+        """Same as persons_with, over the combined locks of each apartment."""
+        need, deny, some = self.lock_mask(all_of), self.lock_mask(none_of), self.lock_mask(any_of)
+        return [apt for apt, mask in self.apt_mask.items()
+                if mask & need == need and not mask & deny and (not any_of or mask & some)]
+
+    def lock_of(self, kind: str, cred_id):
+        """Lock id of one indexed eKey / card, or None."""
+        entry = self._credentials.get((kind, cred_id))
+        return entry[1] if entry else None
@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+from instrumentation import get_logger, metrics
+from ratelimit import TTLockError
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+TOKEN_CACHE_FILE = os.getenv("TTLOCK_TOKEN_CACHE", "ttlock_token.json")
+# Refresh this many seconds before the token expires
+REFRESH_MARGIN = float(os.getenv("TTLOCK_TOKEN_REFRESH_MARGIN", "300"))
+# ---------------------
+
+TOKEN_PATH = "/oauth2/token"
+# errcodes meaning "this access token is no longer valid"
+INVALID_TOKEN_ERRCODES = {10003}
+
+log = get_logger("auth")
+
+
+def hash_password_md5(password: str) -> str:
+    """Encrypts a plain-text password using MD5 and returns the 32-character lowercase hash."""
+    return hashlib.md5(password.encode('utf-8')).hexdigest()
+
+
+class TokenManager:
+    """
+    Keeps a valid TTLock access token.
+
+    - Tokens come from /oauth2/token (password grant) and are cached on disk
+      with their expiry, so new processes reuse them.
+    - REFRESH_MARGIN seconds before expiry the refresh token is used; if that
+      fails, the password grant runs again.
+    - Concurrent callers share one refresh: the first one sends the request,
+      the others wait on the same lock and get its result.
+    - invalidate(token) is called when the API rejects a token; only the
+      first report for a given token forces a refresh.
+
+    Without username/password it falls back to the static `access_token`
+    (TTLOCK_ACCESS_TOKEN), which is then never refreshed. Credentials not
+    passed in are read from the TTLOCK_* environment unless
+    env_fallback=False (one manager per account, see multi_sync.py).
+    """
+
+    def __init__(self, base_url: str | None = None, client_id: str | None = None,
+                 client_secret: str | None = None, username: str | None = None,
+                 password: str | None = None, *, access_token: str | None = None,
+                 cache_path: str | None = TOKEN_CACHE_FILE, margin: float = REFRESH_MARGIN,
+                 transport: httpx.AsyncBaseTransport | None = None, timeout: float = 15.0,
+                 env_fallback: bool = True):
+        env = os.getenv if env_fallback else (lambda name: None)
+        self.base_url = (base_url or os.getenv("TTLOCK_API_URL") or "").rstrip('/')
+        self.client_id = client_id or env("TTLOCK_CLIENT_ID")
+        self.client_secret = client_secret or env("TTLOCK_CLIENT_SECRET")
+        self.username = username or env("TTLOCK_USERNAME")
+        self.password = password or env("TTLOCK_PASSWORD")
+        self.static_token = access_token or env("TTLOCK_ACCESS_TOKEN")
+        self.cache_path = cache_path
+        self.margin = margin
+        self.transport = transport
+        self.timeout = timeout
+        self._token = None  # {"access_token", "refresh_token", "expires_at", "uid"}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def can_login(self) -> bool:
+        return bool(self.client_id and self.client_secret and self.username and self.password)
+
+    # ==========================================
+    # Disk cache
+    # ==========================================
+    def _load(self):
+        self._loaded = True
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return  # A corrupt cache file just means a new login
+        if cached.get("client_id") == self.client_id and cached.get("username") == self.username:
+            self._token = cached["token"]
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        tmp = f"{self.cache_path}.tmp"
+        # Owner-only: the file holds a live token
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"client_id": self.client_id, "username": self.username, "token": self._token}, f)
+        os.replace(tmp, self.cache_path)
+
+    def _fresh(self, token) -> bool:
+        return token is not None and token["expires_at"] - self.margin > time.time()
+
+    # ==========================================
+    # Token requests
+    # ==========================================
+    async def _request(self, form: dict) -> dict:
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout,
+                                     transport=self.transport) as http:
+            response = await http.post(TOKEN_PATH, data=form)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("errcode", 0) != 0 or "access_token" not in data:
+            raise TTLockError(TOKEN_PATH, data.get("errcode"), data.get("errmsg"))
+        return {
+            "access_token": data["access_token"],
+            "refresh_token": data.get("refresh_token"),
+            "expires_at": time.time() + float(data.get("expires_in", 0)),
+            "uid": data.get("uid"),
+        }
+
+    async def _login(self) -> dict:
+        metrics.inc("oauth_token_requests_total", grant="password")
+        return await self._request({
+            "clientId": self.client_id,
+            "clientSecret": self.client_secret,
+            "username": self.username,
+            "password": hash_password_md5(self.password),
+            "grant_type": "password",
+            "redirect_uri": "http://localhost",
+        })
+
+    async def _refresh(self, refresh_token: str) -> dict:
+        metrics.inc("oauth_token_requests_total", grant="refresh_token")
+        return await self._request({
+            "clientId": self.client_id,
+            "clientSecret": self.client_secret,
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+        })
+
+    # ==========================================
+    # Public API
+    # ==========================================
+    async def get_token(self) -> str | None:
+        """The current access token, logging in / refreshing first if needed."""
+        if not self.can_login:
+            return self.static_token
+        if not self._loaded:
+            self._load()
+        if self._fresh(self._token):
+            return self._token["access_token"]
+
+        async with self._lock:
+            # Someone else may have refreshed while we waited
+            if self._fresh(self._token):
+                return self._token["access_token"]
+            token = None
+            if self._token and self._token.get("refresh_token"):
+                try:
+                    token = await self._refresh(self._token["refresh_token"])
+                    log.info("Access token refreshed")
+                except (httpx.HTTPError, TTLockError) as e:
+                    log.warning(f"Token refresh failed ({e}), logging in again")
+            if token is None:
+                token = await self._login()
+                log.info("Logged in, new access token")
+            self._token = token
+            self._save()
+            return token["access_token"]
+
+    async def invalidate(self, token: str | None):
+        """The API rejected `token`: force a refresh on the next get_token (once per token)."""
+        if self._token and self._token["access_token"] == token:
+            self._token = {**self._token, "expires_at": 0}
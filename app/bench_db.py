@@ -0,0 +1,73 @@
+"""
+Benchmark: per-row tenant credit updates vs update_tenant_credits_many.
+
+Creates a throwaway access_control database with N tenants and times three
+ways of updating every tenant's balance/access:
+  - the old way: connect, update, commit, close for every flat
+  - update_tenant_credit per flat on the pooled WAL connection
+  - one update_tenant_credits_many call (single transaction, executemany)
+
+Run from the app/ folder:
+    python bench_db.py --tenants 2000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import db
+
+
+def legacy_update(flat_number, new_balance, access_status):
+    """update_tenant_credit as it was: a new connection and a commit per row."""
+    conn = sqlite3.connect(db.DB_PATH)
+    c = conn.cursor()
+    c.execute("""
+        UPDATE Tenants
+        SET current_credit_balance = ?, is_access_active = ?
+        WHERE flat_number = ?
+    """, (new_balance, access_status, flat_number))
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench_access_control.db")
+        db.initialize_db()
+        with db.get_manager().transaction() as conn:
+            conn.executemany(
+                "INSERT INTO Tenants (flat_number, ttlock_lock_id, tenant_email, monthly_fee) VALUES (?, ?, ?, ?)",
+                [(i, 1000 + i % 8, f"tenant{i}@example.com", 50.0) for i in range(1, args.tenants + 1)],
+            )
+        updates = [(i, float(i % 300) - 100, i % 300 >= 100) for i in range(1, args.tenants + 1)]
+
+        timings = {}
+        start = time.perf_counter()
+        for u in updates:
+            legacy_update(*u)
+        timings["connect + commit per row"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for u in updates:
+            db.update_tenant_credit(*u)
+        timings["pooled WAL, commit per row"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        changed = db.update_tenant_credits_many(updates)
+        timings["update_tenant_credits_many"] = time.perf_counter() - start
+        db.close_connections()
+
+    base = timings["connect + commit per row"]
+    print(f"{args.tenants} tenants ({changed} rows changed in batch)")
+    for name, seconds in timings.items():
+        print(f"{name:<28} {seconds:8.4f}s  {base / seconds:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark: identity resolution with the trigram blocking index vs scoring every pair.
+
+Generates owners with Georgian names, bank payments whose "Partner's Name"
+is the owner's name in Latin capitals (either word order, some typos, many
+descriptions without an apartment) and registry labels, some of which are
+names instead of apartment numbers. Times identity.resolve, scores a
+sample of the same queries against every reference name (the O(n x m)
+way) and reports how often both agree and how many apartments came out
+right.
+
+Run from the app/ folder:
+    python bench_identity.py --owners 5000 --payments 50000 --labels 3000
+"""
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from database import payer_rows
+from identity import GEORGIAN_TO_LATIN, MATCH_THRESHOLD, ngrams, normalize_name, resolve, similarity
+
+FIRST = ["ნინო", "გიორგი", "დავით", "ნიკა", "მარიამ", "ანა", "ლევან", "თამარ", "ლაშა", "ეკატერინე",
+         "ზურაბ", "ირაკლი", "სალომე", "ნათია", "გიგა", "ქეთევან", "ხატია", "ვახტანგ", "თეიმურაზ", "მაია"]
+# Surnames are 2-3 consonant+vowel syllables plus a common ending
+ROOTS = [c + v for c in "ბგდვზთკლმნპჟრსტფქღყშჩცძწჭხჯჰ" for v in "აეიოუ"]
+ENDINGS = ["ძე", "შვილი", "ია", "ანი", "ური", "ავა", "ელი"]
+
+
+def make_data(n_owners, n_payments, n_labels, seed=11):
+    rng = random.Random(seed)
+    surnames = set()
+    while len(surnames) < n_owners:
+        surnames.add("".join(rng.choice(ROOTS) for _ in range(rng.randint(2, 3))) + rng.choice(ENDINGS))
+    surnames = sorted(surnames)
+    rng.shuffle(surnames)
+    owners = [(f"{rng.choice(FIRST)} {surname}", str(apt)) for apt, surname in enumerate(surnames, 1)]
+
+    truth = {}  # every generated spelling -> its owner's apartment
+
+    def latin(name, apt):
+        first, last = name.translate(GEORGIAN_TO_LATIN).upper().split()
+        text = f"{last} {first}" if rng.random() < 0.5 else f"{first} {last}"
+        if rng.random() < 0.1:  # one typo
+            i = rng.randrange(len(text))
+            text = text[:i] + rng.choice("AEIOU") + text[i + 1:]
+        truth[text] = apt
+        return text
+
+    rows = []
+    for _ in range(n_payments):
+        name, apt = rng.choice(owners)
+        desc = f"ბინა {apt} გადასახადი" if rng.random() < 0.4 else "transfer"
+        rows.append((desc, latin(name, apt)))
+    df_trans = pd.DataFrame(rows, columns=["Description", "Partner's Name"])
+
+    labels = []
+    for _ in range(n_labels):
+        name, apt = rng.choice(owners)
+        if rng.random() < 0.8:
+            labels.append((f"{int(apt):02d}", apt))
+        else:
+            label = name if rng.random() < 0.5 else latin(name, apt).title()
+            truth[label] = apt
+            labels.append((label, None))
+    truth.update(owners)
+    return labels, owners, df_trans, truth
+
+
+def brute_force(queries, references, threshold):
+    """Best reference apartment per query by scoring every pair (same tie rule as identity._best)."""
+    refs = [(ngrams(normalize_name(name)), apt) for name, apt in references]
+    out = {}
+    for name in queries:
+        grams = ngrams(normalize_name(name))
+        best, apts = 0.0, set()
+        for other, apt in refs:
+            score = similarity(grams, other)
+            if score > best:
+                best, apts = score, {apt}
+            elif score == best:
+                apts.add(apt)
+        out[name] = next(iter(apts)) if best >= threshold and len(apts) == 1 else None
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--owners", type=int, default=5000)
+    parser.add_argument("--payments", type=int, default=50000)
+    parser.add_argument("--labels", type=int, default=3000)
+    parser.add_argument("--sample", type=int, default=300, help="queries also scored against every name")
+    parser.add_argument("--threshold", type=float, default=MATCH_THRESHOLD)
+    args = parser.parse_args()
+
+    labels, owners, df_trans, truth = make_data(args.owners, args.payments, args.labels)
+    start = time.perf_counter()
+    payers = payer_rows(df_trans)
+    payer_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rows = resolve(labels, owners, payers, args.threshold)
+    resolve_s = time.perf_counter() - start
+
+    queries = [(source, name, apt) for source, name, _, apt, method, *_ in rows
+               if source in ("label", "payer") and method in ("name", "ambiguous", None)]
+    right = sum(1 for _, name, apt in queries if apt is not None and truth.get(name) == apt)
+    resolved = sum(1 for *_, apt in queries if apt is not None)
+
+    references = [(n, a) for n, a in owners] + [(n, a) for n, a in payers if a is not None]
+    sample = queries[:args.sample]
+    start = time.perf_counter()
+    reference = brute_force([name for _, name, _ in sample], references, args.threshold)
+    brute_s = time.perf_counter() - start
+    agree = sum(1 for _, name, apt in sample if reference[name] == apt)
+
+    print(f"owners {len(owners)}, payments {len(df_trans)} ({len(payers)} distinct payers), labels {len(labels)}")
+    print(f"payer_rows:           {payer_s * 1000:9.1f} ms")
+    print(f"resolve (blocked):    {resolve_s * 1000:9.1f} ms for {len(queries)} name queries")
+    print(f"all pairs, {len(sample)} queries: {brute_s * 1000:9.1f} ms "
+          f"(~{brute_s / max(1, len(sample)) * len(queries) * 1000:.0f} ms for all)")
+    print(f"resolved {resolved}/{len(queries)}, correct {right}/{resolved}, "
+          f"same as all-pairs on the sample: {agree}/{len(sample)}")
+
+
+if __name__ == "__main__":
+    main()
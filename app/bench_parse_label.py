@@ -0,0 +1,95 @@
+"""
+Benchmark: original parse_label vs the compiled, memoized LabelParser.
+
+Builds a synthetic label list with realistic repetition (the same person
+label shows up once per lock), checks both give identical output for every
+label, then reports per-label cost: original, LabelParser cold (empty cache),
+warm (cached) and parse_series over a whole pandas column.
+
+Run from the app/ folder:
+    python bench_parse_label.py --labels 200000 --distinct 2000
+"""
+import argparse
+import contextlib
+import io
+import random
+import re
+import time
+
+import pandas as pd
+
+from label_parser import LabelParser
+
+
+def legacy_parse_label(label):
+    """parse_label exactly as it was before label_parser.py, kept for comparison."""
+    if not label: return "Unknown", None
+    s = str(label).strip()
+
+    def extract_id(s):
+        for suffix in ["LMD", "CMG", "HL", "cmg", "თელასი", "M", "m", "Mars", "მარსი"]:
+            if suffix in s:
+                return suffix
+
+        single_match = re.search(r'^(\d+[\/\d]*)', s)
+        if single_match:
+            base = single_match.group(1)
+            if '/' not in base and base.isdigit():
+                return str(int(base))
+            else:
+                return base
+
+        return None
+
+    s = extract_id(s)
+    if s is None:
+        print(f"Term did not match any pattern: {label}")
+    return s
+
+
+def make_labels(n, distinct, seed=11):
+    rng = random.Random(seed)
+    shapes = ["{n:02d}", "{n}", "{n} HL", "{n}/{m}", "  {n:03d} ", "CMG {n}", "{n} cmg office",
+              "Mars {n}", "მარსი", "თელასი {n}", "LMD Team", "+99559{n:07d}", "guest{n}@gmail.com",
+              "{n}M", "Nika {n}", ""]
+    pool = [rng.choice(shapes).format(n=rng.randint(1, 150), m=rng.randint(1, 150)) for _ in range(distinct)]
+    return [rng.choice(pool) for _ in range(n)]
+
+
+def per_label(fn, labels):
+    start = time.perf_counter()
+    for label in labels:
+        fn(label)
+    return (time.perf_counter() - start) / len(labels) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", type=int, default=200_000)
+    parser.add_argument("--distinct", type=int, default=2_000)
+    args = parser.parse_args()
+
+    labels = make_labels(args.labels, args.distinct)
+    # Unmatched labels print a warning; keep it out of the timings
+    with contextlib.redirect_stdout(io.StringIO()):
+        mismatches = [l for l in set(labels) if legacy_parse_label(l) != LabelParser().parse(l)]
+
+        legacy_ns = per_label(legacy_parse_label, labels)
+        lp = LabelParser()
+        cold_ns = per_label(lp.parse, sorted(set(labels)))
+        warm_ns = per_label(lp.parse, labels)
+
+        series = pd.Series(labels)
+        start = time.perf_counter()
+        LabelParser().parse_series(series)
+        series_ns = (time.perf_counter() - start) / len(labels) * 1e9
+
+    print(f"{len(labels):,} labels, {len(set(labels)):,} distinct, mismatches vs original: {len(mismatches)}")
+    print(f"original          {legacy_ns:8.0f} ns/label")
+    print(f"compiled, cold    {cold_ns:8.0f} ns/label")
+    print(f"compiled, cached  {warm_ns:8.0f} ns/label  ({legacy_ns / warm_ns:.1f}x)")
+    print(f"parse_series      {series_ns:8.0f} ns/label  ({legacy_ns / series_ns:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
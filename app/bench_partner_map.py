@@ -0,0 +1,99 @@
+"""
+Benchmark: payment-partner extraction, old iterrows loop vs build_apt_partner_map.
+
+Generates synthetic bank transactions (mixed Georgian/Latin descriptions, some
+without an apartment, some without a partner, day-first dates out of file
+order, some missing), times both implementations and checks they produce the
+same apartment -> partner map, both in file order and ordered by date
+(date_col, as with TTLOCK_TRANS_DATE_COL).
+
+Run from the app/ folder:
+    python bench_partner_map.py --rows 1000000 --legacy-rows 200000
+"""
+import argparse
+import random
+import re
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from database import build_apt_partner_map
+
+
+def legacy_apt_partner_map(df_trans, date_col=None):
+    """
+    The original per-row loop from create_databases, kept for comparison.
+    With `date_col`, a payment only replaces one with the same or an older
+    day-first date (undated payments lose to dated ones).
+    """
+    apt_partner_map, latest = {}, {}
+    for _, row in df_trans.iterrows():
+        desc = str(row.get('Description', ''))
+        partner = row.get("Partner's Name")
+
+        if pd.isna(partner): continue
+
+        match = re.search(r'(?:ბინა|apt|apartment)\s*(\d+)', desc, re.IGNORECASE)
+        if match:
+            apt_num = str(int(match.group(1)))
+            if date_col is not None:
+                try:
+                    date = datetime.strptime(str(row.get(date_col)), "%d/%m/%Y")
+                except ValueError:
+                    date = datetime.min
+                if date < latest.get(apt_num, datetime.min):
+                    continue
+                latest[apt_num] = date
+            apt_partner_map[apt_num] = partner
+    return apt_partner_map
+
+
+def make_transactions(n, seed=7):
+    rng = random.Random(seed)
+    templates = ["ბინა {n} გადასახადი", "Apt {n} monthly fee", "apartment {n:02d}", "APT{n}",
+                 "კომუნალური გადახდა", "transfer", "ბინა{n} ოქტომბერი"]
+    partners = [f"Partner {i}" for i in range(400)] + [None]
+    # Day-first and shuffled: "03/04/2025" is 3 April, and file order isn't date order
+    dates = [f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2023, 2025)}" for _ in range(n)]
+    for i in rng.sample(range(n), n // 50):
+        dates[i] = None
+    return pd.DataFrame({
+        "Description": [rng.choice(templates).format(n=rng.randint(1, 120)) for _ in range(n)],
+        "Partner's Name": [rng.choice(partners) for _ in range(n)],
+        "Date": dates,
+    })
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--legacy-rows", type=int, default=200_000,
+                        help="rows to run the slow iterrows loop on (0 = skip)")
+    args = parser.parse_args()
+
+    df = make_transactions(args.rows)
+    fast, fast_time = timed(build_apt_partner_map, df)
+    print(f"vectorized  {args.rows:>9,} rows: {fast_time:8.3f}s  ({len(fast)} apartments)")
+    dated, dated_time = timed(build_apt_partner_map, df, "Date")
+    print(f"  by date   {args.rows:>9,} rows: {dated_time:8.3f}s  ({len(dated)} apartments)")
+
+    if args.legacy_rows:
+        subset = df.head(args.legacy_rows)
+        for label, date_col in (("file order", None), ("by date", "Date")):
+            slow, slow_time = timed(legacy_apt_partner_map, subset, date_col)
+            sub_fast, sub_fast_time = timed(build_apt_partner_map, subset, date_col)
+            print(f"{label}:")
+            print(f"  iterrows    {len(subset):>9,} rows: {slow_time:8.3f}s")
+            print(f"  vectorized  {len(subset):>9,} rows: {sub_fast_time:8.3f}s  "
+                  f"-> {slow_time / sub_fast_time:.0f}x faster, identical: {slow == sub_fast}")
+
+
+if __name__ == "__main__":
+    main()
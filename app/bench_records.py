@@ -0,0 +1,75 @@
+"""
+Benchmark: memory of the dict registry vs compact EKey/Card records.
+
+Serializes a synthetic building to per-lock JSON pages (what the API sends),
+then for each representation parses the pages, builds the registry the way
+sync_access_IC_ekey does, drops the raw pages and measures what the
+registry keeps alive (tracemalloc). Also checks that the compact registry
+dumps to exactly the same JSON and times the dump.
+
+Run from the app/ folder:
+    python bench_records.py --credentials 100000
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from mock_ttlock import make_building
+from records import LockTable, json_default
+from ttlock_api_GET import _add_items
+
+
+def build(pages, compact):
+    """Registry from raw JSON pages; returns (registry, retained bytes, seconds)."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    registry = {"ekeys": {}, "cards": {}}
+    locks = LockTable()
+    for lock_id, name, ekeys_json, cards_json in pages:
+        ekeys, cards = json.loads(ekeys_json), json.loads(cards_json)
+        lock = locks.get(lock_id, name) if compact else None
+        _add_items(registry, "ekeys", ekeys, name, lock)
+        _add_items(registry, "cards", cards, name, lock)
+        del ekeys, cards
+    seconds = time.perf_counter() - start
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return registry, retained, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--credentials", type=int, default=100_000)
+    parser.add_argument("--locks", type=int, default=100)
+    args = parser.parse_args()
+
+    per_lock = max(1, args.credentials // args.locks)
+    building = make_building(args.locks, per_lock * 2 // 3, per_lock - per_lock * 2 // 3)
+    pages = [(lock_id, lock["name"], json.dumps(lock["ekeys"]), json.dumps(lock["cards"]))
+             for lock_id, lock in building.items()]
+    total = sum(len(l["ekeys"]) + len(l["cards"]) for l in building.values())
+
+    results = {}
+    for name, compact in (("dict records", False), ("EKey/Card records", True)):
+        registry, retained, seconds = build(pages, compact)
+        start = time.perf_counter()
+        dumped = json.dumps(registry, ensure_ascii=False, default=json_default)
+        results[name] = (retained, seconds, time.perf_counter() - start, dumped)
+        del registry
+
+    base = results["dict records"][0]
+    print(f"{total} credentials on {args.locks} locks")
+    print(f"{'registry':<18} {'retained MB':>11} {'bytes/cred':>10} {'build s':>8} {'dump s':>7}")
+    for name, (retained, build_s, dump_s, _) in results.items():
+        print(f"{name:<18} {retained / 1e6:11.2f} {retained / total:10.0f} {build_s:8.3f} {dump_s:7.3f}"
+              f"  ({retained / base:.0%})")
+    same = results["dict records"][3] == results["EKey/Card records"][3]
+    print(f"identical JSON: {same}")
+
+
+if __name__ == "__main__":
+    main()
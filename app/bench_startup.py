@@ -0,0 +1,79 @@
+"""
+Benchmark: start-up time of cli.py commands.
+
+Runs each command in a fresh interpreter several times and reports the
+median wall time, plus the slowest imports (`python -X importtime`) of
+one run. `tenant get` runs against a throw-away tenant DB.
+
+Run from the app/ folder:
+    python bench_startup.py --runs 10
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+COMMANDS = {
+    "python -c pass": ["-c", "pass"],
+    "tenant get": ["cli.py", "tenant", "get", "34"],
+    "tenant update": ["cli.py", "tenant", "update", "34", "--balance", "10", "--active"],
+    "sync --help": ["cli.py", "sync", "--help"],
+    "import ttlock_api_GET": ["-c", "import ttlock_api_GET"],
+    "import database": ["-c", "import database"],
+}
+
+
+def run(cmd, env):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *cmd], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def top_imports(cmd, env, n):
+    """(cumulative µs, module) of the slowest top-level imports of one run."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", *cmd], env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Top-level imports are the ones not indented under another module
+        if not name[1:].startswith(" "):
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=5, help="slowest imports to show per command")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "tenants.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("""CREATE TABLE Tenants (flat_number INTEGER PRIMARY KEY, ttlock_lock_id INTEGER NOT NULL,
+                        tenant_email TEXT NOT NULL, monthly_fee REAL NOT NULL,
+                        current_credit_balance REAL DEFAULT 0.0, is_access_active BOOLEAN DEFAULT 0)""")
+        conn.execute("INSERT INTO Tenants VALUES (34, 26294486, 'tenant34@example.com', 45.0, 0.0, 1)")
+        conn.commit()
+        conn.close()
+        env = {**os.environ, "TTLOCK_TENANT_DB": db_path}
+
+        print(f"{'command':<24} {'median ms':>9} {'min ms':>7}")
+        for name, cmd in COMMANDS.items():
+            times = [run(cmd, env) for _ in range(args.runs)]
+            print(f"{name:<24} {statistics.median(times) * 1000:9.1f} {min(times) * 1000:7.1f}")
+        for name in ("tenant get", "import ttlock_api_GET"):
+            print(f"\nslowest imports, {name}:")
+            for cumulative, module in top_imports(COMMANDS[name], env, args.top):
+                print(f"  {cumulative / 1000:7.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
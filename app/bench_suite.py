@@ -0,0 +1,267 @@
+"""
+Benchmark suite: sync_access_IC_ekey, create_databases and parse_label on
+synthetic buildings of several sizes, fully offline.
+
+- sync: get_lock_list + sync_access_IC_ekey against MockTTLock through
+  httpx.MockTransport (per-request latency, optional error injection)
+- build-db: create_databases on a registry JSON + owners/transactions CSVs
+  generated for the same building, in a temp folder
+- parse-label: a fresh LabelParser over every label of the building
+- multi-sync: sync_buildings over --buildings copies of the building, each
+  behind its own mock account, written into one access DB; compared with
+  the slowest single building it shows what running them side by side costs
+
+Every run appends one line per measurement to RESULTS_FILE (JSON lines,
+with git commit and timestamp) and compares it with the previous result
+for the same benchmark and scale, so slowdowns show up as REGRESSION.
+
+Run from the app/ folder:
+    python bench_suite.py                          # all benchmarks, small + medium
+    python bench_suite.py --scales large --only sync --latency 0.02
+    python bench_suite.py --fail-on-regression     # exit 1 on a regression (CI)
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from mock_ttlock import MockTTLock, make_building
+
+# --- Configuration ---
+RESULTS_FILE = os.getenv("BENCH_RESULTS_FILE", "bench_results.jsonl")
+# name -> (locks, eKeys per lock, cards per lock)
+SCALES = {
+    "small": (8, 120, 60),
+    "medium": (32, 400, 200),
+    "large": (128, 1000, 500),
+}
+# A result this much slower than the previous one is flagged
+REGRESSION_THRESHOLD = 0.20
+# ---------------------
+
+
+def _quiet():
+    """The code under test prints per page / per label; keep that out of the timings."""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def _registry(building) -> dict:
+    """The master registry sync_access_IC_ekey would build for `building`."""
+    from ttlock_api_GET import _add_items
+
+    registry = {"ekeys": {}, "cards": {}}
+    for lock in building.values():
+        _add_items(registry, "ekeys", lock["ekeys"], lock["name"])
+        _add_items(registry, "cards", lock["cards"], lock["name"])
+    return registry
+
+
+def bench_sync(building, latency, error_rate):
+    from ratelimit import AdaptiveRateLimiter
+    from ttl_cache import TTLCache
+    import ttlock_api_GET
+
+    # Memory-only lock list cache: the mock building must not end up in lock_list_cache.json
+    ttlock_api_GET.lock_list_cache = TTLCache(ttlock_api_GET.LOCK_LIST_TTL)
+    mock = MockTTLock(building, latency=latency, error_rate=error_rate)
+
+    async def run():
+        limiter = AdaptiveRateLimiter(rate=10_000, endpoint_rates={})
+        async with mock.client(limiter=limiter) as client:
+            locks = await ttlock_api_GET.get_lock_list(client, use_cache=False)
+            return await ttlock_api_GET.sync_access_IC_ekey(locks, client=client)
+
+    with _quiet():
+        start = time.perf_counter()
+        registry = asyncio.run(run())
+        seconds = time.perf_counter() - start
+    records = sum(len(v) for kind in registry.values() for v in kind.values())
+    return seconds, {"requests": sum(mock.requests.values()), "records": records}
+
+
+def bench_build_db(building):
+    import database
+
+    registry = _registry(building)
+    apartments = sorted({str(i) for i in range(1, 81)}, key=int)
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            with open("registry.json", "w", encoding="utf-8") as f:
+                json.dump(registry, f, ensure_ascii=False)
+            with open("owners.csv", "w", encoding="utf-8") as f:
+                f.write("title\n")
+                pd.DataFrame({
+                    "მესაკუთრეები:": [f"Owner {a}" for a in apartments],
+                    "ბინის #": [float(a) for a in apartments],
+                    "მოსაკრებელი თვეში": [50] * len(apartments),
+                    "ყოველთვიური მოსაკრებლის დავალიანება": [(int(a) % 4) * 50 for a in apartments],
+                }).to_csv(f, index=False)
+            with open("transactions.csv", "w", encoding="utf-8") as f:
+                f.write("title\n")
+                pd.DataFrame({
+                    "Description": [f"ბინა {i % 80 + 1} fee" for i in range(5000)],
+                    "Partner's Name": [f"Partner {i % 97}" for i in range(5000)],
+                }).to_csv(f, index=False)
+
+            saved = database.JSON_FILE, database.TRANS_CSV, database.OWNERS_CSV
+            database.JSON_FILE, database.TRANS_CSV, database.OWNERS_CSV = \
+                "registry.json", "transactions.csv", "owners.csv"
+            try:
+                with _quiet():
+                    start = time.perf_counter()
+                    database.create_databases()
+                    seconds = time.perf_counter() - start
+            finally:
+                database.JSON_FILE, database.TRANS_CSV, database.OWNERS_CSV = saved
+            size = os.path.getsize(database.ACCESS_DB)
+        finally:
+            os.chdir(cwd)
+    return seconds, {"access_db_bytes": size}
+
+
+def bench_multi_sync(building, latency, n_buildings):
+    from multi_sync import Account, sync_buildings
+    from ratelimit import AdaptiveRateLimiter
+    from ttl_cache import TTLCache
+    import ttlock_api_GET
+
+    ttlock_api_GET.lock_list_cache = TTLCache(ttlock_api_GET.LOCK_LIST_TTL)
+    sizes = (len(building), len(next(iter(building.values()))["ekeys"]), len(next(iter(building.values()))["cards"]))
+    mocks = {f"building-{i}": MockTTLock(make_building(*sizes, seed=i, first_lock_id=20000000 + i * 100_000),
+                                         latency=latency)
+             for i in range(n_buildings)}
+    accounts = [Account(building_id, f"client-{building_id}", access_token="mock-token") for building_id in mocks]
+
+    async def run(db_path):
+        clients = {b: m.client(f"client-{b}", limiter=AdaptiveRateLimiter(rate=10_000, endpoint_rates={}))
+                   for b, m in mocks.items()}
+        try:
+            return await sync_buildings(accounts, processes=0, db_path=db_path, clients=clients)
+        finally:
+            for client in clients.values():
+                await client.aclose()
+
+    with tempfile.TemporaryDirectory() as tmp, _quiet():
+        start = time.perf_counter()
+        summary = asyncio.run(run(os.path.join(tmp, "access.db")))
+        seconds = time.perf_counter() - start
+    per_building = [s["seconds"] for s in summary.values()]
+    return seconds, {"buildings": n_buildings, "slowest_building_s": max(per_building),
+                     "sum_of_buildings_s": round(sum(per_building), 3),
+                     "records": sum(s["ekeys"] + s["cards"] for s in summary.values())}
+
+
+def bench_parse_label(building):
+    from label_parser import LabelParser
+
+    labels = [k["keyName"] for lock in building.values() for k in lock["ekeys"]]
+    labels += [c["cardName"] for lock in building.values() for c in lock["cards"]]
+    parser = LabelParser()
+    with _quiet():
+        start = time.perf_counter()
+        for label in labels:
+            parser.parse(label)
+        seconds = time.perf_counter() - start
+    return seconds, {"labels": len(labels), "distinct": len(set(labels))}
+
+
+BENCHMARKS = {
+    "sync": lambda building, args: bench_sync(building, args.latency, args.error_rate),
+    "build-db": lambda building, args: bench_build_db(building),
+    "parse-label": lambda building, args: bench_parse_label(building),
+    "multi-sync": lambda building, args: bench_multi_sync(building, args.latency, args.buildings),
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous(path=RESULTS_FILE) -> dict:
+    """(bench, scale, params) -> last recorded result."""
+    previous = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    r = json.loads(line)
+                    previous[(r["bench"], r["scale"], json.dumps(r.get("params"), sort_keys=True))] = r
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=list(SCALES))
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the fastest is kept")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per mock TTLock request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock requests that fail")
+    parser.add_argument("--buildings", type=int, default=4, help="accounts in the multi-sync benchmark")
+    parser.add_argument("--results", default=RESULTS_FILE)
+    parser.add_argument("--no-record", action="store_true", help="compare only, don't append results")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+    # Per-sync log lines would end up in the timings
+    logging.getLogger("ttlock").setLevel(logging.WARNING)
+
+    previous = load_previous(args.results)
+    commit = _git_commit()
+    results, regressions = [], []
+
+    print(f"{'benchmark':<12} {'scale':<7} {'seconds':>9} {'previous':>9} {'change':>8}  details")
+    for scale in args.scales:
+        n_locks, n_ekeys, n_cards = SCALES[scale]
+        building = make_building(n_locks, n_ekeys, n_cards)
+        for name in args.only:
+            params = {"locks": n_locks, "ekeys": n_ekeys, "cards": n_cards}
+            if name == "sync":
+                params.update(latency=args.latency, error_rate=args.error_rate)
+            elif name == "multi-sync":
+                params.update(latency=args.latency, buildings=args.buildings)
+            runs = [BENCHMARKS[name](building, args) for _ in range(max(1, args.repeat))]
+            seconds, details = min(runs, key=lambda r: r[0])
+
+            result = {"ts": int(time.time()), "commit": commit, "python": platform.python_version(),
+                      "bench": name, "scale": scale, "params": params,
+                      "seconds": round(seconds, 6), "details": details}
+            results.append(result)
+
+            prev = previous.get((name, scale, json.dumps(params, sort_keys=True)))
+            if prev:
+                change = seconds / prev["seconds"] - 1
+                flag = "  REGRESSION" if change > REGRESSION_THRESHOLD else ""
+                if flag:
+                    regressions.append(result)
+                prev_col, change_col = f"{prev['seconds']:9.4f}", f"{change:+7.1%}"
+            else:
+                prev_col, change_col, flag = f"{'-':>9}", f"{'-':>8}", ""
+            print(f"{name:<12} {scale:<7} {seconds:9.4f} {prev_col} {change_col}  {details}{flag}")
+
+    if not args.no_record:
+        with open(args.results, "a", encoding="utf-8") as f:
+            for r in results:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        print(f"\n{len(results)} results appended to {args.results}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
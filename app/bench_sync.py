@@ -0,0 +1,115 @@
+"""
+Benchmark: serial vs concurrent sync_access_IC_ekey against a local mock TTLock server.
+
+Starts a tiny HTTP server on 127.0.0.1 that answers the per-lock list
+endpoints (eKeys, IC cards, passcodes, fingerprints) with synthetic,
+deterministic pages after a fixed delay
+(to stand in for the real round-trip), then times the sync at a few
+concurrency limits and checks that every run builds the same registry.
+
+Run from the app/ folder:
+    python bench_sync.py --locks 8 --ekeys 120 --cards 60 --latency 0.05
+    python bench_sync.py --passcodes 40 --fingerprints 20   # all four credential types
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import ttlock_api_GET
+from mock_ttlock import MockTTLock, make_building
+from ratelimit import AdaptiveRateLimiter
+from ttlock_client import TTLockClient
+
+
+def start_mock_server(building, latency):
+    """
+    Serves the building on a random local port (real sockets, so connection
+    pooling is part of what is measured). Returns (server, base_url).
+    """
+    mock = MockTTLock(building)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            time.sleep(latency)
+
+            status, payload = mock.respond(url.path, params)
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # Default backlog of 5 drops SYNs under a concurrent burst (1s retransmit stalls)
+        request_queue_size = 128
+
+    server = Server(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def run_sync(base_url, locks, concurrency, rate):
+    async def once():
+        # Fresh pooled client per run so every run pays the same connection setup
+        limiter = AdaptiveRateLimiter(rate=rate, endpoint_rates={})
+        async with TTLockClient(base_url, "bench", "bench-token", limiter=limiter) as client:
+            return await ttlock_api_GET.sync_access_IC_ekey(locks, concurrency=concurrency, client=client)
+
+    # Silence the per-page prints so we time the sync, not the terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        registry = asyncio.run(once())
+        elapsed = time.perf_counter() - start
+    return registry, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locks", type=int, default=8)
+    parser.add_argument("--ekeys", type=int, default=120, help="eKeys per lock")
+    parser.add_argument("--cards", type=int, default=60, help="IC cards per lock")
+    parser.add_argument("--passcodes", type=int, default=0, help="keyboard passcodes per lock")
+    parser.add_argument("--fingerprints", type=int, default=0, help="fingerprints per lock")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per mock request")
+    parser.add_argument("--rate", type=float, default=1000, help="client rate limit (requests/s)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+    # Per-sync log lines would end up in the timings
+    logging.getLogger("ttlock").setLevel(logging.WARNING)
+
+    building = make_building(args.locks, args.ekeys, args.cards, n_passcodes=args.passcodes,
+                             n_fingerprints=args.fingerprints)
+    server, base_url = start_mock_server(building, args.latency)
+    locks = MockTTLock(building).locks()
+
+    try:
+        baseline, base_time = run_sync(base_url, locks, 1, args.rate)
+        print(f"{'concurrency':>12} | {'seconds':>8} | {'speedup':>7} | same registry")
+        print(f"{1:>12} | {base_time:>8.3f} | {1.0:>6.1f}x | -")
+        for c in args.concurrency:
+            if c == 1:
+                continue
+            registry, elapsed = run_sync(base_url, locks, c, args.rate)
+            # json.dumps keeps dict order, so this also checks the deterministic ordering
+            same = json.dumps(registry) == json.dumps(baseline)
+            print(f"{c:>12} | {elapsed:>8.3f} | {base_time / elapsed:>6.1f}x | {same}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
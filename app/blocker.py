@@ -0,0 +1,349 @@
+"""
+Bulk block / unblock of eKeys and IC cards.
+
+Blocking an eKey freezes it, blocking an IC card moves its validity period
+into the past (the original period is remembered so unblocking restores it).
+Every change runs concurrently through the rate-limited TTLockClient of the
+credential's building: the shared one for DEFAULT_BUILDING, that building's
+own account (multi_sync.ACCOUNTS_FILE) for the others.
+
+Run from the app/ folder:
+    python blocker.py                 # dry run: block everyone with debt > 0
+    python blocker.py --apply         # really block them
+    python blocker.py --unblock 34 12 --apply
+    python blocker.py --locks "Parking 1" "Parking 2"   # only these locks
+    python blocker.py --building vake --unblock 34 --apply
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import time
+import uuid
+
+from access_db import CREDENTIALS_SQL, DEFAULT_BUILDING, open_access_db
+from access_index import AccessIndex
+from instrumentation import get_logger
+from multi_sync import ACCOUNTS_FILE, account_client, load_accounts
+from ttlock_api_GET import SYNC_CONCURRENCY, close_client, get_client
+from ttlock_client import TTLockClient
+
+# --- Configuration ---
+ACCESS_DB = 'building_access_full.db'
+BLOCK_LOG_DB = os.getenv("TTLOCK_BLOCK_LOG_DB", "block_actions.db")
+# 1 = via phone bluetooth, 2 = via gateway
+CARD_CHANGE_TYPE = int(os.getenv("TTLOCK_CARD_CHANGE_TYPE", "2"))
+# ---------------------
+
+# TTLock keyStatus values
+KEY_NORMAL = "110401"
+KEY_FROZEN = "110405"
+
+BLOCK = "block"
+UNBLOCK = "unblock"
+
+log = get_logger("blocker")
+
+
+def open_log(db_path=BLOCK_LOG_DB):
+    """Opens the per-item action log (created on first use)."""
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS block_actions (
+            run_id TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            cred_id INTEGER NOT NULL,
+            lock_id INTEGER,
+            apt_id TEXT,
+            action TEXT NOT NULL,
+            result TEXT NOT NULL,
+            detail TEXT,
+            building_id TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_block_actions_cred ON block_actions (kind, cred_id, ts);
+
+        -- Card periods as they were before we blocked them, to restore on unblock
+        CREATE TABLE IF NOT EXISTS blocked_card_periods (
+            card_id INTEGER PRIMARY KEY,
+            lock_id INTEGER NOT NULL,
+            start_date INTEGER,
+            end_date INTEGER
+        );
+    """)
+    # Logs from before buildings were tracked
+    if "building_id" not in {row[1] for row in conn.execute("PRAGMA table_info(block_actions)")}:
+        with conn:
+            conn.execute("ALTER TABLE block_actions ADD COLUMN building_id TEXT")
+    return conn
+
+
+def debtor_targets(db_path=ACCESS_DB, min_debt: float = 0.0, apt_ids=None,
+                   locks=None, index: AccessIndex | None = None, building_id=None) -> list:
+    """
+    Credentials to act on, read from the access DB's credential and owners tables.
+    By default everyone whose apartment has debt > min_debt in its own
+    building; pass `apt_ids` to pick apartments explicitly instead (e.g. for
+    unblocking), `building_id` to stay inside one building, and `locks`
+    (ids or names, resolved through the AccessIndex built from `db_path`
+    unless one is passed in; KeyError if one is unknown) to only touch
+    credentials on those locks.
+    Returns a list of target dicts: kind, id, lockId, building_id, apt_id,
+    label, status, startDate, endDate, synced_at (when the building was
+    last fetched from TTLock, epoch ms; None if unknown).
+    """
+    if locks is not None:
+        index = index or AccessIndex.from_db(db_path)
+        wanted = index.lock_mask(locks)
+    conn = open_access_db(db_path)
+    try:
+        if apt_ids is not None:
+            apt_ids = [str(a) for a in apt_ids]
+            where = [f"apt_id IN ({','.join('?' * len(apt_ids))})"]
+            args = apt_ids
+        else:
+            where = ["""EXISTS (SELECT 1 FROM owners o WHERE o.building_id = creds.building_id
+                                AND o.apt_id = creds.apt_id AND CAST(o.debt AS REAL) > ?)"""]
+            args = [min_debt]
+        if building_id is not None:
+            where.append("building_id = ?")
+            args.append(building_id)
+        rows = conn.execute(f"""
+            WITH creds AS ({CREDENTIALS_SQL})
+            SELECT kind, id, lockId, building_id, apt_id, label, status, startDate, endDate, synced_at
+            FROM creds WHERE {" AND ".join(where)}
+        """, args).fetchall()
+    finally:
+        conn.close()
+
+    targets = []
+    for kind, cred_id, lock_id, building, apt_id, label, status, start, end, synced_at in rows:
+        if locks is not None and (lock_id not in index.lock_bit or not wanted & (1 << index.lock_bit[lock_id])):
+            continue
+        targets.append({
+            "kind": kind, "id": int(cred_id), "building_id": building, "apt_id": apt_id, "lockId": lock_id,
+            "label": label, "status": status,
+            "startDate": int(start) if start is not None else None,
+            "endDate": int(end) if end is not None else None,
+            "synced_at": synced_at,
+        })
+    return targets
+
+
+def _last_results(conn) -> dict:
+    """{(kind, cred_id): (last successfully applied action, its ts)}."""
+    last = {}
+    for kind, cred_id, action, ts in conn.execute("""
+        SELECT kind, cred_id, action, ts FROM block_actions
+        WHERE result = 'ok' ORDER BY ts, rowid
+    """):
+        last[(kind, cred_id)] = (action, ts)
+    return last
+
+
+def already_applied(target: dict, action: str, last: tuple | None, now: int) -> bool:
+    """
+    True if the credential is already in the wanted state.
+
+    `last` is our last successful (action, ts) on it, if any. The synced
+    state (key status, card end date) decides when the sync is newer than
+    that entry, so a change made by hand since then counts; when it is
+    older, or its time is unknown, the log decides, because the sync can't
+    have seen our change yet. eKeys synced without a status also go by the log.
+    """
+    synced_at = target.get("synced_at")
+    if last is not None and (synced_at is None or synced_at < last[1]):
+        return last[0] == action
+    if target["kind"] == "ekey":
+        status = target.get("status")
+        if status is None:
+            return last is not None and last[0] == action
+        wanted = KEY_FROZEN if action == BLOCK else KEY_NORMAL
+        return str(status) == wanted
+    end = target.get("endDate") or 0
+    card_blocked = 0 < end <= now
+    return card_blocked if action == BLOCK else not card_blocked
+
+
+def saved_period(conn, card_id):
+    """(start_date, end_date) a card had before we blocked it, or None if we never did."""
+    return conn.execute(
+        "SELECT start_date, end_date FROM blocked_card_periods WHERE card_id = ?", (card_id,)
+    ).fetchone()
+
+
+async def _apply_one(client, sem, conn, target, action, now):
+    """Sends the one API call for `target`. Returns (result, detail)."""
+    async with sem:
+        if target["kind"] == "ekey":
+            call = client.freeze_ekey if action == BLOCK else client.unfreeze_ekey
+            data = await call(target["id"])
+        else:
+            if action == BLOCK:
+                # Remember the real period once, committed before the period
+                # changes, so a crash mid-run can't lose it; then end it a minute ago
+                with conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO blocked_card_periods VALUES (?, ?, ?, ?)",
+                        (target["id"], target["lockId"], target.get("startDate"), target.get("endDate")),
+                    )
+                start, end = target.get("startDate") or 0, now - 60_000
+                if start >= end:
+                    start = end - 60_000
+            else:
+                # run() has checked there is one
+                start, end = saved_period(conn, target["id"])
+            data = await client.change_card_period(
+                target["lockId"], target["id"], start, end, change_type=CARD_CHANGE_TYPE
+            )
+            if action == UNBLOCK and data.get("errcode", 0) == 0:
+                with conn:
+                    conn.execute("DELETE FROM blocked_card_periods WHERE card_id = ?", (target["id"],))
+
+    if data.get("errcode", 0) != 0:
+        return "error", f"errcode={data.get('errcode')} {data.get('errmsg', '')}".strip()
+    return "ok", None
+
+
+def _accounts(path=ACCOUNTS_FILE) -> dict:
+    """{building_id: Account} from ACCOUNTS_FILE ({} when there is none)."""
+    if not os.path.exists(path):
+        return {}
+    return {account.building_id: account for account in load_accounts(path)}
+
+
+async def apply_access(targets: list, action: str, dry_run: bool = False,
+                       concurrency: int = SYNC_CONCURRENCY, client: TTLockClient | None = None,
+                       log_db=BLOCK_LOG_DB, accounts: dict | None = None) -> list:
+    """
+    Blocks or unblocks every credential in `targets` (see debtor_targets).
+
+    - Idempotent: credentials already in the wanted state (by their synced
+      state, or by our own last successful action when that is newer than
+      the sync) are skipped, so a re-run only touches what is still missing.
+    - A card is only unblocked if its original period was saved when we
+      blocked it; anything else (expired on its own, shortened by hand) is
+      'refused' rather than guessed at.
+    - dry_run: nothing is sent, every would-be change is logged as 'dry-run'.
+    - Each credential goes through its own building's account: `client`
+      serves every target if passed; otherwise the account in `accounts`
+      ({building_id: Account}, default read from ACCOUNTS_FILE), or
+      get_client() for DEFAULT_BUILDING. A building with neither gets
+      'error' for its credentials.
+    - Every item gets one row in block_actions and one entry in the
+      returned list: {kind, id, lockId, building_id, apt_id, action, result, detail}.
+    """
+    if action not in (BLOCK, UNBLOCK):
+        raise ValueError(f"action must be '{BLOCK}' or '{UNBLOCK}', got {action!r}")
+
+    clients, own_clients = {}, []
+
+    def client_for(building_id):
+        nonlocal accounts
+        if client is not None:
+            return client
+        if building_id not in clients:
+            if accounts is None:
+                accounts = _accounts()
+            if building_id in accounts:
+                clients[building_id] = account_client(accounts[building_id])
+                own_clients.append(clients[building_id])
+            elif building_id in (None, DEFAULT_BUILDING):
+                clients[building_id] = get_client()
+            else:
+                raise LookupError(f"no account for building {building_id} in {ACCOUNTS_FILE}")
+        return clients[building_id]
+
+    sem = asyncio.Semaphore(max(1, int(concurrency)))
+    run_id = uuid.uuid4().hex[:12]
+    now = int(time.time() * 1000)
+    conn = open_log(log_db)
+
+    try:
+        last = _last_results(conn)
+
+        async def run(target):
+            if already_applied(target, action, last.get((target["kind"], target["id"])), now):
+                result, detail = "skipped", "already in wanted state"
+            elif action == UNBLOCK and target["kind"] == "card" and saved_period(conn, target["id"]) is None:
+                result, detail = "refused", "no saved period (not blocked by this tool)"
+            elif dry_run:
+                result, detail = "dry-run", None
+            else:
+                try:
+                    result, detail = await _apply_one(client_for(target.get("building_id")),
+                                                      sem, conn, target, action, now)
+                except Exception as e:
+                    result, detail = "error", str(e)
+            return {
+                "kind": target["kind"], "id": target["id"], "lockId": target.get("lockId"),
+                "building_id": target.get("building_id"), "apt_id": target.get("apt_id"), "action": action, "result": result, "detail": detail,
+            }
+
+        results = await asyncio.gather(*(run(t) for t in targets))
+
+        with conn:
+            conn.executemany(
+                "INSERT INTO block_actions (run_id, ts, kind, cred_id, lock_id, building_id, apt_id, action, "
+                "result, detail) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, now, r["kind"], r["id"], r["lockId"], r["building_id"], r["apt_id"], r["action"],
+                  r["result"], r["detail"]) for r in results],
+            )
+    finally:
+        conn.close()
+        for own in own_clients:
+            await own.aclose()
+
+    summary = {}
+    for r in results:
+        summary[r["result"]] = summary.get(r["result"], 0) + 1
+    log.info(f"{action} run {run_id}: {len(results)} credentials", extra={"fields": summary})
+    return results
+
+
+async def block_debtors(apply: bool = False, unblock=None, min_debt: float = 0.0, locks=None,
+                        building_id=None) -> list:
+    """
+    Blocks every debtor with debt > min_debt, or unblocks the apartments in
+    `unblock`, optionally only on `locks` (ids or names) and in one building.
+    Dry run unless apply.
+    """
+    if unblock:
+        targets, action = debtor_targets(apt_ids=unblock, locks=locks, building_id=building_id), UNBLOCK
+    else:
+        targets, action = debtor_targets(min_debt=min_debt, locks=locks, building_id=building_id), BLOCK
+
+    try:
+        results = await apply_access(targets, action, dry_run=not apply)
+    finally:
+        await close_client()
+
+    for r in results:
+        if r["result"] != "skipped":
+            print(f"  {r['result']:<8} {r['kind']:<5} {r['id']:<12} {r['building_id']} apt {r['apt_id']} "
+                  f"{r['detail'] or ''}")
+    return results
+
+
+def parse_locks(values):
+    """Command-line lock arguments: digits are lock ids, anything else a lock name."""
+    return [int(l) if l.isdigit() else l for l in values] if values else None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="send the changes (default is a dry run)")
+    parser.add_argument("--unblock", nargs="+", metavar="APT_ID", help="unblock these apartments instead")
+    parser.add_argument("--min-debt", type=float, default=0.0)
+    parser.add_argument("--locks", nargs="+", metavar="LOCK", help="only credentials on these lock ids / names")
+    parser.add_argument("--building", metavar="BUILDING_ID", help="only this building's apartments")
+    args = parser.parse_args()
+
+    try:
+        await block_debtors(args.apply, args.unblock, args.min_debt, parse_locks(args.locks), args.building)
+    except KeyError as e:
+        parser.error(e.args[0])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,220 @@
+"""
+One entry point for the day-to-day jobs.
+
+Run from the app/ folder:
+    python cli.py sync [--mode full|delta|stream] [--locks "26986212,26436420"]
+    python cli.py sync --accounts accounts.json [--processes 4]
+    python cli.py build-db [--incremental] [--building vake]
+    python cli.py records [--locks "26294486"]
+    python cli.py report [--registry building_access_master_2.json]
+    python cli.py block [--apply] [--unblock 34 12] [--min-debt 50] [--locks "Parking 1"]
+    python cli.py tenant get 34
+    python cli.py tenant update 34 --balance 120.5 --active
+
+Lock lists, input files and databases come from the environment / .env
+(TTLOCK_LOCKS, TTLOCK_REGISTRY_FILE, TTLOCK_OWNERS_CSV, TTLOCK_TRANS_CSV,
+TTLOCK_TENANT_DB, ...); the options above override them for one run.
+
+Only argparse is imported up front. Every command imports what it needs
+when it runs, so `tenant get` never loads pandas or httpx and starts in a
+few tens of milliseconds (bench_startup.py measures each command; for a
+per-module breakdown run `python -X importtime cli.py tenant get 34`).
+"""
+import argparse
+import sys
+
+
+def _run_async(coro):
+    import asyncio
+
+    from instrumentation import export_metrics
+    try:
+        return asyncio.run(coro)
+    finally:
+        # JSON summary or Prometheus text, if TTLOCK_METRICS_FILE is set
+        export_metrics()
+
+
+# ==========================================
+# Commands
+# ==========================================
+def cmd_sync(args):
+    if args.accounts:
+        import multi_sync
+        processes = args.processes if args.processes is not None else multi_sync.SYNC_PROCESSES
+        summary = _run_async(multi_sync.main(args.accounts, processes))
+        # Non-zero if any building failed (its old rows stay in the DB)
+        return 1 if any(stats["error"] for stats in summary.values()) else 0
+
+    import ttlock_api_GET
+    from utils import load_locks
+
+    kwargs = {"mode": args.mode or ttlock_api_GET.SYNC_MODE}
+    if args.locks:
+        kwargs["locks"] = load_locks(args.locks)
+    if args.output:
+        kwargs["output"] = args.output
+    _run_async(ttlock_api_GET.main(**kwargs))
+
+
+def cmd_build_db(args):
+    import database
+    from instrumentation import export_metrics, metrics
+
+    for attr, value in (("JSON_FILE", args.registry), ("OWNERS_CSV", args.owners), ("TRANS_CSV", args.transactions)):
+        if value:
+            setattr(database, attr, value)
+    try:
+        with metrics.span("create_databases"):
+            database.create_databases(incremental=args.incremental, building_id=args.building)
+    finally:
+        export_metrics()
+
+
+def cmd_records(args):
+    import lock_records
+
+    stats = _run_async(lock_records.main(args.locks))
+    print(stats)
+    return 0 if stats and not stats["failed"] else 1
+
+
+def cmd_report(args):
+    import json
+
+    from access_index import AccessIndex
+    from ttlock_api_GET import display_user_report
+
+    if args.registry:
+        with open(args.registry, "r", encoding="utf-8") as f:
+            index = AccessIndex.from_registry(json.load(f))
+    else:
+        from access_db import ACCESS_DB
+        index = AccessIndex.from_db(args.db or ACCESS_DB)
+    display_user_report(index)
+
+
+def cmd_block(args):
+    from blocker import block_debtors, parse_locks
+
+    try:
+        _run_async(block_debtors(args.apply, args.unblock, args.min_debt, parse_locks(args.locks)))
+    except KeyError as e:
+        print(e.args[0], file=sys.stderr)
+        return 1
+
+
+def _tenant_db_missing(db) -> bool:
+    """
+    Prints one line and returns True if the tenant DB or its Tenants table
+    doesn't exist (checked without creating the file).
+    """
+    import os
+    import sqlite3
+
+    if os.path.exists(db.DB_PATH):
+        conn = sqlite3.connect(f"file:{db.DB_PATH}?mode=ro", uri=True)
+        try:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Tenants'").fetchone():
+                return False
+        finally:
+            conn.close()
+        print(f"Tenant DB {db.DB_PATH} has no Tenants table (not initialised?)", file=sys.stderr)
+    else:
+        print(f"Tenant DB {db.DB_PATH} not found", file=sys.stderr)
+    return True
+
+
+def cmd_tenant_get(args):
+    import json
+
+    import db
+
+    if _tenant_db_missing(db):
+        return 1
+    row = db.get_tenant_info(args.flat_number)
+    if row is None:
+        print(f"No tenant for flat {args.flat_number}", file=sys.stderr)
+        return 1
+    print(json.dumps(dict(zip(db.TENANT_COLUMNS, row)), ensure_ascii=False))
+    return 0
+
+
+def cmd_tenant_update(args):
+    import db
+
+    if _tenant_db_missing(db):
+        return 1
+    changed = db.update_tenant_credits_many([(args.flat_number, args.balance, args.active)])
+    if not changed:
+        print(f"No tenant for flat {args.flat_number}", file=sys.stderr)
+        return 1
+    print(f"Flat {args.flat_number}: balance {args.balance}, access {'active' if args.active else 'inactive'}")
+    return 0
+
+
+# ==========================================
+# Parser
+# ==========================================
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sync = commands.add_parser("sync", help="download eKeys, IC cards, passcodes and fingerprints from TTLock")
+    sync.add_argument("--mode", choices=["full", "delta", "stream"], help="default: TTLOCK_SYNC_MODE")
+    sync.add_argument("--locks", help='JSON file or "id=name,id,..." (default: TTLOCK_LOCKS, else every lock)')
+    sync.add_argument("--output", help="registry JSON to write (default: TTLOCK_REGISTRY_FILE)")
+    sync.add_argument("--accounts", help="accounts JSON: sync every building in it into the access DB")
+    sync.add_argument("--processes", type=int, help="worker processes for --accounts (default: TTLOCK_SYNC_PROCESSES)")
+    sync.set_defaults(func=cmd_sync)
+
+    build = commands.add_parser("build-db", help="build financial_data.db and the access DB")
+    build.add_argument("--incremental", action="store_true", help="only ingest new bank CSV rows")
+    build.add_argument("--registry", help="registry JSON / NDJSON to read")
+    build.add_argument("--owners", help="owners CSV")
+    build.add_argument("--transactions", help="bank transactions CSV")
+    build.add_argument("--building", help="only replace this building's part of the access DB")
+    build.set_defaults(func=cmd_build_db)
+
+    records = commands.add_parser("records", help="append new lock records (unlock log) to the records DB")
+    records.add_argument("--locks", help='JSON file or "id=name,id,..." (default: every lock)')
+    records.set_defaults(func=cmd_records)
+
+    report = commands.add_parser("report", help="print who has access to which locks")
+    report.add_argument("--registry", help="read a registry JSON instead of the access DB")
+    report.add_argument("--db", help="access DB (default: building_access_full.db)")
+    report.set_defaults(func=cmd_report)
+
+    block = commands.add_parser("block", help="block debtors / unblock apartments (dry run by default)")
+    block.add_argument("--apply", action="store_true", help="send the changes")
+    block.add_argument("--unblock", nargs="+", metavar="APT_ID", help="unblock these apartments instead")
+    block.add_argument("--min-debt", type=float, default=0.0)
+    block.add_argument("--locks", nargs="+", metavar="LOCK", help="only credentials on these lock ids / names")
+    block.set_defaults(func=cmd_block)
+
+    tenant = commands.add_parser("tenant", help="read or update one tenant in the tenant DB")
+    tenant_commands = tenant.add_subparsers(dest="tenant_command", required=True)
+    get = tenant_commands.add_parser("get", help="print a tenant as JSON (exit 1 if unknown)")
+    get.add_argument("flat_number", type=int)
+    get.set_defaults(func=cmd_tenant_get)
+    update = tenant_commands.add_parser("update", help="set credit balance and access status")
+    update.add_argument("flat_number", type=int)
+    update.add_argument("--balance", type=float, required=True)
+    status = update.add_mutually_exclusive_group(required=True)
+    status.add_argument("--active", dest="active", action="store_true")
+    status.add_argument("--inactive", dest="active", action="store_false")
+    update.set_defaults(func=cmd_tenant_update)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    # Config lives in .env; the modules read it when they are imported
+    from dotenv import load_dotenv
+    load_dotenv()
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,31 @@
-import pandas as pd
 import sqlite3
 import json
 import re
 import os
+from label_parser import default_parser
+from access_db import ACCESS_DB, DEFAULT_BUILDING, replace_building, write_access_db
+from instrumentation import export_metrics, get_logger, metrics
 
 # --- FILE PATHS (Update these if your filenames differ) ---
-JSON_FILE = 'building_access_master.json'
-TRANS_CSV = '/Users/sirbucks/projects/ttlock_gatekeeper/Kavtaradze_Payments/transactions_history_7ecaeb61-3883-4efb-b1f6-cd93c431c553.csv'
-OWNERS_CSV = '2025 გადასახადების მოსაკრებელი.csv'
+# (each can be overridden from the environment / .env)
+JSON_FILE = os.getenv("TTLOCK_REGISTRY_FILE", 'building_access_master.json')
+TRANS_CSV = os.getenv("TTLOCK_TRANS_CSV", '/Users/sirbucks/projects/ttlock_gatekeeper/Kavtaradze_Payments/transactions_history_7ecaeb61-3883-4efb-b1f6-cd93c431c553.csv')
+OWNERS_CSV = os.getenv("TTLOCK_OWNERS_CSV", '2025 გადასახადების მოსაკრებელი.csv')
+# Date column of TRANS_CSV (day-first dates); set it to let the latest payment
+# decide the partner of an apartment (unset = last row in the file wins)
+TRANS_DATE_COL = os.getenv("TTLOCK_TRANS_DATE_COL") or None
+
+# Regex to find "bina X", "apt X", etc. in payment descriptions
+APT_IN_DESCRIPTION = re.compile(r'(?:ბინა|apt|apartment)\s*(\d+)', re.IGNORECASE)
+
+log = get_logger("database")
 
 def clean_apt_id(val):
     """
     Standardizes apartment IDs for joining tables.
     Removes decimal zeros (e.g., '10.0' -> '10') and whitespace.
     """
-    if pd.isna(val): return None
+    if val is None or val != val: return None  # NaN
     s = str(val).strip()
     # Remove .0 if it exists (common in Excel imports)
     if s.endswith('.0'):
@@ -26,49 +37,163 @@ def parse_label(label):
     Splits a JSON label into the base apartment number.
     Example: "02 HL" -> Base: "2", Suffix: "HL"
     Example: "60/64" -> Base: "60/64", Suffix: None
+    The suffix/alias table and the memoized matcher live in label_parser.py.
     """
-    if not label: return "Unknown", None
-    s = str(label).strip()
-            
-    # Extract the base number
-    # regex matches start of string, digits, optional slashes/dots
-    def extract_id(s):
-        
-        for suffix in ["LMD", "CMG", "HL", "cmg", "თელასი", "M", "m", "Mars", "მარსი"]:
-            if suffix in s:
-                # s = s.replace(suffix, "").strip()
-                return suffix # Want to make this the name of the apartment (use for offices)
-                 
-
-        # First, try to match a range: "14 - 69", "100-200", etc.
-        # range_match = re.search(r'^(\d+\s*[-–]\s*\d+)', s)
-        # if range_match:
-        #     return range_match.group(1)  # Keep as-is; e.g., "14 - 69"
-
-        # Otherwise, try a single number (with possible /, like before)
-        single_match = re.search(r'^(\d+[\/\d]*)', s)
-        if single_match:
-            base = single_match.group(1)
-            # Only normalize if it's a plain number (no slashes)
-            if '/' not in base and base.isdigit():
-                return str(int(base))  # Remove leading zeros
-            else:
-                return base  # e.g., "01/02"
-
-        return None  # No match
-
-    s = extract_id(s)
-    if s is None:
-        print(f"Term did not match any pattern: {label}")
-    return s
+    return default_parser.parse(label)
 
-def create_databases():
-    print("Loading files...")
-    
-    # 1. LOAD OWNERS DATA
-    # Skip the first row if it's just a title, assuming headers are on row 2
-    df_owners_raw = pd.read_csv(OWNERS_CSV, skiprows=1)
+def build_apt_partner_map(df_trans, date_col=None):
+    """
+    Finds "bina X", "apt X", etc. in every transaction Description and maps
+    the apartment number to that row's Partner's Name.
+
+    Vectorized: one str.extract over the whole column instead of a regex per
+    row. When several payments mention the same apartment the last one wins:
+    file order by default, or the latest `date_col` if given (rows with no
+    parseable date lose to dated ones).
+    """
+    latest = apt_partner_rows(df_trans, date_col)
+    return dict(zip(latest['apt_num'], latest['partner']))
+
+def apt_partner_rows(df_trans, date_col=None):
+    """
+    The rows build_apt_partner_map picks, one per apartment: a DataFrame
+    indexed like df_trans with apt_num, partner and date (the parsed
+    `date_col`, NaT without one).
+    """
+    import pandas as pd
+
+    if "Partner's Name" not in df_trans.columns:
+        return pd.DataFrame({'apt_num': [], 'partner': [], 'date': pd.Series([], dtype='datetime64[ns]')})
+    partners = df_trans["Partner's Name"]
+    if 'Description' in df_trans.columns:
+        desc = df_trans['Description'].astype(str)
+    else:
+        desc = pd.Series('', index=df_trans.index)
+
+    has_partner = partners.notna()
+    apt_raw = desc[has_partner].str.extract(APT_IN_DESCRIPTION, expand=False)
+    matched = apt_raw.notna()
+    apt_raw = apt_raw[matched]
+    found = pd.DataFrame({'apt_raw': apt_raw, 'partner': partners[has_partner][matched],
+                          'date': pd.Series(pd.NaT, index=apt_raw.index, dtype='datetime64[ns]')})
+
+    if date_col is not None and date_col in df_trans.columns:
+        found['date'] = pd.to_datetime(df_trans.loc[found.index, date_col], errors='coerce', dayfirst=True)
+        # Stable sort keeps file order between payments on the same date
+        found = found.sort_values('date', kind='mergesort', na_position='first')
+
+    # Normalize '02' -> '2' (once per distinct number, not per row)
+    found['apt_num'] = found['apt_raw'].map({v: str(int(v)) for v in found['apt_raw'].unique()})
+    return found.drop_duplicates('apt_num', keep='last')[['apt_num', 'partner', 'date']]
+
+def payer_rows(df_trans):
+    """
+    (Partner's Name, apartment or None) for every distinct payer, the
+    apartment being the last one its payment descriptions mention.
+    Vectorized like build_apt_partner_map; feeds identity.resolve.
+    """
+    import pandas as pd
+
+    if "Partner's Name" not in df_trans.columns:
+        return []
+    partners = df_trans["Partner's Name"]
+    if 'Description' in df_trans.columns:
+        desc = df_trans['Description'].astype(str)
+    else:
+        desc = pd.Series('', index=df_trans.index)
+
+    has_partner = partners.notna()
+    apt_raw = desc[has_partner].str.extract(APT_IN_DESCRIPTION, expand=False)
+    found = pd.DataFrame({'partner': partners[has_partner],
+                          'apt_num': apt_raw.map({v: str(int(v)) for v in apt_raw.dropna().unique()})})
+    with_apt = found.dropna(subset=['apt_num']).drop_duplicates('partner', keep='last')
+    apt_of = dict(zip(with_apt['partner'], with_apt['apt_num']))
+    return [(partner, apt_of.get(partner)) for partner in found['partner'].unique()]
+
+def iter_ndjson_records(path):
+    """
+    Streams the records written by export_access_ndjson, one dict per line.
+    Safe to call while the sync is still writing: a half-written last line is skipped.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+def iter_access_items(path):
+    """
+    Yields (category, label, item) for every credential in `path`.
+    Accepts the registry JSON ({"ekeys": {...}, "cards": {...}}) or the
+    streamed '.ndjson' export, so callers don't care which one they get.
+    """
+    if path.endswith('.ndjson'):
+        for rec in iter_ndjson_records(path):
+            # Only eKeys and cards go into the access DB
+            category = {'ekey': 'ekeys', 'card': 'cards'}.get(rec.get('kind'))
+            if category:
+                yield category, rec.get('person'), rec
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        json_data = json.load(f)
+    yield from iter_registry_items(json_data)
+
+def iter_registry_items(registry):
+    """Yields (category, label, item) for every credential in an in-memory registry dict."""
+    for category in ['ekeys', 'cards']:
+        for label, items in registry.get(category, {}).items():
+            for item in items:
+                yield category, label, item
+
+def access_rows(items):
+    """
+    (category, label, item) triples -> the row lists write_access_db takes:
+    (person_rows, locks, ekeys, cards). Labels are parsed to apartments once each.
+    """
+    import pandas as pd
+
+    persons = {}   # label -> person_id
+    locks = {}     # lock_id -> lock name
+    ekeys, cards = [], []
     
+    with metrics.span("read_registry"):
+        for category, label, item in items:
+            person_id = persons.setdefault(label, len(persons) + 1)
+            lock_id = item.get("lockId")
+            if lock_id is not None and locks.get(lock_id) is None:
+                locks[lock_id] = item.get("lockName")
+        
+            if category == 'ekeys':
+                ekeys.append((item.get('keyId'), person_id, lock_id, item.get('username'), item.get('status')))
+            elif category == "cards":
+                cards.append((item.get("cardId"), person_id, lock_id, item.get('cardNumber'),
+                              item.get("startDate"), item.get("endDate"), item.get("createDate")))
+
+    # Parse labels to get apt IDs (each distinct label once)
+    with metrics.span("parse_labels"):
+        labels = pd.Series(list(persons), dtype=object)
+        apt_ids = default_parser.parse_series(labels) if len(labels) else labels
+        person_rows = [
+            # parse_label returns ("Unknown", None) for empty labels -> no apartment
+            (person_id, label, apt_id if isinstance(apt_id, str) else None)
+            for (label, person_id), apt_id in zip(persons.items(), apt_ids)
+        ]
+    return person_rows, locks, ekeys, cards
+
+def load_owners_csv(path=OWNERS_CSV):
+    """
+    The owners CSV (title row first, headers on row 2) as a DataFrame with
+    owner_name, apt_id, monthly_fee and debt (whichever the file has),
+    apt_id cleaned for joining and rows without one dropped.
+    """
+    import pandas as pd
+
+    df_owners_raw = pd.read_csv(path, skiprows=1)
+
     # Select and rename specified columns
     cols_map = {
         'მესაკუთრეები:': 'owner_name',
@@ -76,97 +201,125 @@ def create_databases():
         'მოსაკრებელი თვეში': 'monthly_fee',
         'ყოველთვიური მოსაკრებლის დავალიანება': 'debt'
     }
-    
+
     # Filter only columns that exist
     available_cols = [c for c in cols_map.keys() if c in df_owners_raw.columns]
     df_owners = df_owners_raw[available_cols].copy()
     df_owners.rename(columns=cols_map, inplace=True)
-    
+
     # Clean apt_id for joining
     df_owners['apt_id'] = df_owners['apt_id'].apply(clean_apt_id)
-    df_owners = df_owners.dropna(subset=['apt_id'])
+    return df_owners.dropna(subset=['apt_id'])
 
-    # 2. LOAD TRANSACTIONS (To find Payment Partners)
-    df_trans = pd.read_csv(TRANS_CSV, skiprows=1)
-    
-    # Logic: Find "Apartment X" in description -> Map to "Partner's Name"
-    apt_partner_map = {}
+def write_owners_status(df_owners, building_id=DEFAULT_BUILDING, db_path='financial_data.db'):
+    """
+    Replaces `building_id`'s rows of owners_financial_status, keeping every
+    other building's (a table from before buildings counts as DEFAULT_BUILDING).
+    """
+    import pandas as pd
+
+    conn = sqlite3.connect(db_path)
+    try:
+        df = df_owners.assign(building_id=building_id)
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'owners_financial_status'"
+        ).fetchone()
+        if exists:
+            # A few hundred rows per building: rewriting the table is simpler than migrating it
+            old = pd.read_sql_query("SELECT * FROM owners_financial_status", conn)
+            if 'building_id' not in old.columns:
+                old['building_id'] = DEFAULT_BUILDING
+            df = pd.concat([old[old['building_id'] != building_id], df], ignore_index=True)
+        df.to_sql('owners_financial_status', conn, index=False, if_exists='replace')
+    finally:
+        conn.close()
+
+def create_databases(incremental=False, building_id=None):
+    """
+    Builds financial_data.db and building_access_full.db.
+    With incremental=True the bank CSV is not re-read: only rows appended
+    since the last run are ingested (see transactions_ingest.py).
+    Only one building's partition of the access DB is replaced, `building_id`
+    or DEFAULT_BUILDING (see multi_sync.py): other buildings in the file are
+    kept. The file is only built from scratch when there is none yet.
+    Labels and payers without an apartment number are matched to owners by
+    name (identity.py); the identities table it keeps supplies their
+    apartments and the payment partners no description names.
+    """
+    # Loaded here so importing this module (e.g. for iter_access_items) stays cheap
+    import pandas as pd
+
+    log.info("Loading files...")
     
-    for _, row in df_trans.iterrows():
-        desc = str(row.get('Description', ''))
-        partner = row.get("Partner's Name")
-        
-        if pd.isna(partner): continue
+    # 1. LOAD OWNERS DATA
+    # Skip the first row if it's just a title, assuming headers are on row 2
+    with metrics.span("load_owners"):
+        df_owners = load_owners_csv(OWNERS_CSV)
+
+    # 2. LOAD TRANSACTIONS (To find Payment Partners)
+    with metrics.span("load_transactions"):
+        if incremental:
+            # Checkpointed: parse only the new rows, partner map kept in financial_data.db
+            from transactions_ingest import ingest_transactions, load_apt_partner_map, load_payer_rows
+            ingest_transactions(TRANS_CSV, skiprows=1, date_col=TRANS_DATE_COL)
+            apt_partner_map = load_apt_partner_map()
+            payers = load_payer_rows()
+        else:
+            df_trans = pd.read_csv(TRANS_CSV, skiprows=1)
         
-        # Regex to find "bina X", "apt X", etc.
-        match = re.search(r'(?:ბინა|apt|apartment)\s*(\d+)', desc, re.IGNORECASE)
-        if match:
-            apt_num = str(int(match.group(1))) # Normalize '02' -> '2'
-            # Store/Update the partner for this apartment
-            apt_partner_map[apt_num] = partner
+            # Logic: Find "Apartment X" in description -> Map to "Partner's Name"
+            apt_partner_map = build_apt_partner_map(df_trans, date_col=TRANS_DATE_COL)
+            payers = payer_rows(df_trans)
+
+    # Iterate through ekeys and cards (registry JSON or streamed NDJSON)
+    person_rows, locks, ekeys, cards = access_rows(iter_access_items(JSON_FILE))
+
+    # 3. RESOLVE IDENTITIES (labels / owners / payers without an apartment, matched by name)
+    from identity import identity_map, resolve_identities
+    building = building_id or DEFAULT_BUILDING
+    with metrics.span("resolve_identities"):
+        owner_names = df_owners['owner_name'] if 'owner_name' in df_owners.columns else []
+        resolve_identities(
+            [(label, apt) for _, label, apt in person_rows],
+            list(zip(owner_names, df_owners['apt_id'])),
+            payers,
+            building_id=building,
+        )
+        label_apts = identity_map("label", building)
+        person_rows = [(pid, label, label_apts.get(label, apt)) for pid, label, apt in person_rows]
+        # Payers found by name cover apartments no payment description mentions
+        for partner, apt in identity_map("payer", building).items():
+            apt_partner_map.setdefault(apt, partner)
 
     # Map payment partners to the owners dataframe
     df_owners['payment_partner'] = df_owners['apt_id'].map(apt_partner_map)
 
-    # 3. CREATE OWNER DATABASE (Lite SQL DB 1)
-    print("Creating 'financial_data.db'...")
-    conn_fin = sqlite3.connect('financial_data.db')
-    df_owners.to_sql('owners_financial_status', conn_fin, index=False, if_exists='replace')
-    conn_fin.close()
+    # 4. CREATE OWNER DATABASE (Lite SQL DB 1), this building's rows only
+    log.info("Creating 'financial_data.db'...")
+    with metrics.span("write_financial_db"):
+        write_owners_status(df_owners, building)
 
-    # 4. PROCESS JSON & JOIN (Lite SQL DB 2)
-    with open(JSON_FILE, 'r', encoding='utf-8') as f:
-        json_data = json.load(f)
+    # 5. NORMALIZED ACCESS DB (Lite SQL DB 2)
+    # Owners are joined to credentials on 'apt_id' by the access_with_owners view.
+    # The credentials are as of the registry file's last write.
+    synced_at = int(os.path.getmtime(JSON_FILE) * 1000)
+    if os.path.exists(ACCESS_DB):
+        log.info(f"Updating building '{building}' in '{ACCESS_DB}'...")
+        with metrics.span("write_access_db"):
+            replace_building(building, person_rows, locks, ekeys, cards, df_owners, ACCESS_DB, synced_at=synced_at)
+    else:
+        log.info(f"Creating '{ACCESS_DB}'...")
+        with metrics.span("write_access_db"):
+            write_access_db(person_rows, locks, ekeys, cards, df_owners, ACCESS_DB, building_id=building,
+                            synced_at=synced_at)
 
-    access_rows = []
-    
-    # Iterate through ekeys and cards
-    for category in ['ekeys', 'cards']:
-        data_dict = json_data.get(category, {})
-        for label, items in data_dict.items():
-            # Parse label to get apt ID
-            base_apt  = parse_label(label)
-            
-            for item in items:
-                if category == 'ekeys':
-                    access_rows.append({
-                        'apt_id': base_apt,
-                        'original_label': label,
-                        'type': 'ekey',
-                        'username': item.get('username'),
-                        'key_id': item.get('keyId'),
-                        'status': item.get('status')
-                    })
-                elif category == "cards":
-                    access_rows.append({
-                        'apt_id': base_apt,
-                        'original_label': label,
-                        'type': 'card',
-                        'lockId': item.get("lockId"),
-                        'cardNumber': item.get('cardNumber'),
-                        'startDate': item.get("startDate"),
-                        'endDate': item.get("endDate"),
-                        'createDate': item.get("createDate")
-                    })
-                    
-
-    df_access = pd.DataFrame(access_rows)
-
-    # Merge Access Data with Owner Data
-    # matching 'apt_id' from Access list to 'apt_id' from Owners list
-    df_final = df_access.merge(df_owners, on='apt_id', how='left')
-
-    print("Creating 'building_access_full.db'...")
-    conn_acc = sqlite3.connect('building_access_full.db')
-    
-    # Save the main joined table
-    df_final.to_sql('access_with_owners', conn_acc, index=False, if_exists='replace')
-    
-    conn_acc.close()
-    
-    print("\nProcess Complete!")
-    print(f"- 'financial_data.db' created with {len(df_owners)} owner records.")
-    print(f"- 'building_access_full.db' created with {len(df_final)} access records joined with owner info.")
+    log.info("Process Complete!")
+    log.info(f"'financial_data.db' updated with {len(df_owners)} owner records.")
+    log.info(f"Building '{building}' in '{ACCESS_DB}': {len(ekeys)} eKeys, {len(cards)} cards and "
+             f"{len(person_rows)} persons.")
 
 if __name__ == "__main__":
-    create_databases()
\ No newline at end of file
+    import sys
+    with metrics.span("create_databases"):
+        create_databases(incremental="--incremental" in sys.argv)
+    export_metrics()
\ No newline at end of file
@@ -1,64 +1,194 @@
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
 
-DB_PATH = 'access_control.db'
+DB_PATH = os.getenv("TTLOCK_TENANT_DB", 'access_control.db')
+
+# Applied to every new connection. WAL lets readers run while a write is in
+# progress; synchronous=NORMAL is safe with WAL and fsyncs only at checkpoints.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",  # ~16 MB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+class ConnectionManager:
+    """
+    Hands out one long-lived SQLite connection per thread.
+
+    Connections are opened on first use and reused by every later call on
+    the same thread, so a FastAPI worker's threadpool never shares a
+    connection between threads and never pays connect/PRAGMA setup per query.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Commits on success, rolls back on error (one fsync per block)."""
+        conn = self.connection()
+        with conn:
+            yield conn
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_manager() -> ConnectionManager:
+    """The connection manager for the current DB_PATH."""
+    with _managers_lock:
+        if DB_PATH not in _managers:
+            _managers[DB_PATH] = ConnectionManager(DB_PATH)
+        return _managers[DB_PATH]
+
+def close_connections():
+    """Close every pooled connection (call on shutdown)."""
+    with _managers_lock:
+        for manager in _managers.values():
+            manager.close_all()
+        _managers.clear()
+
+TENANT_COLUMNS = (
+    "flat_number",
+    "ttlock_lock_id",
+    "tenant_email",
+    "monthly_fee",
+    "current_credit_balance",
+    "is_access_active",
+)
+
+TENANTS_DDL = """
+    CREATE TABLE IF NOT EXISTS Tenants (
+        flat_number INTEGER PRIMARY KEY,
+        ttlock_lock_id INTEGER NOT NULL,
+        tenant_email TEXT NOT NULL,
+        monthly_fee REAL NOT NULL,
+        current_credit_balance REAL DEFAULT 0.0,
+        is_access_active BOOLEAN DEFAULT 0
+    )
+"""
+
+def _repair_tenants_schema(conn):
+    """
+    Older imports used to_sql(if_exists='replace'), which swapped Tenants for
+    an untyped table without the flat_number primary key. Rebuild it with the
+    declared schema, keeping the rows.
+    """
+    info = conn.execute("PRAGMA table_info(Tenants)").fetchall()
+    if not info or any(name == "flat_number" and pk for _, name, _, _, _, pk in info):
+        return
+    print("Tenants table lost its schema, rebuilding it...")
+    old_cols = [name for _, name, *_ in info if name in TENANT_COLUMNS]
+    cols = ", ".join(old_cols)
+    conn.execute("ALTER TABLE Tenants RENAME TO Tenants_old")
+    conn.execute(TENANTS_DDL)
+    conn.execute(f"INSERT OR REPLACE INTO Tenants ({cols}) SELECT {cols} FROM Tenants_old")
+    conn.execute("DROP TABLE Tenants_old")
 
 def initialize_db():
-    """Create the Tenants table if it doesn't exist."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS Tenants (
-            flat_number INTEGER PRIMARY KEY,
-            ttlock_lock_id INTEGER NOT NULL,
-            tenant_email TEXT NOT NULL,
-            monthly_fee REAL NOT NULL,
-            current_credit_balance REAL DEFAULT 0.0,
-            is_access_active BOOLEAN DEFAULT 0
-        )
-    """)
+    """Create the Tenants table (and its indexes) if it doesn't exist."""
+    with get_manager().transaction() as conn:
+        _repair_tenants_schema(conn)
+        conn.execute(TENANTS_DDL)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tenants_lock ON Tenants (ttlock_lock_id)")
     # Note: We skip the Transactions table for the MVP speed.
-    conn.commit()
-    conn.close()
 
-def import_initial_data(data_file_path='initial_tenant_data.csv'):
-    """Import the required data from the static CSV file into the DB."""
+def _sql_value(v):
+    """pandas/numpy cell -> plain Python value sqlite3 can bind."""
+    if v is None or v != v:  # NaN
+        return None
+    return v.item() if hasattr(v, "item") else v
+
+def import_initial_data(data_file_path='initial_tenant_data.csv', chunksize=5000):
+    """
+    Import the tenant CSV into the DB without touching the table's schema.
+
+    The file is read in chunks and every row is UPSERTed on flat_number; a
+    row that already exists is only rewritten if one of its values changed.
+    Returns the number of tenants inserted or updated.
+    """
     import pandas as pd
     
     # Run initialize_db() first
     initialize_db()
     
     try:
-        df = pd.read_csv(data_file_path)
-        conn = sqlite3.connect(DB_PATH)
-        
-        # Write the data frame to the Tenants table
-        # If a record with the same flat_number exists, it will replace it (if_exists='replace')
-        df.to_sql('Tenants', conn, if_exists='replace', index=False)
-        conn.close()
-        print(f"Successfully loaded {len(df)} tenants into the database.")
+        reader = pd.read_csv(data_file_path, chunksize=chunksize)
+        conn = get_manager().connection()
+        changed_before = conn.total_changes
+        total = 0
+
+        with get_manager().transaction() as conn:
+            for chunk in reader:
+                cols = [c for c in TENANT_COLUMNS if c in chunk.columns]
+                if "flat_number" not in cols:
+                    raise ValueError(f"{data_file_path} has no flat_number column")
+                updates = [c for c in cols if c != "flat_number"]
+                set_clause = ", ".join(f"{c} = excluded.{c}" for c in updates)
+                changed = " OR ".join(f"Tenants.{c} IS NOT excluded.{c}" for c in updates)
+                conflict = f"DO UPDATE SET {set_clause} WHERE {changed}" if updates else "DO NOTHING"
+
+                conn.executemany(
+                    f"INSERT INTO Tenants ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+                    f"ON CONFLICT(flat_number) {conflict}",
+                    [tuple(_sql_value(v) for v in row) for row in chunk[cols].itertuples(index=False, name=None)],
+                )
+                total += len(chunk)
+
+        touched = conn.total_changes - changed_before
+        print(f"Successfully loaded {total} tenants into the database ({touched} inserted or changed).")
+        return touched
     except FileNotFoundError:
         print("Initial data file not found. Database table created but empty.")
+        return 0
 
 def get_tenant_info(flat_number: int):
     """Retrieve all data for a single flat."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    c = get_manager().connection().cursor()
     c.execute("SELECT * FROM Tenants WHERE flat_number=?", (flat_number,))
     # In a real app, you would parse the result row into a Pydantic Model
-    result = c.fetchone()
-    conn.close()
-    return result
+    return c.fetchone()
 
 def update_tenant_credit(flat_number: int, new_balance: float, access_status: bool):
     """Update the tenant's credit and access status."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        UPDATE Tenants 
-        SET current_credit_balance = ?, is_access_active = ? 
-        WHERE flat_number = ?
-    """, (new_balance, access_status, flat_number))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    update_tenant_credits_many([(flat_number, new_balance, access_status)])
+
+def update_tenant_credits_many(updates):
+    """
+    Update credit and access status for many flats in one transaction.
+    `updates` is an iterable of (flat_number, new_balance, access_status).
+    Returns the number of rows changed.
+    """
+    with get_manager().transaction() as conn:
+        cur = conn.executemany("""
+            UPDATE Tenants
+            SET current_credit_balance = ?, is_access_active = ?
+            WHERE flat_number = ?
+        """, ((balance, status, flat) for flat, balance, status in updates))
+        return cur.rowcount
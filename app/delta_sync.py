@@ -0,0 +1,269 @@
+"""
+Incremental (delta) sync against a SQLite snapshot of every credential.
+
+Each credential list is probed with its first page only; when that page's
+fingerprint (the API's total, the newest creation date, a digest of the
+page) matches the stored one, the rest of the list is taken from the
+snapshot instead of being downloaded.
+
+What the probe can miss: a change on page 2 or later that leaves the
+total and the newest date alone, i.e. a key frozen or renamed, a card
+period changed, or one credential deleted and an older-dated one
+restored, further down a long list. To bound that, every list is read in
+full at least once per DELTA_FULL_TTL seconds whatever its fingerprint
+says, and force=True reads everything now. Lists that fit on one page
+are always complete.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from pager import PageSpec, fetch_page, paginate
+from ttlock_api_GET import (CREDENTIAL_SPECS, SYNC_CONCURRENCY, SYNC_KINDS, _count_page,
+                            credential_specs, get_client)
+from ttlock_client import TTLockClient
+from instrumentation import get_logger, metrics
+
+# --- Configuration ---
+SNAPSHOT_DB = os.getenv("TTLOCK_SNAPSHOT_DB", "credential_snapshot.db")
+# A list unchanged on page 1 is still read in full once it was last read
+# in full this many seconds ago (0 = every run, like a full sync)
+DELTA_FULL_TTL = float(os.getenv("TTLOCK_DELTA_FULL_TTL", "86400"))
+# ---------------------
+
+log = get_logger("delta")
+
+def open_snapshot(db_path=SNAPSHOT_DB):
+    """Opens (and creates if needed) the credential snapshot database."""
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS credentials (
+            kind TEXT NOT NULL,
+            cred_id INTEGER NOT NULL,
+            lock_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            person TEXT,
+            record TEXT NOT NULL,
+            PRIMARY KEY (kind, cred_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_credentials_lock ON credentials (lock_id, kind, seq);
+
+        CREATE TABLE IF NOT EXISTS lock_fingerprints (
+            lock_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            total INTEGER,
+            max_date INTEGER,
+            digest TEXT,
+            full_at INTEGER,          -- epoch ms of the last time the whole list was read
+            PRIMARY KEY (lock_id, kind)
+        );
+    """)
+    if "full_at" not in {name for _, name, *_ in conn.execute("PRAGMA table_info(lock_fingerprints)")}:
+        # Snapshots from before full_at: every list counts as due for a full read
+        conn.execute("ALTER TABLE lock_fingerprints ADD COLUMN full_at INTEGER")
+    return conn
+
+
+def fingerprint(first_page: dict, date_field: str) -> dict:
+    """
+    Cheap summary of a lock's credential list, taken from page 1 only:
+    the API's `total`, the newest creation date on the page and a digest of
+    the page's items (so a status change on page 1 is also noticed).
+    Changes further down that keep all three are invisible to it; see the
+    module docstring.
+    """
+    items = first_page.get("list", [])
+    dates = [i.get(date_field) or 0 for i in items]
+    digest = hashlib.sha1(
+        json.dumps(items, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return {"total": first_page.get("total"), "max_date": max(dates, default=None), "digest": digest}
+
+
+def load_state(conn):
+    """
+    Reads the whole snapshot.
+    Returns ({(lock_id, kind): fingerprint}, {(lock_id, kind): {cred_id: (person, record)}}).
+    """
+    fingerprints = {
+        (lock_id, kind): {"total": total, "max_date": max_date, "digest": digest, "full_at": full_at}
+        for lock_id, kind, total, max_date, digest, full_at in conn.execute(
+            "SELECT lock_id, kind, total, max_date, digest, full_at FROM lock_fingerprints"
+        )
+    }
+    stored = {}
+    for kind, cred_id, lock_id, person, record in conn.execute(
+        "SELECT kind, cred_id, lock_id, person, record FROM credentials ORDER BY lock_id, kind, seq"
+    ):
+        stored.setdefault((lock_id, kind), {})[cred_id] = (person, json.loads(record))
+    return fingerprints, stored
+
+
+def diff_records(kind: str, lock_id, old: dict, new: dict) -> dict:
+    """Compares {cred_id: (person, record)} maps for one lock and credential type."""
+    changes = {"added": [], "removed": [], "modified": []}
+    for cred_id, (person, record) in new.items():
+        if cred_id not in old:
+            changes["added"].append(
+                {"kind": kind, "id": cred_id, "lockId": lock_id, "person": person, "record": record}
+            )
+            continue
+        old_person, old_record = old[cred_id]
+        fields = {
+            f: [old_record.get(f), record.get(f)]
+            for f in set(old_record) | set(record)
+            if old_record.get(f) != record.get(f)
+        }
+        if old_person != person:
+            fields["person"] = [old_person, person]
+        if fields:
+            changes["modified"].append(
+                {"kind": kind, "id": cred_id, "lockId": lock_id, "person": person, "changes": fields}
+            )
+    for cred_id, (person, _) in old.items():
+        if cred_id not in new:
+            changes["removed"].append({"kind": kind, "id": cred_id, "lockId": lock_id, "person": person})
+    return changes
+
+
+def _full_read_due(old_fp, now: int, full_ttl: float) -> bool:
+    """True if the list hasn't been read in full for `full_ttl` seconds (or ever)."""
+    full_at = (old_fp or {}).get("full_at")
+    return full_at is None or now - full_at >= full_ttl * 1000
+
+
+async def _sync_stream(client, sem, lock_id, lock_name, spec: PageSpec, old_fp, force,
+                       now: int, full_ttl: float = DELTA_FULL_TTL):
+    """
+    Probes page 1 of one credential stream for one lock.
+    Returns (fingerprint, raw items) or (fingerprint, None) if the lock is
+    unchanged. fingerprint["full_at"] is `now` whenever the whole list was read.
+    """
+    async with sem:
+        first_page = await fetch_page(client, spec, lock_id, 1)
+
+    fp = fingerprint(first_page, spec.date_field)
+    items = first_page.get("list", [])
+    _count_page(spec.kind, items)
+    if spec.stop(items, first_page, 1, spec.page_size):
+        # Page 1 is the whole list -> nothing more to fetch, diff it directly
+        return dict(fp, full_at=now), items
+    unchanged = old_fp is not None and all(old_fp.get(k) == v for k, v in fp.items())
+    if not force and unchanged:
+        if not _full_read_due(old_fp, now, full_ttl):
+            log.debug(f"{lock_name}: {spec.kind} unchanged, skipping remaining pages")
+            metrics.inc("delta_streams_skipped_total", kind=spec.kind)
+            return dict(fp, full_at=old_fp["full_at"]), None
+        log.debug(f"{lock_name}: {spec.kind} unchanged on page 1, full read due")
+        metrics.inc("delta_streams_full_reads_total", kind=spec.kind)
+
+    rest = await paginate(client, sem, spec, lock_id, lock_name, start_page=2)
+    return dict(fp, full_at=now), items + rest
+
+
+async def sync_access_delta(locks: list, db_path=SNAPSHOT_DB, concurrency: int = SYNC_CONCURRENCY,
+                            client: TTLockClient | None = None, force: bool = False,
+                            kinds=SYNC_KINDS, full_ttl: float = DELTA_FULL_TTL, complete: bool = False):
+    """
+    Incremental version of sync_access_IC_ekey.
+
+    For every lock and credential type in `kinds`, page 1 is fetched and fingerprinted.
+    If the fingerprint matches the stored one the remaining pages are skipped
+    and the stored credentials are reused; otherwise the list is fetched in
+    full and diffed against the snapshot (keyed by keyId / cardId / ...).
+    A list not read in full for `full_ttl` seconds is fetched in full anyway
+    (changes past page 1 can hide from the fingerprint), and force=True
+    fetches every list in full.
+    complete=True says `locks` is the account's whole lock list: the stored
+    credentials of a lock no longer in it are reported as removed and
+    dropped from the snapshot. Leave it False for a chosen subset of locks.
+
+    Returns (master_registry, changes). The registry has the same shape and
+    order as a full sync; `changes` lists only what was added, removed or
+    modified since the last run, plus a few counters under "stats".
+    """
+    client = client or get_client()
+    sem = asyncio.Semaphore(max(1, int(concurrency)))
+    specs = credential_specs(kinds)
+    now = int(time.time() * 1000)
+    conn = open_snapshot(db_path)
+    try:
+        old_fps, stored = load_state(conn)
+
+        async def fetch_lock(lock):
+            lock_id = lock.get('lockId') or lock.get('id')
+            lock_name = lock.get('lockAlias') or lock.get('name')
+            results = await asyncio.gather(*(
+                _sync_stream(client, sem, lock_id, lock_name, spec, old_fps.get((lock_id, spec.kind)),
+                             force, now, full_ttl)
+                for spec in specs
+            ))
+            return lock_id, lock_name, {spec.kind: result for spec, result in zip(specs, results)}
+
+        with metrics.span("delta_fetch"):
+            fetched = await asyncio.gather(*(fetch_lock(lock) for lock in locks))
+
+        master_registry = {spec.kind: {} for spec in specs}
+        changes = {"added": [], "removed": [], "modified": []}
+        skipped = 0
+        with conn:
+            for lock_id, lock_name, per_kind in fetched:
+                for kind, (fp, items) in per_kind.items():
+                    spec = CREDENTIAL_SPECS[kind]
+                    old = stored.get((lock_id, kind), {})
+                    if items is None:
+                        skipped += 1
+                        current = old
+                    else:
+                        current = {}
+                        for item in items:
+                            person, record = spec.record(item, lock_name)
+                            current[item.get(spec.id_field)] = (person, record)
+
+                        delta = diff_records(kind, lock_id, old, current)
+                        for key in changes:
+                            changes[key].extend(delta[key])
+                        if any(delta.values()):
+                            conn.execute("DELETE FROM credentials WHERE lock_id = ? AND kind = ?", (lock_id, kind))
+                            conn.executemany(
+                                "INSERT OR REPLACE INTO credentials (kind, cred_id, lock_id, seq, person, record) "
+                                "VALUES (?, ?, ?, ?, ?, ?)",
+                                [
+                                    (kind, cred_id, lock_id, seq, person, json.dumps(record, ensure_ascii=False))
+                                    for seq, (cred_id, (person, record)) in enumerate(current.items())
+                                ],
+                            )
+                        conn.execute(
+                            "INSERT OR REPLACE INTO lock_fingerprints (lock_id, kind, total, max_date, digest, full_at) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (lock_id, kind, fp["total"], fp["max_date"], fp["digest"], fp["full_at"]),
+                        )
+
+                    for person, record in current.values():
+                        master_registry[kind].setdefault(person, []).append(record)
+
+            if complete:
+                # Locks that left the account take their credentials with them
+                current_locks = {lock_id for lock_id, _, _ in fetched}
+                for lock_id, kind in sorted(set(stored) | set(old_fps)):
+                    if lock_id in current_locks or kind not in master_registry:
+                        continue
+                    gone = diff_records(kind, lock_id, stored.get((lock_id, kind), {}), {})
+                    changes["removed"].extend(gone["removed"])
+                    conn.execute("DELETE FROM credentials WHERE lock_id = ? AND kind = ?", (lock_id, kind))
+                    conn.execute("DELETE FROM lock_fingerprints WHERE lock_id = ? AND kind = ?", (lock_id, kind))
+    finally:
+        conn.close()
+
+    changes["stats"] = {
+        "locks": len(locks),
+        "streams_skipped": skipped,
+        "added": len(changes["added"]),
+        "removed": len(changes["removed"]),
+        "modified": len(changes["modified"]),
+    }
+    log.info("Delta sync done", extra={"fields": changes["stats"]})
+    return master_registry, changes
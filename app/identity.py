@@ -0,0 +1,299 @@
+"""
+Identity resolution between registry labels, owners and bank payers.
+
+Three sources name the same people differently: keyName / cardName labels
+in the registry, owner_name in the owners CSV (Georgian) and "Partner's
+Name" in the bank CSV (usually Latin capitals, in either name order).
+The apartment number was the only link, so a label without one ("Term
+did not match any pattern") or a payment whose description names no
+apartment fell out of the join.
+
+Names are normalized first: Georgian is transliterated to Latin, case,
+accents, digits and noise words are dropped, and the words are sorted,
+so "ბერიძე ნინო" and "NINO BERIDZE" both become "beridze nino". Owners and
+payers whose apartment is known go into a NameIndex, a character trigram
+blocking index. A name is only scored (Dice similarity of the two trigram
+sets) against names sharing trigram blocks with it, best bound first, and
+scoring stops once no candidate left can beat the best match, so matching
+costs a few small blocks per name instead of n x m comparisons.
+Trigrams found in more than MAX_BLOCK_SIZE names (surname endings such as
+"dze" and "shvili") are too common to block on and are skipped.
+
+The result is the `identities` table in IDENTITY_DB: one row per distinct
+name per source, with the apartment it resolved to and how
+(label / csv / description / name / ambiguous / manual). create_databases
+reads it back to fill in missing apartments. To pin a link by hand, set
+method = 'manual' and apt_id on the row; manual rows survive every
+later run.
+"""
+import os
+import re
+import sqlite3
+import unicodedata
+from collections import Counter
+from itertools import chain
+
+from access_db import DEFAULT_BUILDING
+from instrumentation import get_logger, metrics
+
+# --- Configuration ---
+IDENTITY_DB = os.getenv("TTLOCK_IDENTITY_DB", "financial_data.db")
+# Lowest similarity (0..1, Dice over character trigrams) that links two names
+MATCH_THRESHOLD = float(os.getenv("TTLOCK_IDENTITY_THRESHOLD", "0.6"))
+NGRAM = 3
+# Trigrams shared by more names than this are too common to block on
+MAX_BLOCK_SIZE = int(os.getenv("TTLOCK_IDENTITY_MAX_BLOCK", "200"))
+# ---------------------
+
+log = get_logger("identity")
+
+# Mkhedruli -> Latin the way Georgian banks print names (national
+# romanization without the ejective apostrophes)
+GEORGIAN_TO_LATIN = str.maketrans({
+    "ა": "a", "ბ": "b", "გ": "g", "დ": "d", "ე": "e", "ვ": "v", "ზ": "z", "თ": "t",
+    "ი": "i", "კ": "k", "ლ": "l", "მ": "m", "ნ": "n", "ო": "o", "პ": "p", "ჟ": "zh",
+    "რ": "r", "ს": "s", "ტ": "t", "უ": "u", "ფ": "p", "ქ": "k", "ღ": "gh", "ყ": "q",
+    "შ": "sh", "ჩ": "ch", "ც": "ts", "ძ": "dz", "წ": "ts", "ჭ": "ch", "ხ": "kh", "ჯ": "j",
+    "ჰ": "h",
+})
+
+# Words around names in labels and payment lines that say nothing about
+# who it is (already transliterated: "ბინა" -> "bina", "შპს" -> "shps")
+STOP_TOKENS = frozenset({
+    "bina", "apt", "apartment", "flat", "card", "key", "guest", "code", "finger",
+    "ofisi", "office", "shps", "ltd", "llc",
+    # label_parser aliases
+    "hl", "cmg", "lmd", "telasi", "mars", "marsi", "lemondo", "lemondu", "lemonduu",
+})
+
+NON_LETTERS = re.compile(r"[^a-z]+")
+
+SOURCES = ("label", "owner", "payer")
+
+
+def normalize_name(name) -> str:
+    """
+    Comparable form of a Georgian or Latin name: transliterated, lowercased,
+    without accents, digits, punctuation or noise words, words sorted.
+    Returns "" if nothing name-like is left ("02 HL", "ბინა 14").
+    """
+    if name is None or name != name:  # None / NaN
+        return ""
+    # lower() also folds Mtavruli capitals to Mkhedruli
+    s = unicodedata.normalize("NFKC", str(name)).lower().translate(GEORGIAN_TO_LATIN)
+    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
+    tokens = [t for t in NON_LETTERS.split(s) if len(t) > 1 and t not in STOP_TOKENS]
+    return " ".join(sorted(tokens))
+
+
+def ngrams(norm: str, n: int = NGRAM) -> frozenset:
+    """Character n-grams of every word, padded with spaces (so word order never matters)."""
+    grams = set()
+    for token in norm.split():
+        padded = f" {token} "
+        grams.update(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return frozenset(grams)
+
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    """Dice coefficient of two n-gram sets."""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class NameIndex:
+    """
+    Character n-gram blocking index over candidate names.
+
+    Every name is filed under each of its n-grams. matches() collects the
+    names sharing a block with the query, skipping blocks that grew past
+    `max_block`, and scores only those.
+    """
+
+    def __init__(self, max_block: int = MAX_BLOCK_SIZE):
+        self.max_block = max_block
+        self.entries = []  # (grams, payload)
+        self.sizes = []    # len(grams) per entry
+        self.blocks = {}   # n-gram -> [entry index]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, name, payload) -> bool:
+        """Files `name` with `payload`; False if nothing name-like is left to index."""
+        grams = ngrams(normalize_name(name))
+        if not grams:
+            return False
+        entry = len(self.entries)
+        self.entries.append((grams, payload))
+        self.sizes.append(len(grams))
+        for gram in grams:
+            self.blocks.setdefault(gram, []).append(entry)
+        return True
+
+    def candidates(self, grams, threshold: float = MATCH_THRESHOLD) -> list:
+        """
+        [(upper bound of the score, entry)] of the entries that can still
+        reach `threshold` against `grams`.
+        Dice = 2 * shared / (|A| + |B|). Shared n-grams are counted over the
+        blocks looked at; the skipped (oversized) ones might add up to one
+        each, so that best case is the bound. Everything else is never scored.
+        """
+        blocks, skipped = [], 0
+        for gram in grams:
+            block = self.blocks.get(gram)
+            if block is None:
+                continue
+            if len(block) > self.max_block:
+                skipped += 1
+            else:
+                blocks.append(block)
+        size, sizes = len(grams), self.sizes
+        bounds = ((2 * (count + skipped) / (size + sizes[entry]), entry)
+                  for entry, count in Counter(chain.from_iterable(blocks)).items())
+        return [(bound, entry) for bound, entry in bounds if bound >= threshold]
+
+    def matches(self, name, threshold: float = MATCH_THRESHOLD, best_only: bool = False) -> list:
+        """
+        [(score, payload)] of the candidates scoring >= threshold, best first.
+        With best_only, only the top score (and any ties) is returned:
+        candidates are scored in order of their bound and scoring stops as
+        soon as no remaining one can reach the best score found.
+        """
+        grams = ngrams(normalize_name(name))
+        size, entries = len(grams), self.entries
+        candidates = self.candidates(grams, threshold)
+        if best_only:
+            candidates.sort(reverse=True)
+        scored, best = [], threshold
+        for bound, entry in candidates:
+            if best_only and bound < best:
+                break
+            other, payload = entries[entry]
+            # similarity(), inlined: this loop is the hot path
+            score = 2 * len(grams & other) / (size + len(other))
+            if score >= best:
+                scored.append((score, payload))
+                if best_only:
+                    best = score
+        scored.sort(key=lambda hit: hit[0], reverse=True)
+        if best_only:
+            return [hit for hit in scored if hit[0] == best]
+        return scored
+
+
+def _best(index: NameIndex, name, threshold):
+    """(apt_id, method, score, match_source, match_name) for a name with no apartment of its own."""
+    hits = index.matches(name, threshold, best_only=True)
+    if not hits:
+        return None, None, None, None, None
+    score, (match_source, match_name, apt_id) = hits[0]
+    # Equally good matches in different apartments: don't guess
+    if any(s == score and p[2] != apt_id for s, p in hits[1:]):
+        return None, "ambiguous", round(score, 3), None, None
+    return apt_id, "name", round(score, 3), match_source, match_name
+
+
+def resolve(labels, owners, payers, threshold: float = MATCH_THRESHOLD,
+            max_block: int = MAX_BLOCK_SIZE) -> list:
+    """
+    Links the three sources. Each is an iterable of (name, apt_id or None);
+    duplicates are fine (a name's row keeps the first apartment seen).
+    Owners and payers with an apartment are the reference names; every
+    label or payer without one is matched against them by name.
+    Returns rows (source, name, norm, apt_id, method, score, match_source, match_name).
+    """
+    distinct = {}
+    index = NameIndex(max_block)
+    indexed = set()  # (norm, apt_id): a payer spelled like the owner is the same reference
+    with metrics.span("identity_index"):
+        for source, pairs in zip(SOURCES, (labels, owners, payers)):
+            seen = distinct[source] = {}
+            for name, apt_id in pairs:
+                if name is None or name != name:
+                    continue
+                if seen.get(name) is None:
+                    seen[name] = apt_id
+                # Every apartment of a reference name is indexed, so someone
+                # owning two flats comes out ambiguous instead of the first one
+                if source != "label" and apt_id is not None:
+                    key = (normalize_name(name), apt_id)
+                    if key not in indexed:
+                        indexed.add(key)
+                        index.add(name, (source, name, apt_id))
+
+    known_method = {"label": "label", "owner": "csv", "payer": "description"}
+    rows = []
+    best_by_norm = {}  # spellings that normalize alike ("NINO BERIDZE" / "Beridze Nino") are matched once
+    with metrics.span("identity_match"):
+        for source in SOURCES:
+            for name, apt_id in distinct[source].items():
+                norm = normalize_name(name)
+                if apt_id is not None:
+                    rows.append((source, name, norm, apt_id, known_method[source], None, None, None))
+                elif norm:
+                    if norm not in best_by_norm:
+                        best_by_norm[norm] = _best(index, name, threshold)
+                    rows.append((source, name, norm) + best_by_norm[norm])
+                else:
+                    rows.append((source, name, norm, None, None, None, None, None))
+    return rows
+
+
+def open_identity_db(db_path=IDENTITY_DB):
+    """Opens (and creates if needed) the identity table."""
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS identities (
+            building_id TEXT NOT NULL,
+            source TEXT NOT NULL,          -- label / owner / payer
+            name TEXT NOT NULL,            -- as written in the source
+            norm TEXT,                     -- normalize_name(name)
+            apt_id TEXT,
+            method TEXT,                   -- label / csv / description / name / ambiguous / manual
+            score REAL,                    -- similarity of a name match
+            match_source TEXT,
+            match_name TEXT,
+            PRIMARY KEY (building_id, source, name)
+        );
+        CREATE INDEX IF NOT EXISTS idx_identities_apt ON identities (building_id, apt_id);
+    """)
+    return conn
+
+
+def resolve_identities(labels, owners, payers, building_id=DEFAULT_BUILDING, db_path=IDENTITY_DB,
+                       threshold: float = MATCH_THRESHOLD) -> dict:
+    """
+    resolve() + replace `building_id`'s rows of the identities table, in
+    one transaction. Rows marked method = 'manual' are kept as they are.
+    Returns counts per method.
+    """
+    rows = resolve(labels, owners, payers, threshold)
+    conn = open_identity_db(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM identities WHERE building_id = ? AND method IS NOT 'manual'",
+                         (building_id,))
+            conn.executemany("INSERT OR IGNORE INTO identities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             ((building_id,) + row for row in rows))
+        stats = dict(conn.execute(
+            "SELECT COALESCE(method, 'unresolved'), COUNT(*) FROM identities WHERE building_id = ? GROUP BY 1",
+            (building_id,),
+        ))
+    finally:
+        conn.close()
+    log.info("Identities resolved", extra={"fields": stats})
+    return stats
+
+
+def identity_map(source, building_id=DEFAULT_BUILDING, db_path=IDENTITY_DB) -> dict:
+    """{name: apt_id} of `source`'s resolved rows (manual pins included)."""
+    conn = open_identity_db(db_path)
+    try:
+        return dict(conn.execute(
+            "SELECT name, apt_id FROM identities WHERE building_id = ? AND source = ? AND apt_id IS NOT NULL",
+            (building_id, source),
+        ))
+    finally:
+        conn.close()
@@ -0,0 +1,221 @@
+"""
+Logging and metrics for the sync / DB-build hot paths.
+
+- get_logger(name): leveled logging under the "ttlock" logger, as text or
+  JSON lines (TTLOCK_LOG_FORMAT). Every line goes through redact(), so
+  access tokens, client secrets and passwords never reach the output.
+- metrics: process-wide counters and latency histograms with labels, plus
+  span() timers around whole stages. Exported at the end of a run with
+  metrics.summary() (JSON) or metrics.prometheus() (Prometheus text format).
+- debug_body(): logs a full API response only when TTLOCK_DEBUG_BODIES=1.
+"""
+import bisect
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Configuration ---
+LOG_LEVEL = os.getenv("TTLOCK_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("TTLOCK_LOG_FORMAT", "text")  # text | json
+# Log raw API bodies (redacted) at DEBUG level; off by default
+DEBUG_BODIES = os.getenv("TTLOCK_DEBUG_BODIES", "0") == "1"
+# Written by export_metrics() at the end of a run: .json -> summary, anything else -> Prometheus text
+METRICS_FILE = os.getenv("TTLOCK_METRICS_FILE")
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# ---------------------
+
+_SECRET = re.compile(
+    r'(?i)((?:access_?token|refresh_?token|client_?secret|password)["\']?\s*[=:]\s*["\']?)([^&"\'\s,}]+)'
+)
+_BEARER = re.compile(r"(?i)(bearer\s+)\S+")
+
+
+def redact(text: str) -> str:
+    """Masks token / secret / password values in URLs, form data, JSON and headers."""
+    return _BEARER.sub(r"\1***", _SECRET.sub(r"\1***", text))
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return redact(line)
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **(getattr(record, "fields", None) or {}),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return redact(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+def _configure():
+    root = logging.getLogger("ttlock")
+    if root.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(_JsonFormatter() if LOG_FORMAT == "json"
+                         else _TextFormatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger "ttlock.<name>". Pass structured data as extra={"fields": {...}}."""
+    _configure()
+    return logging.getLogger(f"ttlock.{name}")
+
+
+def debug_body(logger: logging.Logger, what: str, body) -> None:
+    """Logs a whole API body, only if TTLOCK_DEBUG_BODIES=1 and DEBUG is enabled."""
+    if DEBUG_BODIES and logger.isEnabledFor(logging.DEBUG):
+        text = body if isinstance(body, str) else json.dumps(body, ensure_ascii=False, default=str)
+        logger.debug(f"{what} body: {text}")
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot: above the highest bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket holding the q-quantile (None if empty, inf if above every bucket)."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    Counters and histograms keyed by (name, labels). Thread-safe; cheap
+    enough to call per request and per page.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}    # (name, labels) -> float
+        self.histograms = {}  # (name, labels) -> Histogram
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """Times a stage into the span_seconds histogram (also works around awaits)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe("span_seconds", elapsed, span=name, **labels)
+            get_logger("span").debug(f"{name} took {elapsed:.3f}s", extra={"fields": labels})
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def summary(self) -> dict:
+        """JSON-able snapshot: counters, and count / sum / p50 / p95 / p99 per histogram."""
+        def label_str(labels):
+            return ",".join(f"{k}={v}" for k, v in labels)
+
+        with self._lock:
+            out = {"counters": {}, "histograms": {}}
+            for (name, labels), value in sorted(self.counters.items()):
+                out["counters"].setdefault(name, {})[label_str(labels)] = value
+            for (name, labels), h in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                out["histograms"].setdefault(name, {})[label_str(labels)] = {
+                    "count": h.count, "sum": round(h.sum, 6),
+                    "p50": h.quantile(0.5), "p95": h.quantile(0.95), "p99": h.quantile(0.99),
+                }
+        return out
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format."""
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v)}"'.replace("\n", " ") for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{fmt(labels)} {value}")
+            for (name, labels), h in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, n in zip(h.buckets + (float("inf"),), h.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{fmt(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{fmt(labels)} {h.sum}")
+                lines.append(f"{name}_count{fmt(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def export_metrics(path: str | None = METRICS_FILE) -> str | None:
+    """Writes the metrics to `path` (.json -> summary, else Prometheus text). Returns the path."""
+    if not path:
+        return None
+    with open(path, "w", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            json.dump(metrics.summary(), f, ensure_ascii=False, indent=2)
+        else:
+            f.write(metrics.prometheus())
+    get_logger("metrics").info(f"Metrics written to {path}")
+    return path
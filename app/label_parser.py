@@ -0,0 +1,94 @@
+import re
+from functools import lru_cache
+
+from instrumentation import get_logger
+
+# --- Label alias table ---
+# (text found anywhere in the label, apartment name it maps to).
+# Order is priority: when a label contains several entries, the one listed
+# first wins, wherever it appears in the label ("CMG" beats the "M" inside it).
+LABEL_ALIASES = [
+    ("LMD", "LMD"),
+    ("CMG", "CMG"),
+    ("HL", "HL"),
+    ("cmg", "cmg"),
+    ("თელასი", "თელასი"),
+    ("M", "M"),
+    ("m", "m"),
+    ("Mars", "Mars"),
+    ("მარსი", "მარსი"),
+]
+
+# Start of string, digits, optional slashes: "02", "60/64", "01/02"
+APT_NUMBER = re.compile(r'^(\d+[\/\d]*)')
+# ---------------------
+
+log = get_logger("labels")
+
+
+class LabelParser:
+    """
+    Turns registry labels ("02 HL", "60/64", "Mars ოფისი") into apartment ids.
+
+    All aliases are matched with one compiled alternation. Most labels have
+    no alias and are rejected by a single search; for the rest the same
+    alternation runs inside a lookahead so overlapping hits are seen too.
+    Alternatives are listed in priority order, so at each position the regex
+    reports the best entry starting there. Results are memoized per label
+    (labels repeat across locks).
+    """
+
+    def __init__(self, aliases=LABEL_ALIASES, cache_size: int = 8192):
+        self.aliases = list(aliases)
+        self._priority = {}
+        for i, (text, target) in enumerate(self.aliases):
+            self._priority.setdefault(text, (i, target))
+        alternation = "|".join(re.escape(text) for text, _ in self.aliases)
+        # Plain alternation = cheap "any alias at all?" test; the lookahead
+        # version then finds every (overlapping) hit to pick the best one
+        self._any_alias_re = re.compile(alternation) if self.aliases else None
+        self._alias_re = re.compile(f"(?=({alternation}))") if self.aliases else None
+        self._parse_cached = lru_cache(maxsize=cache_size)(self._parse_raw)
+
+    def _parse_clean(self, s: str):
+        """Apartment id for an already stripped label, or None."""
+        if self._any_alias_re is not None and self._any_alias_re.search(s):
+            hits = [self._priority[m.group(1)] for m in self._alias_re.finditer(s)]
+            if hits:
+                return min(hits)[1] # Want to make this the name of the apartment (use for offices)
+
+        single_match = APT_NUMBER.match(s)
+        if single_match:
+            base = single_match.group(1)
+            # Only normalize if it's a plain number (no slashes)
+            if '/' not in base and base.isdigit():
+                return str(int(base))  # Remove leading zeros
+            return base  # e.g., "01/02"
+
+        return None  # No match
+
+    def _parse_raw(self, label):
+        return self._parse_clean(str(label).strip())
+
+    def parse(self, label):
+        """Same contract as database.parse_label (including its ("Unknown", None) for empty labels)."""
+        if not label: return "Unknown", None
+        result = self._parse_cached(label)
+        if result is None:
+            log.debug(f"Term did not match any pattern: {label}")
+        return result
+
+    def parse_series(self, labels):
+        """
+        Vectorized parse over a pandas Series: every distinct label is parsed
+        once and the results are mapped back onto the whole column.
+        """
+        uniques = labels.dropna().unique()
+        mapping = {label: self.parse(label) for label in uniques}
+        return labels.map(mapping)
+
+    def cache_info(self):
+        return self._parse_cached.cache_info()
+
+
+default_parser = LabelParser()
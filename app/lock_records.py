@@ -0,0 +1,269 @@
+"""
+Incremental ingestion of lock records (who opened which door, when).
+
+Pulls /v3/lockRecord/list for every lock, but only records newer than the
+lock's high-water mark (the latest lockDate already stored), so history
+is downloaded once. Pages are inserted as they arrive, straight into
+month partitions (lock_records_YYYYMM, by lockDate, UTC), and the
+lock_records view unions them. Nothing is ever updated in place: the
+tables are append-only and a re-delivered record is ignored by its
+recordId.
+
+Records live in their own file (RECORDS_DB), not in the access DB,
+because create_databases rebuilds that file on every run. Join the two
+with who_opened(), which attaches the access DB.
+
+Locks that upload late (Bluetooth unlocks synced by the app hours later)
+are covered by RECORD_OVERLAP_MS: each run re-asks for that much before
+the mark and drops what it already has.
+
+Run from the app/ folder:
+    python lock_records.py                     # every lock on the account
+    python lock_records.py --locks "26294486"  # or a load_locks spec
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import time
+
+from access_db import ACCESS_DB
+from instrumentation import export_metrics, get_logger, metrics
+from pager import PageSpec, paginate
+from ttlock_api_GET import SYNC_CONCURRENCY, close_client, get_client, get_lock_list
+from ttlock_client import TTLockClient
+from utils import load_locks, now_ms
+
+# --- Configuration ---
+RECORDS_DB = os.getenv("TTLOCK_RECORDS_DB", "lock_records.db")
+# How far back the first run of a lock goes
+RECORDS_BACKFILL_DAYS = float(os.getenv("TTLOCK_RECORDS_BACKFILL_DAYS", "30"))
+# Re-check this much before the high-water mark for late uploads (default 1 h)
+RECORD_OVERLAP_MS = int(os.getenv("TTLOCK_RECORD_OVERLAP_MS", "3600000"))
+RECORD_PAGE_SIZE = 100
+# Pages of one lock requested ahead of the one being written
+PREFETCH_PAGES = 4
+# ---------------------
+
+log = get_logger("records")
+
+RECORDS_SPEC = PageSpec("records", "/v3/lockRecord/list", "recordId", RECORD_PAGE_SIZE, date_field="lockDate")
+
+# API field -> column, in table order
+COLUMNS = {
+    "recordId": "record_id",
+    "lockId": "lock_id",
+    "lockDate": "lock_date",
+    "serverDate": "server_date",
+    "recordType": "record_type",
+    "success": "success",
+    "username": "username",
+    "keyboardPwd": "keyboard_pwd",
+}
+
+
+def partition_name(lock_date_ms: int) -> str:
+    t = time.gmtime(lock_date_ms / 1000)
+    return f"lock_records_{t.tm_year}{t.tm_mon:02d}"
+
+
+def _partitions(conn) -> list:
+    return [name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'lock_records_[0-9]*' ORDER BY name"
+    )]
+
+
+def _refresh_view(conn):
+    """lock_records = UNION ALL of every month partition."""
+    conn.execute("DROP VIEW IF EXISTS lock_records")
+    parts = _partitions(conn)
+    if parts:
+        conn.execute("CREATE VIEW lock_records AS " + " UNION ALL ".join(f"SELECT * FROM {p}" for p in parts))
+
+
+def open_records_db(db_path=RECORDS_DB):
+    """Opens (and creates if needed) the records database."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript("""
+        -- Newest lockDate / recordId stored per lock
+        CREATE TABLE IF NOT EXISTS record_marks (
+            lock_id INTEGER PRIMARY KEY,
+            last_lock_date INTEGER NOT NULL,
+            last_record_id INTEGER,
+            updated_at INTEGER NOT NULL
+        );
+    """)
+    return conn
+
+
+def _ensure_partition(conn, name: str, known: set):
+    """
+    Creates month partition `name` (and refreshes the view) if needed.
+    Plain execute() only: executescript would COMMIT any open transaction.
+    """
+    if name in known:
+        return
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+            record_id INTEGER PRIMARY KEY,
+            lock_id INTEGER NOT NULL,
+            lock_date INTEGER NOT NULL,
+            server_date INTEGER,
+            record_type INTEGER,
+            success INTEGER,
+            username TEXT,
+            keyboard_pwd TEXT
+        )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_lock_date ON {name} (lock_id, lock_date)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_username ON {name} (username)")
+    _refresh_view(conn)
+    known.add(name)
+
+
+def insert_records(conn, items: list, known: set) -> int:
+    """Bulk-inserts one page of raw records into their month partitions. Returns rows added."""
+    by_partition = {}
+    for item in items:
+        if item.get("lockDate") is None:
+            continue
+        by_partition.setdefault(partition_name(item["lockDate"]), []).append(
+            tuple(item.get(field) for field in COLUMNS)
+        )
+    # Partitions first, committed on their own, so a rolled-back insert
+    # can't take a table with it that `known` already lists
+    with conn:
+        for name in by_partition:
+            _ensure_partition(conn, name, known)
+    added = 0
+    with conn:
+        for name, rows in by_partition.items():
+            before = conn.total_changes
+            conn.executemany(f"INSERT OR IGNORE INTO {name} VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+            added += conn.total_changes - before
+    return added
+
+
+def load_marks(conn) -> dict:
+    return {lock_id: last for lock_id, last in conn.execute("SELECT lock_id, last_lock_date FROM record_marks")}
+
+
+async def _ingest_lock(client, sem, conn, known, lock_id, lock_name, since, until):
+    """Pages one lock's records in [since, until] into the DB. Returns (added, newest item)."""
+    added, newest = 0, None
+
+    def store(items):
+        nonlocal added, newest
+        for item in items:
+            if newest is None or (item.get("lockDate") or 0) > (newest.get("lockDate") or 0):
+                newest = item
+        added += insert_records(conn, items, known)
+
+    # Each page is written as it arrives with only a few fetched ahead,
+    # so memory stays bounded on a long backfill
+    await paginate(client, sem, RECORDS_SPEC, lock_id, lock_name, on_page=store,
+                   params={"startDate": since, "endDate": until}, prefetch=PREFETCH_PAGES)
+    return added, newest
+
+
+async def ingest_lock_records(locks: list, db_path=RECORDS_DB, concurrency: int = SYNC_CONCURRENCY,
+                              client: TTLockClient | None = None, now: int | None = None) -> dict:
+    """
+    Fetches every record newer than each lock's mark and appends it.
+
+    The mark only moves once all of a lock's pages are stored, so an
+    interrupted run is simply repeated (re-sent records are ignored).
+    One failing lock doesn't stop the others; its mark stays where it was.
+    Returns {"locks", "added", "failed"}.
+    """
+    client = client or get_client()
+    sem = asyncio.Semaphore(max(1, int(concurrency)))
+    until = now or now_ms()
+    backfill = until - int(RECORDS_BACKFILL_DAYS * 86_400_000)
+    conn = open_records_db(db_path)
+    known = set(_partitions(conn))
+    try:
+        marks = load_marks(conn)
+
+        async def run(lock):
+            lock_id = lock.get('lockId') or lock.get('id')
+            lock_name = lock.get('lockAlias') or lock.get('name')
+            mark = marks.get(lock_id)
+            since = max(0, mark - RECORD_OVERLAP_MS) if mark is not None else backfill
+            try:
+                added, newest = await _ingest_lock(client, sem, conn, known, lock_id, lock_name, since, until)
+            except Exception as e:
+                log.error(f"Records of {lock_name} failed: {e}")
+                return None
+            if newest is not None and (mark is None or newest["lockDate"] > mark):
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO record_marks VALUES (?, ?, ?, ?)",
+                        (lock_id, newest["lockDate"], newest.get("recordId"), until),
+                    )
+            return added
+
+        with metrics.span("lock_records"):
+            results = await asyncio.gather(*(run(lock) for lock in locks))
+    finally:
+        conn.close()
+
+    stats = {
+        "locks": len(locks),
+        "added": sum(r for r in results if r),
+        "failed": sum(1 for r in results if r is None),
+    }
+    log.info("Lock records ingested", extra={"fields": stats})
+    return stats
+
+
+def who_opened(lock_id=None, since: int | None = None, until: int | None = None,
+               db_path=RECORDS_DB, access_db=ACCESS_DB) -> list:
+    """
+    Records in [since, until] (ms, optional), newest first, with the person
+    and apartment behind them when the eKey username / card number is known:
+    (lock_date, lock_id, record_type, success, username_or_card, label, apt_id).
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        if not _partitions(conn):
+            return []
+        conn.execute("ATTACH DATABASE ? AS access", (access_db,))
+        return conn.execute("""
+            SELECT r.lock_date, r.lock_id, r.record_type, r.success,
+                   COALESCE(r.username, r.keyboard_pwd),
+                   COALESCE(pe.label, pc.label), COALESCE(pe.apt_id, pc.apt_id)
+            FROM lock_records r
+            LEFT JOIN access.ekeys e ON e.username = r.username AND e.lock_id = r.lock_id
+            LEFT JOIN access.persons pe ON pe.person_id = e.person_id
+            LEFT JOIN access.cards c ON c.card_number = r.keyboard_pwd AND c.lock_id = r.lock_id
+            LEFT JOIN access.persons pc ON pc.person_id = c.person_id
+            WHERE (?1 IS NULL OR r.lock_id = ?1)
+              AND r.lock_date >= COALESCE(?2, 0) AND r.lock_date <= COALESCE(?3, 9223372036854775807)
+            ORDER BY r.lock_date DESC
+        """, (lock_id, since, until)).fetchall()
+    finally:
+        conn.close()
+
+
+async def main(locks_spec=None):
+    locks = load_locks(locks_spec) or await get_lock_list()
+    if not locks:
+        log.error("No locks to read records from")
+        return None
+    try:
+        return await ingest_lock_records(locks)
+    finally:
+        await close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locks", help='JSON file or "id=name,id,..." (default: every lock on the account)')
+    args = parser.parse_args()
+    try:
+        print(asyncio.run(main(args.locks)))
+    finally:
+        export_metrics()
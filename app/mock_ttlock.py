@@ -0,0 +1,222 @@
+"""
+Offline stand-in for the TTLock Open API.
+
+MockTTLock answers /v3/lock/list, /v3/lock/listKey, /v3/identityCard/list,
+/v3/lock/listKeyboardPwd, /v3/fingerprint/list and /v3/lockRecord/list from a synthetic building, with configurable latency, page-size cap and
+error injection; with token_ttl it also plays /oauth2/token and rejects
+expired tokens. Plug it into a TTLockClient through httpx.MockTransport:
+
+    mock = MockTTLock(make_building(8, 120, 60), latency=0.05)
+    async with mock.client() as client:
+        registry = await sync_access_IC_ekey(await get_lock_list(client, use_cache=False), client=client)
+"""
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import httpx
+
+from ttlock_client import TTLockClient
+
+BASE_URL = "https://mock.ttlock.local"
+# Per-lock list endpoint -> building key
+CREDENTIAL_PATHS = {
+    "/v3/lock/listKey": "ekeys",
+    "/v3/identityCard/list": "cards",
+    "/v3/lock/listKeyboardPwd": "passcodes",
+    "/v3/fingerprint/list": "fingerprints",
+}
+
+
+def make_building(n_locks: int, n_ekeys: int, n_cards: int, n_apartments: int = 80, seed: int = 0,
+                  first_lock_id: int = 20000000, n_records: int = 0, n_passcodes: int = 0,
+                  n_fingerprints: int = 0) -> dict:
+    """
+    Synthetic building: {lockId: {"name": ..., "ekeys": [...], "cards": [...],
+    "passcodes": [...], "fingerprints": [...], "records": [...]}}.
+    Labels look like the real registry ("02", "14 HL", "60/64", "Mars ოფისი", ...)
+    and repeat across locks; the same seed always gives the same building.
+    Buildings made with different first_lock_id never share lock/key/card ids.
+    n_records unlock records per lock are spread over the last 30 days (see add_records).
+    """
+    rng = random.Random(seed)
+    # Own generator, so adding passcodes / fingerprints leaves the eKey and card labels as they were
+    extra_rng = random.Random(seed + 1)
+    extras = ["HL", "CMG", "ოფისი", "მარსი"]
+
+    def label(n, rng=rng):
+        apt = n % n_apartments + 1
+        roll = rng.random()
+        if roll < 0.70:
+            return f"{apt:02d}"
+        if roll < 0.85:
+            return f"{apt} {rng.choice(extras)}"
+        if roll < 0.95:
+            return f"{apt}/{apt + 1}"
+        return f"guest {n}"
+
+    building = {}
+    for i in range(n_locks):
+        lock_id = first_lock_id + i
+        building[lock_id] = {
+            "name": f"Lock {i}",
+            "ekeys": [
+                {"keyId": lock_id * 10000 + k, "lockId": lock_id, "username": f"user_{k}",
+                 "keyName": label(k), "keyStatus": "110401", "date": 1700000000000 + k}
+                for k in range(n_ekeys)
+            ],
+            "cards": [
+                {"cardId": lock_id * 10000 + c, "lockId": lock_id, "cardNumber": str(9000000 + c),
+                 "cardName": f"{label(c)} card", "startDate": 0, "endDate": 0,
+                 "createDate": 1700000000000 + c}
+                for c in range(n_cards)
+            ],
+            "passcodes": [
+                {"keyboardPwdId": lock_id * 10000 + p, "lockId": lock_id, "keyboardPwd": str(100000 + p),
+                 "keyboardPwdName": f"{label(p, extra_rng)} code", "keyboardPwdType": 3, "startDate": 0,
+                 "endDate": 0, "sendDate": 1700000000000 + p}
+                for p in range(n_passcodes)
+            ],
+            "fingerprints": [
+                {"fingerprintId": lock_id * 10000 + f, "lockId": lock_id, "fingerprintNumber": str(500000 + f),
+                 "fingerprintName": f"{label(f, extra_rng)} finger", "fingerprintType": 1, "startDate": 0,
+                 "endDate": 0, "createDate": 1700000000000 + f}
+                for f in range(n_fingerprints)
+            ],
+            "records": [],
+        }
+        add_records(building[lock_id], n_records, seed=seed + i)
+    return building
+
+
+def add_records(lock: dict, n: int, until_ms: int | None = None, span_ms: int = 30 * 86_400_000, seed: int = 0):
+    """
+    Appends n unlock records to a make_building lock, with lockDate spread
+    evenly over [until_ms - span_ms, until_ms] (default: up to now), by its
+    eKey holders (app unlocks) and cards (card unlocks).
+    """
+    rng = random.Random(seed)
+    until_ms = until_ms if until_ms is not None else int(time.time() * 1000)
+    records = lock["records"]
+    lock_id = lock["ekeys"][0]["lockId"] if lock["ekeys"] else None
+    next_id = (records[-1]["recordId"] + 1) if records else (lock_id or 0) * 1_000_000
+    for r in range(n):
+        lock_date = until_ms - span_ms + (span_ms * (r + 1)) // max(1, n)
+        if lock["cards"] and rng.random() < 0.3:
+            card = rng.choice(lock["cards"])
+            who = {"recordType": 7, "username": None, "keyboardPwd": card["cardNumber"]}
+        elif lock["ekeys"]:
+            who = {"recordType": 1, "username": rng.choice(lock["ekeys"])["username"], "keyboardPwd": ""}
+        else:
+            continue
+        records.append({"recordId": next_id + r, "lockId": lock_id, "success": 1,
+                        "lockDate": lock_date, "serverDate": lock_date + rng.randint(0, 5000), **who})
+
+
+class MockTTLock:
+    """
+    Serves a synthetic building the way the TTLock list endpoints do.
+
+    - latency: seconds per request (plus up to `jitter` more, at random)
+    - max_page_size: pageSize above this is capped, like the real API
+    - error_rate: fraction of requests that fail; each failure is picked from
+      `errors`, either an HTTP status (429, 503, ...) or a TTLock errcode
+      returned in a 200 body (e.g. 90000 "system busy")
+    - token_ttl: if set, /oauth2/token hands out tokens valid for that many
+      seconds and list calls with an unknown/expired token get errcode 10003
+    Every request is counted in `requests` by path.
+    """
+
+    def __init__(self, building: dict, latency: float = 0.0, jitter: float = 0.0,
+                 max_page_size: int | None = None, error_rate: float = 0.0,
+                 errors=(503, 429, "90000"), seed: int = 0, token_ttl: float | None = None):
+        self.building = building
+        self.latency = latency
+        self.jitter = jitter
+        self.max_page_size = max_page_size
+        self.error_rate = error_rate
+        self.errors = list(errors)
+        self.requests = {}
+        self._rng = random.Random(seed)
+        self.token_ttl = token_ttl
+        self.tokens = {}          # access token -> expires at
+        self.refresh_tokens = set()
+
+    def respond(self, path: str, params: dict) -> tuple[int, dict]:
+        """(HTTP status, JSON body) for one request. `params` are single-valued query/form fields."""
+        self.requests[path] = self.requests.get(path, 0) + 1
+        if self.error_rate and self._rng.random() < self.error_rate:
+            error = self._rng.choice(self.errors)
+            if isinstance(error, int):
+                return error, {"errcode": -1, "errmsg": f"injected HTTP {error}"}
+            return 200, {"errcode": int(error), "errmsg": "injected error"}
+
+        if path == "/oauth2/token":
+            return 200, self._grant(params)
+        if self.token_ttl is not None and self.tokens.get(params.get("accessToken"), 0) < time.time():
+            return 200, {"errcode": 10003, "errmsg": "invalid token"}
+
+        page_no = int(params.get("pageNo", 1))
+        page_size = int(params.get("pageSize", 20))
+        if self.max_page_size:
+            page_size = min(page_size, self.max_page_size)
+
+        if path == "/v3/lock/list":
+            items = [{"lockId": lock_id, "lockAlias": lock["name"], "lockName": f"M{lock_id}"}
+                     for lock_id, lock in self.building.items()]
+        elif path == "/v3/lockRecord/list":
+            lock = self.building.get(int(params.get("lockId", 0)))
+            if lock is None:
+                return 200, {"errcode": -2012, "errmsg": "lock does not exist"}
+            start, end = int(params.get("startDate", 0)), int(params.get("endDate", 0)) or float("inf")
+            # Newest first, like the real endpoint
+            items = [r for r in reversed(lock.get("records", [])) if start <= r["lockDate"] <= end]
+        elif path in CREDENTIAL_PATHS:
+            lock = self.building.get(int(params.get("lockId", 0)))
+            if lock is None:
+                return 200, {"errcode": -2012, "errmsg": "lock does not exist"}
+            items = lock.get(CREDENTIAL_PATHS[path], [])
+        else:
+            return 404, {"errcode": -1, "errmsg": f"unknown path {path}"}
+
+        page = items[(page_no - 1) * page_size: page_no * page_size]
+        pages = (len(items) + page_size - 1) // page_size
+        return 200, {"list": page, "pageNo": page_no, "pageSize": page_size,
+                     "pages": pages, "total": len(items)}
+
+    def _grant(self, params: dict) -> dict:
+        grant = params.get("grant_type")
+        if grant == "refresh_token" and params.get("refresh_token") not in self.refresh_tokens:
+            return {"errcode": 10011, "errmsg": "invalid refresh_token"}
+        if grant not in ("password", "refresh_token"):
+            return {"errcode": 10004, "errmsg": "invalid grant"}
+        token, refresh = uuid.uuid4().hex, uuid.uuid4().hex
+        ttl = self.token_ttl if self.token_ttl is not None else 7_776_000
+        self.tokens[token] = time.time() + ttl
+        self.refresh_tokens.add(refresh)
+        return {"access_token": token, "refresh_token": refresh, "expires_in": ttl, "uid": 1}
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        """httpx.MockTransport handler."""
+        delay = self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        params = dict(request.url.params)
+        if request.method == "POST":
+            params.update(httpx.QueryParams(request.content.decode("utf-8")))
+        status, body = self.respond(request.url.path, params)
+        return httpx.Response(status, content=json.dumps(body).encode("utf-8"),
+                              headers={"Content-Type": "application/json"})
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def client(self, client_id: str = "mock-client", **kwargs) -> TTLockClient:
+        """A TTLockClient wired to this mock (kwargs go to TTLockClient, e.g. limiter=...)."""
+        return TTLockClient(BASE_URL, client_id, "mock-token", transport=self.transport(), **kwargs)
+
+    def locks(self) -> list:
+        """The lock list in the shape main() passes to sync_access_IC_ekey."""
+        return [{"lockId": lock_id, "name": lock["name"]} for lock_id, lock in self.building.items()]
@@ -0,0 +1,212 @@
+"""
+Sharded sync of several buildings, each on its own TTLock account.
+
+Every building in ACCOUNTS_FILE gets its own TTLockClient (own token,
+own connection pool, own rate limiter), so one account's limits never
+slow another down. All buildings sync at the same time and each one is
+written into the shared access database as soon as it finishes,
+replacing only its own building_id partition. Total time is that of the
+slowest building, not the sum.
+
+With processes > 0 the buildings are spread over a process pool: each
+worker downloads its building, parses the JSON, builds the registry and
+the access rows, and hands the rows back for the (single) DB writer.
+
+ACCOUNTS_FILE is a JSON list; values starting with "$" are read from the
+environment, so secrets can stay in .env:
+
+    [{"building_id": "vake", "client_id": "...", "client_secret": "$VAKE_SECRET",
+      "username": "vake_admin", "password": "$VAKE_PASSWORD",
+      "locks": "26986212,26436420", "rate": 10, "concurrency": 8,
+      "owners_csv": "vake_owners.csv"}]
+
+A building with an owners_csv (same layout as TTLOCK_OWNERS_CSV) gets its
+owners, fees and debts replaced along with its credentials; without one
+its owners rows are left as they were.
+
+Run from the app/ folder:
+    python multi_sync.py                  # in-process, all buildings concurrently
+    python multi_sync.py --processes 4    # spread over 4 worker processes
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+
+from access_db import ACCESS_DB, replace_building
+from auth import TOKEN_CACHE_FILE, TokenManager
+from instrumentation import export_metrics, get_logger, metrics, redact
+from ratelimit import RATE, AdaptiveRateLimiter
+from ttl_cache import TTLCache
+from ttlock_api_GET import (ACCESS_KINDS, BASE_URL, LOCK_CACHE_FILE, LOCK_LIST_TTL, SYNC_CONCURRENCY,
+                            get_lock_list, sync_access_IC_ekey)
+from ttlock_client import TTLockClient
+from utils import load_locks
+
+# --- Configuration ---
+ACCOUNTS_FILE = os.getenv("TTLOCK_ACCOUNTS_FILE", "accounts.json")
+# Worker processes for multi-building syncs (0 = everything in this process)
+SYNC_PROCESSES = int(os.getenv("TTLOCK_SYNC_PROCESSES", "0"))
+# ---------------------
+
+log = get_logger("multi")
+
+
+@dataclass(frozen=True)
+class Account:
+    """One building and the TTLock account that manages it."""
+    building_id: str
+    client_id: str
+    client_secret: str | None = None
+    username: str | None = None
+    password: str | None = None
+    access_token: str | None = None
+    base_url: str | None = None
+    locks: str | None = None       # load_locks spec; None = every lock on the account
+    rate: float = RATE             # requests per second for this account
+    concurrency: int = SYNC_CONCURRENCY
+    owners_csv: str | None = None  # this building's owners CSV; None = keep the stored owners
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Account":
+        """Account from a JSON entry; "$NAME" values come from the environment."""
+        return cls(**{k: os.getenv(v[1:]) if isinstance(v, str) and v.startswith("$") else v
+                      for k, v in d.items()})
+
+
+def load_accounts(path=ACCOUNTS_FILE) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [Account.from_dict(d) for d in json.load(f)]
+
+
+def building_path(path: str, building_id: str) -> str:
+    """Per-building variant of a cache file name: ttlock_token.json -> ttlock_token_vake.json."""
+    root, ext = os.path.splitext(path)
+    return f"{root}_{building_id}{ext}"
+
+
+def account_client(account: Account, **kwargs) -> TTLockClient:
+    """
+    A TTLockClient for one account, with its own limiter and token cache file.
+    Only the account's own credentials are used (never the TTLOCK_* ones from
+    the environment): it needs a client_id and either client_secret +
+    username + password or an access_token, else ValueError.
+    """
+    if not account.client_id or not (
+        (account.client_secret and account.username and account.password) or account.access_token
+    ):
+        raise ValueError(f"Building {account.building_id}: account needs client_id and either "
+                         f"client_secret, username and password, or access_token")
+    base_url = account.base_url or BASE_URL
+    tokens = TokenManager(base_url, account.client_id, account.client_secret, account.username,
+                          account.password, access_token=account.access_token,
+                          cache_path=building_path(TOKEN_CACHE_FILE, account.building_id),
+                          transport=kwargs.get("transport"), env_fallback=False)
+    limiter = kwargs.pop("limiter", None) or AdaptiveRateLimiter(rate=account.rate)
+    return TTLockClient(base_url, account.client_id, account.access_token, tokens=tokens,
+                        limiter=limiter, env_fallback=False, **kwargs)
+
+
+async def sync_building(account: Account, client: TTLockClient | None = None) -> dict:
+    """
+    Syncs one building: {"building_id", "rows": (persons, locks, ekeys, cards,
+    df_owners), "synced_at": epoch ms, "stats": {...}} (df_owners is None
+    without an owners_csv).
+    Errors are caught and reported in stats["error"], so one failing account
+    never takes the others down.
+    """
+    from database import access_rows, iter_registry_items, load_owners_csv
+
+    start = time.perf_counter()
+    # Taken before the first request: anything the blocker logs after it may be missing from the rows
+    synced_at = int(time.time() * 1000)
+    own_client = client is None
+    stats = {"locks": 0, "ekeys": 0, "cards": 0, "owners": None, "error": None}
+    rows = None
+    try:
+        # Missing credentials fail this building only
+        client = client or account_client(account)
+        # Own lock list cache file too: two token-only accounts on one
+        # client_id would otherwise share a cache key
+        lock_cache = TTLCache(LOCK_LIST_TTL, building_path(LOCK_CACHE_FILE, account.building_id))
+        locks = load_locks(account.locks) or await get_lock_list(client, cache=lock_cache)
+        if not locks:
+            raise RuntimeError("no locks (lock list request failed?)")
+        registry = await sync_access_IC_ekey(locks, account.concurrency, client, kinds=ACCESS_KINDS)
+        df_owners = await asyncio.to_thread(load_owners_csv, account.owners_csv) if account.owners_csv else None
+        rows = access_rows(iter_registry_items(registry)) + (df_owners,)
+        stats.update(locks=len(locks), ekeys=len(rows[2]), cards=len(rows[3]),
+                     owners=len(df_owners) if df_owners is not None else None)
+    except Exception as e:
+        log.error(f"Building {account.building_id}: sync failed: {e}")
+        stats["error"] = redact(str(e))
+    finally:
+        if own_client and client is not None:
+            await client.aclose()
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    return {"building_id": account.building_id, "rows": rows, "synced_at": synced_at, "stats": stats}
+
+
+def _sync_building_in_worker(account_fields: dict) -> dict:
+    """Process-pool entry point: one building in a fresh event loop."""
+    return asyncio.run(sync_building(Account(**account_fields)))
+
+
+async def sync_buildings(accounts: list, processes: int = SYNC_PROCESSES, db_path=ACCESS_DB,
+                         clients: dict | None = None) -> dict:
+    """
+    Syncs every account concurrently and writes each building into
+    `db_path` as soon as it is done. `clients` ({building_id: TTLockClient})
+    overrides the per-account clients (in-process mode only).
+    Returns {building_id: stats}; a building whose sync failed keeps its
+    previous rows in the database.
+    """
+    clients = clients or {}
+    write_lock = asyncio.Lock()  # one SQLite writer at a time
+    summary = {}
+
+    async def run(job):
+        result = await job
+        building_id, stats = result["building_id"], result["stats"]
+        if result["rows"] is not None:
+            async with write_lock:
+                with metrics.span("write_building"):
+                    await asyncio.to_thread(replace_building, building_id, *result["rows"], db_path=db_path,
+                                            synced_at=result["synced_at"])
+        summary[building_id] = stats
+        log.info(f"Building {building_id} done", extra={"fields": stats})
+
+    with metrics.span("multi_sync"):
+        if processes > 0:
+            loop = asyncio.get_running_loop()
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                await asyncio.gather(*(
+                    run(loop.run_in_executor(pool, _sync_building_in_worker, asdict(account)))
+                    for account in accounts
+                ))
+        else:
+            await asyncio.gather(*(run(sync_building(a, clients.get(a.building_id))) for a in accounts))
+    return summary
+
+
+async def main(accounts_file=ACCOUNTS_FILE, processes=SYNC_PROCESSES):
+    accounts = load_accounts(accounts_file)
+    summary = await sync_buildings(accounts, processes)
+    print(f"{'building':<16} {'locks':>6} {'eKeys':>7} {'cards':>7} {'seconds':>8}  error")
+    for building_id, s in summary.items():
+        print(f"{building_id:<16} {s['locks']:>6} {s['ekeys']:>7} {s['cards']:>7} {s['seconds']:>8}  {s['error'] or ''}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", default=ACCOUNTS_FILE)
+    parser.add_argument("--processes", type=int, default=SYNC_PROCESSES)
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.accounts, args.processes))
+    finally:
+        export_metrics()
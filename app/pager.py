@@ -0,0 +1,129 @@
+"""
+One pager for every paged, per-lock TTLock list endpoint.
+
+Each endpoint is described by a PageSpec: its path, the id field of its
+items, how an item maps to a registry record and when paging stops. The
+same paginate() then serves eKeys, IC cards, passcodes, fingerprints and
+lock records, so a new credential type is one more spec, not one more
+copy of the paging loop.
+
+While a page is being processed the next one is already in flight, and
+once page 1 has reported how many pages there are, up to `prefetch` of
+them are requested ahead. paginate_lock() runs several specs for one lock
+at once, so every credential type of a lock is fetched in the same pass.
+Requests wait on the caller's semaphore, which still caps how many are in
+flight in total.
+"""
+import asyncio
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+
+from instrumentation import get_logger, metrics
+from ratelimit import TTLockError
+
+# --- Configuration ---
+# Pages of one list requested ahead of the one being processed
+PAGE_PREFETCH = int(os.getenv("TTLOCK_PAGE_PREFETCH", "2"))
+# ---------------------
+
+log = get_logger("pager")
+
+
+def last_page(items: list, data: dict, page_no: int, page_size: int) -> bool:
+    """
+    Default stop condition: an empty page, the last page the API reports,
+    or (if it reports none) a page shorter than requested.
+    """
+    if not items:
+        return True
+    pages = data.get("pages")
+    if pages:
+        return page_no >= pages
+    return len(items) < page_size
+
+
+@dataclass(frozen=True)
+class PageSpec:
+    """A paged list endpoint taking lockId / pageNo / pageSize."""
+    kind: str                          # registry category and metrics label
+    path: str
+    id_field: str
+    page_size: int = 50
+    person: Callable | None = None     # item -> registry label
+    record: Callable | None = None     # (item, lock_name) -> (label, registry record)
+    date_field: str | None = None      # raw field holding the creation date
+    stop: Callable = last_page         # (items, page, page_no, page_size) -> True on the last page
+
+
+async def fetch_page(client, spec: PageSpec, lock_id, page_no: int, params: dict | None = None) -> dict:
+    """One page of `spec` for one lock; raises TTLockError on a non-zero errcode."""
+    data = await client.get_json(spec.path, lockId=lock_id, pageNo=str(page_no),
+                                 pageSize=str(spec.page_size), **(params or {}))
+    if data.get("errcode", 0) != 0:
+        raise TTLockError(spec.path, data.get("errcode"), data.get("errmsg"))
+    return data
+
+
+async def paginate(client, sem, spec: PageSpec, lock_id, lock_name, start_page: int = 1,
+                   on_page=None, params: dict | None = None, prefetch: int = PAGE_PREFETCH) -> list:
+    """
+    Pages through `spec` for a single lock, from `start_page` on.
+    Returns the raw items in page order. If `on_page` is given, each page's
+    items are handed to it (in page order) as soon as they arrive and
+    nothing is kept (an empty list is returned).
+    Any failed page fails the whole list: the client has already retried
+    transient errors, and a silently truncated list would look like revoked
+    credentials downstream.
+    """
+    async def fetch(page_no):
+        async with sem:
+            return await fetch_page(client, spec, lock_id, page_no, params)
+
+    items_all = []
+    ahead = deque([(start_page, asyncio.ensure_future(fetch(start_page)))])
+    next_page = start_page + 1
+    try:
+        while ahead:
+            page_no, task = ahead.popleft()
+            try:
+                data = await task
+            except Exception as e:
+                log.error(f"{spec.kind} page {page_no} ({lock_name}) failed: {e}")
+                raise
+            items = data.get("list", [])
+            if spec.stop(items, data, page_no, spec.page_size):
+                for _, pending in ahead:
+                    pending.cancel()
+                ahead.clear()
+            else:
+                # Queue the following pages before handling this one. Until the
+                # page count is known only the next page is a safe guess.
+                pages = data.get("pages")
+                limit = min(pages, page_no + max(1, prefetch)) if pages else page_no + 1
+                while next_page <= limit:
+                    ahead.append((next_page, asyncio.ensure_future(fetch(next_page))))
+                    next_page += 1
+
+            if items:
+                if on_page is not None:
+                    on_page(items)
+                else:
+                    items_all.extend(items)
+                metrics.inc("ttlock_pages_total", kind=spec.kind)
+                metrics.inc("ttlock_items_total", len(items), kind=spec.kind)
+                log.debug(f"Fetched {len(items)} {spec.kind} (page {page_no}) for {lock_name}")
+    finally:
+        for _, pending in ahead:
+            pending.cancel()
+        await asyncio.gather(*(pending for _, pending in ahead), return_exceptions=True)
+    return items_all
+
+
+async def paginate_lock(client, sem, specs, lock_id, lock_name, **kwargs) -> dict:
+    """Every spec in `specs` for one lock, side by side: {spec.kind: items}."""
+    results = await asyncio.gather(*(
+        paginate(client, sem, spec, lock_id, lock_name, **kwargs) for spec in specs
+    ))
+    return {spec.kind: items for spec, items in zip(specs, results)}
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import random
+import time
+from collections import defaultdict
+
+# --- Rate limit / retry configuration ---
+# Requests per second shared by every TTLock call made through one client
+RATE = float(os.getenv("TTLOCK_RATE", "20"))
+# Optional per-endpoint budgets, e.g. "/v3/lock/list=2,/v3/lock/listKey=10"
+ENDPOINT_RATES = os.getenv("TTLOCK_ENDPOINT_RATES", "")
+MAX_RETRIES = int(os.getenv("TTLOCK_MAX_RETRIES", "5"))
+
+# HTTP statuses worth retrying. 429/503 also mean "slow down".
+TRANSIENT_HTTP_STATUS = {429, 500, 502, 503, 504}
+THROTTLE_HTTP_STATUS = {429, 503}
+# TTLock errcodes worth retrying (1 = "failed", 90000 = internal server error)
+TRANSIENT_ERRCODES = {
+    int(c) for c in os.getenv("TTLOCK_TRANSIENT_ERRCODES", "1,90000").split(",") if c.strip()
+}
+# ---------------------
+
+
+class TTLockError(Exception):
+    """A TTLock call that failed with a non-zero errcode (after any retries)."""
+
+    def __init__(self, path, errcode, errmsg=None):
+        super().__init__(f"{path}: errcode={errcode} {errmsg or ''}".strip())
+        self.path = path
+        self.errcode = errcode
+        self.errmsg = errmsg
+
+
+def parse_endpoint_rates(spec: str) -> dict:
+    """'/v3/lock/list=2,/v3/lock/listKey=10' -> {'/v3/lock/list': 2.0, ...}"""
+    rates = {}
+    for part in spec.split(","):
+        if "=" in part:
+            path, rate = part.split("=", 1)
+            rates[path.strip()] = float(rate)
+    return rates
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, at most `burst` saved up.
+    Waiters queue on a lock, so requests are released in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> float:
+        """Takes one token, sleeping if needed. Returns the seconds waited."""
+        async with self._lock:
+            self._refill()
+            waited = 0.0
+            if self.tokens < 1:
+                waited = (1 - self.tokens) / self.rate
+                await asyncio.sleep(waited)
+                self._refill()
+            self.tokens -= 1
+            return waited
+
+
+class AdaptiveRateLimiter:
+    """
+    One global token bucket shared by all requests, plus an optional bucket
+    per endpoint path. A request must get a token from both.
+
+    The rate adapts AIMD-style: every throttle signal (HTTP 429/503) halves
+    the rate of the buckets involved, every success creeps it back up towards
+    the configured ceiling. So a concurrent sync runs as fast as the API
+    currently allows instead of as fast as we can send.
+    """
+
+    def __init__(self, rate: float = RATE, endpoint_rates: dict | None = None,
+                 min_rate: float = 0.5, increase: float = 0.05, decrease: float = 0.5):
+        self.max_rates = {None: rate}
+        self.buckets = {None: TokenBucket(rate)}
+        if endpoint_rates is None:
+            endpoint_rates = parse_endpoint_rates(ENDPOINT_RATES)
+        for path, path_rate in endpoint_rates.items():
+            self.max_rates[path] = path_rate
+            self.buckets[path] = TokenBucket(path_rate)
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+
+    def _involved(self, path):
+        return [self.buckets[None]] + ([self.buckets[path]] if path in self.buckets else [])
+
+    async def acquire(self, path: str) -> float:
+        waited = 0.0
+        for bucket in self._involved(path):
+            waited += await bucket.acquire()
+        return waited
+
+    def on_success(self, path: str):
+        for key in (None, path):
+            if key in self.buckets:
+                bucket = self.buckets[key]
+                ceiling = self.max_rates[key]
+                bucket.rate = min(ceiling, bucket.rate + ceiling * self.increase)
+
+    def on_throttle(self, path: str):
+        for bucket in self._involved(path):
+            bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+            # Drop the saved-up burst so the slow-down takes effect right away
+            bucket.tokens = min(bucket.tokens, 0.0)
+
+    def current_rates(self) -> dict:
+        return {key or "*": round(bucket.rate, 3) for key, bucket in self.buckets.items()}
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: sleep uniform(0, min(cap, base * 2**attempt))."""
+
+    def __init__(self, max_retries: int = MAX_RETRIES, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def new_metrics():
+    """Per-endpoint counters: {path: {"requests": n, "retries": n, ...}}."""
+    return defaultdict(lambda: {
+        "requests": 0,
+        "retries": 0,
+        "throttled": 0,
+        "failures": 0,
+        "rate_wait_s": 0.0,
+        "backoff_s": 0.0,
+    })
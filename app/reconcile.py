@@ -0,0 +1,266 @@
+"""
+Debt-driven access reconciliation.
+
+Works out, for every eKey and IC card, whether it should be blocked,
+unblocked or left alone, from the apartment's debt and monthly fee:
+
+- debt > max(MIN_BLOCK_DEBT, GRACE_MONTHS * monthly_fee)  -> block
+- debt <= RESTORE_MONTHS * monthly_fee                    -> unblock
+- anything in between, unknown apartments, EXEMPT_APTS   -> keep as is
+
+and compares that with the actual state (synced key status / card end
+date). Only the differences come out as actions, so credentials that are
+already right are never touched. Unblocking is limited to what the
+blocker itself blocked (a frozen eKey whose last successful action in
+the blocker log is a block, a card with a saved period): a card that
+simply expired or a key someone froze by hand stays as it is, whatever
+the apartment's debt. Apartments are per building: debt comes from the
+access DB's owners table and only applies to credentials of the same
+building_id. The desired/actual comparison is done
+column-wise in pandas; when a few payments arrive, Reconciler.update_debts
+re-evaluates only the apartments whose debt changed.
+
+Run from the app/ folder:
+    python reconcile.py                  # show the plan
+    python reconcile.py --apply          # execute it through blocker.apply_access
+
+apply_access sends each building's actions through that building's own
+account (see multi_sync.ACCOUNTS_FILE).
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from access_db import ACCESS_DB, CREDENTIALS_SQL, DEFAULT_BUILDING, open_access_db
+from blocker import BLOCK, BLOCK_LOG_DB, KEY_FROZEN, UNBLOCK, _last_results, open_log
+from instrumentation import get_logger
+
+# --- Configuration ---
+# Months of unpaid fees tolerated before access is blocked
+GRACE_MONTHS = float(os.getenv("TTLOCK_GRACE_MONTHS", "1"))
+# Never block for less than this, whatever the fee
+MIN_BLOCK_DEBT = float(os.getenv("TTLOCK_MIN_BLOCK_DEBT", "0"))
+# Access comes back once the debt is down to this many months (0 = fully paid)
+RESTORE_MONTHS = float(os.getenv("TTLOCK_RESTORE_MONTHS", "0"))
+# Apartments / offices that are never blocked, comma separated
+EXEMPT_APTS = {a.strip() for a in os.getenv("TTLOCK_EXEMPT_APTS", "").split(",") if a.strip()}
+# ---------------------
+
+log = get_logger("reconcile")
+
+KEEP = "keep"
+TARGET_COLUMNS = ["kind", "id", "lockId", "building_id", "apt_id", "label", "status", "startDate", "endDate",
+                  "synced_at"]
+APT_KEY = ["building_id", "apt_id"]
+
+
+def _with_building(df: pd.DataFrame) -> pd.DataFrame:
+    """Frames built without a building_id column belong to DEFAULT_BUILDING."""
+    return df if "building_id" in df.columns else df.assign(building_id=DEFAULT_BUILDING)
+
+
+def load_owners(db_path=ACCESS_DB) -> pd.DataFrame:
+    """
+    building_id, apt_id, monthly_fee, debt per apartment from the access DB's
+    owners table (largest fee / debt per apartment).
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        df = pd.read_sql_query("SELECT building_id, apt_id, monthly_fee, debt FROM owners", conn)
+    finally:
+        conn.close()
+    for col in ("monthly_fee", "debt"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0)
+    df["apt_id"] = df["apt_id"].astype(str)
+    return df.groupby(APT_KEY, as_index=False).agg(monthly_fee=("monthly_fee", "max"), debt=("debt", "max"))
+
+
+def load_credentials(db_path=ACCESS_DB) -> pd.DataFrame:
+    """Every eKey and card with its lock, building and apartment, in blocker target columns."""
+    conn = open_access_db(db_path)
+    try:
+        return pd.read_sql_query(CREDENTIALS_SQL, conn)
+    finally:
+        conn.close()
+
+
+def load_blocked_by_us(log_db=BLOCK_LOG_DB) -> set:
+    """
+    {(kind, cred_id)} the blocker has blocked and not unblocked since:
+    eKeys whose last successful action is a block, cards with a saved period.
+    """
+    conn = open_log(log_db)
+    try:
+        ours = {cred for cred, (action, _) in _last_results(conn).items() if cred[0] == "ekey" and action == BLOCK}
+        ours.update(("card", card_id) for (card_id,) in conn.execute("SELECT card_id FROM blocked_card_periods"))
+    finally:
+        conn.close()
+    return ours
+
+
+def desired_states(owners: pd.DataFrame, grace_months=GRACE_MONTHS, min_block_debt=MIN_BLOCK_DEBT,
+                   restore_months=RESTORE_MONTHS, exempt=EXEMPT_APTS) -> pd.Series:
+    """(building_id, apt_id) -> BLOCK / UNBLOCK / KEEP, computed for all apartments at once."""
+    owners = _with_building(owners)
+    fee, debt = owners["monthly_fee"].to_numpy(float), owners["debt"].to_numpy(float)
+    block_at = np.maximum(min_block_debt, grace_months * fee)
+    state = np.select(
+        [owners["apt_id"].isin(exempt).to_numpy(), debt > block_at, debt <= restore_months * fee],
+        [KEEP, BLOCK, UNBLOCK],
+        default=KEEP,
+    )
+    return pd.Series(state, index=pd.MultiIndex.from_frame(owners[APT_KEY]), name="desired")
+
+
+def blocked_by_us(creds: pd.DataFrame, ours: set) -> np.ndarray:
+    """Per credential row: is it in `ours` (see load_blocked_by_us)?"""
+    if not ours:
+        return np.zeros(len(creds), dtype=bool)
+    return np.fromiter((k in ours for k in zip(creds["kind"], creds["id"])), dtype=bool, count=len(creds))
+
+
+def actually_blocked(creds: pd.DataFrame, ours: np.ndarray, now: int) -> np.ndarray:
+    """
+    Blocked-or-not per credential row, by synced key status / card end date
+    (as blocker.already_applied judges it). Only eKeys synced without a
+    status fall back to `ours`.
+    """
+    end = pd.to_numeric(creds["endDate"], errors="coerce").fillna(0).to_numpy()
+    status = creds["status"]
+    frozen = np.where(status.notna().to_numpy(), status.astype(str).to_numpy() == KEY_FROZEN, ours)
+    return np.where(creds["kind"].to_numpy() == "ekey", frozen, (end > 0) & (end <= now))
+
+
+def _targets(rows: pd.DataFrame) -> list:
+    """DataFrame rows -> blocker target dicts (ints instead of numpy/float values)."""
+    targets = []
+    for r in rows[TARGET_COLUMNS].itertuples(index=False):
+        targets.append({
+            "kind": r.kind, "id": int(r.id), "building_id": r.building_id, "apt_id": r.apt_id, "label": r.label,
+            "lockId": int(r.lockId) if pd.notna(r.lockId) else None,
+            "status": r.status if pd.notna(r.status) else None,
+            "startDate": int(r.startDate) if pd.notna(r.startDate) else None,
+            "endDate": int(r.endDate) if pd.notna(r.endDate) else None,
+            "synced_at": int(r.synced_at) if pd.notna(r.synced_at) else None,
+        })
+    return targets
+
+
+class Reconciler:
+    """
+    Desired vs actual access state for every credential.
+
+    plan() diffs everything once; update_debts() takes new debts for a few
+    apartments and returns actions for their credentials only (apartments
+    whose desired state didn't change produce nothing). mark_applied()
+    feeds results back so the next plan doesn't repeat them.
+    `ours` is what the blocker has blocked (see load_blocked_by_us); only
+    those credentials are ever planned for unblocking.
+    """
+
+    def __init__(self, owners: pd.DataFrame, creds: pd.DataFrame, ours: set | None = None,
+                 now: int | None = None, **rules):
+        self.rules = rules
+        owners = _with_building(owners)
+        self.owners = owners.set_index(APT_KEY)
+        self.desired = desired_states(owners, **rules)
+        self.creds = _with_building(creds).reset_index(drop=True)
+        if "synced_at" not in self.creds.columns:
+            self.creds["synced_at"] = None
+        self.now = now or int(time.time() * 1000)
+        self.ours = blocked_by_us(self.creds, ours or set())
+        self.blocked = actually_blocked(self.creds, self.ours, self.now)
+        # (building_id, apt_id) -> row positions, (kind, id) -> row position
+        self._by_apt = {apt: rows for apt, rows in self.creds.groupby(APT_KEY).indices.items()}
+        self._by_cred = {k: i for i, k in enumerate(zip(self.creds["kind"], self.creds["id"]))}
+
+    def _diff(self, positions=None) -> dict:
+        creds = self.creds if positions is None else self.creds.iloc[positions]
+        blocked = self.blocked if positions is None else self.blocked[positions]
+        keys = pd.MultiIndex.from_frame(creds[APT_KEY])
+        desired = self.desired.reindex(keys).fillna(KEEP).to_numpy()
+        to_block = (desired == BLOCK) & ~blocked
+        ours = self.ours if positions is None else self.ours[positions]
+        to_unblock = (desired == UNBLOCK) & blocked & ours
+        return {BLOCK: _targets(creds[to_block]), UNBLOCK: _targets(creds[to_unblock])}
+
+    def plan(self) -> dict:
+        """{"block": [targets], "unblock": [targets]}: every credential not in its desired state."""
+        return self._diff()
+
+    def update_debts(self, debts: dict, building_id=DEFAULT_BUILDING) -> dict:
+        """
+        New debt values {apt_id: debt} for one building (e.g. after payments
+        were booked). Returns the actions for the affected apartments only.
+        """
+        changed = []
+        for apt, debt in debts.items():
+            apt = (building_id, str(apt))
+            if apt not in self.owners.index:
+                continue
+            self.owners.loc[apt, "debt"] = float(debt)
+            row = self.owners.loc[[apt]].reset_index()
+            new_state = desired_states(row, **self.rules).iloc[0]
+            if new_state != self.desired.get(apt):
+                self.desired[apt] = new_state
+                changed.append(apt)
+        positions = [p for apt in changed for p in self._by_apt.get(apt, ())]
+        if not positions:
+            return {BLOCK: [], UNBLOCK: []}
+        return self._diff(np.sort(np.asarray(positions)))
+
+    def mark_applied(self, results: list):
+        """
+        Records apply_access results: 'ok' and 'skipped' credentials are now
+        in the wanted state, and the ones that went 'ok' are (no longer)
+        blocked by us.
+        """
+        for r in results:
+            pos = self._by_cred.get((r["kind"], r["id"]))
+            if pos is not None and r["result"] in ("ok", "skipped"):
+                self.blocked[pos] = r["action"] == BLOCK
+                if r["result"] == "ok":
+                    self.ours[pos] = r["action"] == BLOCK
+
+
+def build_reconciler(access_db=ACCESS_DB, log_db=BLOCK_LOG_DB, **rules) -> Reconciler:
+    return Reconciler(load_owners(access_db), load_credentials(access_db), load_blocked_by_us(log_db), **rules)
+
+
+async def main():
+    from blocker import apply_access
+    from ttlock_api_GET import close_client
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="send the changes (default is a dry run)")
+    parser.add_argument("--grace-months", type=float, default=GRACE_MONTHS)
+    parser.add_argument("--min-debt", type=float, default=MIN_BLOCK_DEBT)
+    parser.add_argument("--restore-months", type=float, default=RESTORE_MONTHS)
+    args = parser.parse_args()
+
+    reconciler = build_reconciler(grace_months=args.grace_months, min_block_debt=args.min_debt,
+                                  restore_months=args.restore_months)
+    plan = reconciler.plan()
+    counts = reconciler.desired.value_counts().to_dict()
+    print(f"Apartments: {counts} -> {len(plan[BLOCK])} to block, {len(plan[UNBLOCK])} to unblock")
+
+    try:
+        for action in (UNBLOCK, BLOCK):
+            if plan[action]:
+                results = await apply_access(plan[action], action, dry_run=not args.apply)
+                reconciler.mark_applied(results)
+                for r in results:
+                    if r["result"] != "skipped":
+                        print(f"  {r['result']:<8} {action:<7} {r['kind']:<5} {r['id']:<12} "
+                              f"{r['building_id']} apt {r['apt_id']}")
+    finally:
+        await close_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
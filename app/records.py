@@ -0,0 +1,131 @@
+"""
+Compact record types for the access registry.
+
+A dict per credential repeats every key string and copies the lock name
+into every record. EKey / Card are frozen, slotted dataclasses holding
+integer ids and a reference to one shared Lock per lock, so the lock name
+is stored once. to_record() / from_record() convert to and from the JSON
+shape the rest of the app (database.py, delta_sync.py) reads and writes.
+"""
+import sys
+from dataclasses import dataclass
+
+
+def _int(v):
+    return int(v) if v is not None else None
+
+
+def _intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+
+@dataclass(frozen=True, slots=True)
+class Lock:
+    lock_id: int
+    name: str | None
+
+
+class LockTable:
+    """One Lock instance per lock id (names interned), shared by every record on that lock."""
+
+    def __init__(self):
+        self._locks = {}
+
+    def get(self, lock_id, name=None) -> Lock:
+        lock_id = _int(lock_id)
+        lock = self._locks.get(lock_id)
+        if lock is None or (name is not None and lock.name != name):
+            lock = self._locks[lock_id] = Lock(lock_id, _intern(name))
+        return lock
+
+
+@dataclass(frozen=True, slots=True)
+class EKey:
+    key_id: int
+    lock: Lock
+    username: str | None
+    status: str | None
+
+    @property
+    def id(self):
+        return self.key_id
+
+    @classmethod
+    def from_item(cls, k: dict, lock: Lock) -> "EKey":
+        """From a raw /v3/lock/listKey item."""
+        return cls(_int(k.get("keyId")), lock, k.get("username"), _intern(k.get("keyStatus")))
+
+    @classmethod
+    def from_record(cls, r: dict, locks: LockTable) -> "EKey":
+        """From a registry JSON record (see to_record)."""
+        return cls(_int(r.get("keyId")), locks.get(r.get("lockId"), r.get("lockName")),
+                   r.get("username"), _intern(r.get("status")))
+
+    def to_record(self) -> dict:
+        """Same keys and order as ttlock_api_GET._ekey_record."""
+        return {"username": self.username, "lockId": self.lock.lock_id, "keyId": self.key_id,
+                "status": self.status, "lockName": self.lock.name}
+
+
+@dataclass(frozen=True, slots=True)
+class Card:
+    card_id: int
+    lock: Lock
+    card_number: str | None
+    start_date: int | None
+    end_date: int | None
+    create_date: int | None
+
+    @property
+    def id(self):
+        return self.card_id
+
+    @classmethod
+    def from_item(cls, c: dict, lock: Lock) -> "Card":
+        """From a raw /v3/identityCard/list item."""
+        return cls(_int(c.get("cardId")), lock, c.get("cardNumber"), _int(c.get("startDate")),
+                   _int(c.get("endDate")), _int(c.get("createDate")))
+
+    @classmethod
+    def from_record(cls, r: dict, locks: LockTable) -> "Card":
+        return cls(_int(r.get("cardId")), locks.get(r.get("lockId"), r.get("lockName")),
+                   r.get("cardNumber"), _int(r.get("startDate")), _int(r.get("endDate")),
+                   _int(r.get("createDate")))
+
+    def to_record(self) -> dict:
+        """Same keys and order as ttlock_api_GET._card_record."""
+        return {"cardNumber": self.card_number, "lockId": self.lock.lock_id, "cardId": self.card_id,
+                "startDate": self.start_date, "endDate": self.end_date,
+                "createDate": self.create_date, "lockName": self.lock.name}
+
+
+RECORD_TYPES = {"ekeys": EKey, "cards": Card}
+
+
+def json_default(obj):
+    """json.dump(registry, f, default=json_default) writes compact records in the dict shape."""
+    if isinstance(obj, (EKey, Card)):
+        return obj.to_record()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def to_dict_registry(registry: dict) -> dict:
+    """Compact registry -> the plain {"ekeys": {person: [dict]}, "cards": ...} shape."""
+    return {
+        category: {person: [r.to_record() if isinstance(r, (EKey, Card)) else r for r in records]
+                   for person, records in people.items()}
+        for category, people in registry.items()
+    }
+
+
+def to_compact_registry(registry: dict, locks: LockTable | None = None) -> dict:
+    """
+    Plain dict registry (e.g. loaded from building_access_master.json) -> compact records.
+    Categories without a compact type (passcodes, fingerprints) are kept as they are.
+    """
+    locks = locks or LockTable()
+    return {
+        category: {person: [RECORD_TYPES[category].from_record(r, locks) for r in records]
+                   for person, records in people.items()} if category in RECORD_TYPES else people
+        for category, people in registry.items()
+    }
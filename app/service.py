@@ -0,0 +1,304 @@
+"""
+Read-only HTTP API over the access data.
+
+Every access answer is served from an in-process snapshot: JSON bodies and
+their ETags are rendered once when the snapshot is built, so a request is a
+dict lookup (plus a 304 if the client already has that ETag). A background
+task rebuilds the snapshot from TTLock every REFRESH_INTERVAL seconds and
+swaps it in; requests never wait on TTLock. Until the first refresh
+finishes, the snapshot comes from building_access_full.db.
+
+Apartments are per building: /buildings/{building_id}/apartments/{apt_id}
+serves any building in the access DB, /apartments/{apt_id} the default
+one. A refresh re-reads the default building from TTLock; the others
+(synced by multi_sync.py) come from the access DB.
+
+Run from the app/ folder:
+    uvicorn service:app --port 8000
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
+
+import db
+from access_db import ACCESS_DB, DEFAULT_BUILDING, buildings
+from access_index import AccessIndex
+from instrumentation import get_logger
+
+# --- Configuration ---
+# Seconds between TTLock refreshes (0 = never refresh, serve the access DB only)
+REFRESH_INTERVAL = float(os.getenv("TTLOCK_REFRESH_INTERVAL", "900"))
+# ---------------------
+
+log = get_logger("service")
+
+def _owners(db_path=ACCESS_DB) -> dict:
+    """(building_id, apt_id) -> [{owner_name, debt}] from the owners table of the access DB."""
+    owners = {}
+    if not os.path.exists(db_path):
+        return owners
+    conn = sqlite3.connect(db_path)
+    try:
+        for building_id, apt_id, name, debt in conn.execute(
+            "SELECT building_id, apt_id, owner_name, debt FROM owners ORDER BY owner_row"
+        ):
+            owners.setdefault((building_id, apt_id), []).append({"owner_name": name, "debt": debt})
+    except sqlite3.OperationalError:
+        pass  # DB from before the normalized schema
+    finally:
+        conn.close()
+    return owners
+
+
+def _debt(owner_rows) -> float:
+    total = 0.0
+    for row in owner_rows:
+        try:
+            total = max(total, float(row["debt"]))
+        except (TypeError, ValueError):
+            pass
+    return total
+
+
+class Rendered:
+    """A JSON body rendered once, with its ETag."""
+    __slots__ = ("body", "etag")
+
+    def __init__(self, payload):
+        self.body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+
+
+class Snapshot:
+    """
+    Everything the access endpoints serve, pre-rendered from one AccessIndex
+    per building and the owners table. Immutable once built; a refresh
+    builds a new one.
+    """
+
+    def __init__(self, indexes: dict, owners: dict, source: str):
+        self.indexes = indexes  # building_id -> AccessIndex
+        self.source = source
+        self.built_at = time.time()
+
+        def lock_names(index, lock_ids):
+            return [index.lock_names.get(l, l) for l in lock_ids]
+
+        self.apartments = {}  # (building_id, apt_id) -> Rendered
+        self.locks = {}
+        self.debtors = []
+        for building_id in set(indexes) | {b for b, _ in owners}:
+            index = indexes.get(building_id) or AccessIndex()
+            apt_ids = set(index.apt_mask) | {apt for b, apt in owners if b == building_id}
+            for apt_id in apt_ids:
+                rows = owners.get((building_id, apt_id), [])
+                persons = sorted(index.apt_persons.get(apt_id, ()))
+                apt_locks = lock_names(index, index.locks_of_apartment(apt_id))
+                self.apartments[(building_id, apt_id)] = Rendered({
+                    "building_id": building_id,
+                    "apt_id": apt_id,
+                    "owners": rows,
+                    "debt": _debt(rows),
+                    "locks": apt_locks,
+                    "persons": {p: lock_names(index, index.locks_of_person(p)) for p in persons},
+                })
+                if _debt(rows) > 0:
+                    self.debtors.append({"building_id": building_id, "apt_id": apt_id, "debt": _debt(rows),
+                                         "owners": [r["owner_name"] for r in rows], "locks": apt_locks})
+
+            for lock_id in index.lock_ids:
+                persons = sorted(index.lock_persons.get(lock_id, ()))
+                rendered = Rendered({
+                    "lock_id": lock_id,
+                    "building_id": building_id,
+                    "name": index.lock_names.get(lock_id),
+                    "persons": persons,
+                    "apartments": sorted({index.person_apt[p] for p in persons if index.person_apt.get(p)}),
+                })
+                self.locks[str(lock_id)] = rendered
+                if index.lock_names.get(lock_id):
+                    self.locks[index.lock_names[lock_id]] = rendered
+
+        self.debtors.sort(key=lambda d: -d["debt"])
+        self._debtor_views = {}
+
+    def debtors_over(self, min_debt: float) -> Rendered:
+        view = self._debtor_views.get(min_debt)
+        if view is None:
+            view = Rendered([d for d in self.debtors if d["debt"] > min_debt])
+            if len(self._debtor_views) < 64:  # keep the common thresholds only
+                self._debtor_views[min_debt] = view
+        return view
+
+
+def _indexes(db_path=ACCESS_DB) -> dict:
+    """building_id -> AccessIndex for every building in the access DB."""
+    if not os.path.exists(db_path):
+        return {}
+    try:
+        building_ids = buildings(db_path)
+    except sqlite3.OperationalError:
+        # Written before buildings existed: it all belongs to the default one
+        return {DEFAULT_BUILDING: AccessIndex.from_db(db_path)}
+    return {b: AccessIndex.from_db(db_path, building_id=b) for b in building_ids}
+
+
+def snapshot_from_db(db_path=ACCESS_DB) -> Snapshot:
+    return Snapshot(_indexes(db_path), _owners(db_path), source=db_path)
+
+
+async def snapshot_from_ttlock(db_path=ACCESS_DB) -> Snapshot | None:
+    """Syncs every lock from TTLock. Returns None (keep the old snapshot) if the API is unavailable."""
+    from identity import IDENTITY_DB, identity_map
+    from ttlock_api_GET import ACCESS_KINDS, get_lock_list, sync_access_IC_ekey
+
+    locks = await get_lock_list()
+    if not locks:
+        return None
+    registry = await sync_access_IC_ekey(locks, kinds=ACCESS_KINDS)
+
+    def build():
+        # TTLock (the default account) replaces the default building; the
+        # other buildings are kept as multi_sync last wrote them
+        indexes = _indexes(db_path)
+        # Labels create_databases matched to an apartment by name keep it
+        label_apts = identity_map("label") if os.path.exists(IDENTITY_DB) else {}
+        indexes[DEFAULT_BUILDING] = AccessIndex.from_registry(registry, person_apts=label_apts)
+        return Snapshot(indexes, _owners(db_path), source="ttlock")
+
+    return await asyncio.to_thread(build)
+
+
+class State:
+    snapshot: Snapshot = None
+    refreshing: asyncio.Lock = None
+    last_error: str | None = None
+    last_refresh_s: float | None = None
+    manual_refresh: asyncio.Task = None
+
+
+state = State()
+
+
+def _error_summary(e: Exception) -> str:
+    """
+    What /health may show about a failed refresh: the exception type plus the
+    HTTP status or TTLock errcode. Never the message, which can hold the
+    request URL and with it the access token.
+    """
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    if status is not None:
+        return f"{type(e).__name__}: HTTP {status}"
+    errcode = getattr(e, "errcode", None)
+    if errcode is not None:
+        return f"{type(e).__name__}: {e.path} errcode={errcode}"
+    return type(e).__name__
+
+
+async def refresh():
+    """Rebuilds the snapshot from TTLock (one refresh at a time) and swaps it in."""
+    if state.refreshing.locked():
+        return
+    async with state.refreshing:
+        start = time.perf_counter()
+        try:
+            snapshot = await snapshot_from_ttlock()
+            if snapshot is not None:
+                state.snapshot = snapshot
+                state.last_error = None
+            else:
+                state.last_error = "lock list unavailable"
+        except Exception as e:
+            state.last_error = _error_summary(e)
+            log.warning(f"Background refresh failed: {state.last_error}")
+        state.last_refresh_s = time.perf_counter() - start
+
+
+async def _refresh_loop():
+    while True:
+        await refresh()
+        await asyncio.sleep(REFRESH_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    state.refreshing = asyncio.Lock()
+    state.snapshot = await asyncio.to_thread(snapshot_from_db)
+    task = asyncio.create_task(_refresh_loop()) if REFRESH_INTERVAL > 0 else None
+    try:
+        yield
+    finally:
+        if task is not None:
+            task.cancel()
+        if "ttlock_api_GET" in sys.modules:  # only loaded once a refresh ran
+            await sys.modules["ttlock_api_GET"].close_client()
+        db.close_connections()
+
+
+app = FastAPI(title="Building access", lifespan=lifespan)
+
+
+def _send(request: Request, rendered: Rendered | None) -> Response:
+    if rendered is None:
+        return Response(b'{"detail":"Not Found"}', status_code=404, media_type="application/json")
+    headers = {"ETag": rendered.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == rendered.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(rendered.body, media_type="application/json", headers=headers)
+
+
+@app.get("/health")
+async def health():
+    snap = state.snapshot
+    return {
+        "source": snap.source,
+        "age_s": round(time.time() - snap.built_at, 1),
+        "buildings": sorted(snap.indexes),
+        "apartments": len(snap.apartments),
+        "locks": sum(len(index.lock_ids) for index in snap.indexes.values()),
+        "last_refresh_s": state.last_refresh_s,
+        "last_error": state.last_error,
+    }
+
+
+@app.post("/refresh", status_code=202)
+async def trigger_refresh():
+    """Starts a TTLock refresh in the background and returns immediately."""
+    state.manual_refresh = asyncio.create_task(refresh())  # keep a reference until it's done
+    return {"refreshing": True}
+
+
+@app.get("/apartments/{apt_id}/access")
+async def apartment_access(apt_id: str, request: Request):
+    """Apartment `apt_id` of the default building."""
+    return _send(request, state.snapshot.apartments.get((DEFAULT_BUILDING, apt_id)))
+
+
+@app.get("/buildings/{building_id}/apartments/{apt_id}/access")
+async def building_apartment_access(building_id: str, apt_id: str, request: Request):
+    return _send(request, state.snapshot.apartments.get((building_id, apt_id)))
+
+
+@app.get("/locks/{lock}/access")
+async def lock_access(lock: str, request: Request):
+    """`lock` is a lock id or a lock name."""
+    return _send(request, state.snapshot.locks.get(lock))
+
+
+@app.get("/debtors")
+async def debtors(request: Request, min_debt: float = 0.0):
+    return _send(request, state.snapshot.debtors_over(min_debt))
+
+
+@app.get("/tenants/{flat_number}")
+def tenant_status(flat_number: int, request: Request):
+    """Credit / access status from access_control.db (one indexed read on a pooled connection)."""
+    row = db.get_tenant_info(flat_number)
+    return _send(request, Rendered(dict(zip(db.TENANT_COLUMNS, row))) if row else None)
@@ -0,0 +1,46 @@
+"""
+Tests for access_index.AccessIndex queries. Run from the app/ folder:
+    python -m pytest test_access_index.py
+"""
+import pytest
+
+from access_index import AccessIndex
+
+
+def make_index():
+    idx = AccessIndex()
+    idx.add("ekey", 1, "01", 10, "Parking 1")
+    idx.add("ekey", 2, "01", 11, "Hall")
+    idx.add("ekey", 3, "02", 11, "Hall")
+    return idx
+
+
+def test_lock_mask_by_id_and_name():
+    idx = make_index()
+    assert idx.lock_mask([10, "Hall"]) == 0b11
+
+
+def test_lock_mask_unknown_lock_raises():
+    with pytest.raises(KeyError, match="Parkng 1"):
+        make_index().lock_mask(["Parkng 1"])
+
+
+def test_persons_with_unknown_all_of_raises():
+    # Dropping the typo would have answered "everyone"
+    with pytest.raises(KeyError):
+        make_index().persons_with(all_of=["Parkng 1"])
+
+
+def test_apartments_with_unknown_none_of_raises():
+    with pytest.raises(KeyError):
+        make_index().apartments_with(all_of=["Hall"], none_of=[99])
+
+
+def test_persons_with():
+    idx = make_index()
+    assert idx.persons_with(all_of=["Hall"], none_of=["Parking 1"]) == ["02"]
+    assert sorted(idx.persons_with(any_of=[10, 11])) == ["01", "02"]
+
+
+def test_persons_on_unknown_lock_is_empty():
+    assert make_index().persons_on_lock("nowhere") == set()
@@ -0,0 +1,197 @@
+"""
+Tests for reconcile.Reconciler. Run from the app/ folder:
+    python -m pytest test_reconcile.py
+"""
+import asyncio
+
+import pandas as pd
+
+import blocker
+from access_db import DEFAULT_BUILDING, replace_building
+from blocker import BLOCK, KEY_FROZEN, KEY_NORMAL, UNBLOCK, apply_access, debtor_targets, open_log
+from multi_sync import Account
+from reconcile import Reconciler, load_blocked_by_us, load_credentials, load_owners
+
+NOW = 1_700_000_000_000
+PAST = NOW - 86_400_000
+RULES = {"grace_months": 1, "min_block_debt": 0, "restore_months": 0, "exempt": set()}
+
+
+def make_owners():
+    # apt 1 owes 5 months -> block, apt 2 is paid up -> unblock, apt 3 within grace -> keep
+    return pd.DataFrame({"apt_id": ["1", "2", "3"], "monthly_fee": [100.0] * 3, "debt": [500.0, 0.0, 50.0]})
+
+
+def make_creds():
+    rows = [
+        ("ekey", 10, "1", KEY_NORMAL, None),
+        ("card", 20, "1", None, 0),
+        ("ekey", 11, "2", KEY_FROZEN, None),   # frozen by the blocker
+        ("ekey", 12, "2", KEY_FROZEN, None),   # frozen by hand
+        ("card", 21, "2", None, PAST),         # expired on its own
+        ("card", 22, "2", None, PAST),         # blocked by the blocker
+        ("ekey", 13, "3", KEY_NORMAL, None),
+    ]
+    return pd.DataFrame([
+        {"kind": kind, "id": cred_id, "lockId": 1, "apt_id": apt, "label": apt,
+         "status": status, "startDate": None, "endDate": end}
+        for kind, cred_id, apt, status, end in rows
+    ])
+
+
+def make_reconciler():
+    return Reconciler(make_owners(), make_creds(), {("ekey", 11), ("card", 22)}, now=NOW, **RULES)
+
+
+def ids(targets):
+    return sorted((t["kind"], t["id"]) for t in targets)
+
+
+def results(targets, action, result="ok"):
+    return [{"kind": t["kind"], "id": t["id"], "action": action, "result": result} for t in targets]
+
+
+def test_plan_blocks_debtors():
+    plan = make_reconciler().plan()
+    assert ids(plan[BLOCK]) == [("card", 20), ("ekey", 10)]
+
+
+def test_plan_only_unblocks_what_the_blocker_blocked():
+    plan = make_reconciler().plan()
+    assert ids(plan[UNBLOCK]) == [("card", 22), ("ekey", 11)]
+
+
+def test_plan_targets_are_blocker_targets():
+    target = next(t for t in make_reconciler().plan()[BLOCK] if t["kind"] == "card")
+    assert target == {"kind": "card", "id": 20, "building_id": DEFAULT_BUILDING, "apt_id": "1", "label": "1",
+                      "lockId": 1, "status": None, "startDate": None, "endDate": 0, "synced_at": None}
+
+
+def test_mark_applied_ok_clears_the_plan():
+    reconciler = make_reconciler()
+    plan = reconciler.plan()
+    reconciler.mark_applied(results(plan[BLOCK], BLOCK) + results(plan[UNBLOCK], UNBLOCK))
+    assert reconciler.plan() == {BLOCK: [], UNBLOCK: []}
+
+
+def test_mark_applied_keeps_errors_in_the_plan():
+    reconciler = make_reconciler()
+    plan = reconciler.plan()
+    reconciler.mark_applied(results(plan[BLOCK], BLOCK, result="error"))
+    assert ids(reconciler.plan()[BLOCK]) == ids(plan[BLOCK])
+
+
+def test_update_debts_unblocks_after_payment():
+    reconciler = make_reconciler()
+    reconciler.mark_applied(results(reconciler.plan()[BLOCK], BLOCK))
+    actions = reconciler.update_debts({"1": 0})
+    assert actions[BLOCK] == []
+    assert ids(actions[UNBLOCK]) == [("card", 20), ("ekey", 10)]
+
+
+def test_update_debts_only_touches_changed_apartments():
+    reconciler = make_reconciler()
+    actions = reconciler.update_debts({3: 1000, "1": 450, "99": 1000})
+    assert ids(actions[BLOCK]) == [("ekey", 13)]
+    assert actions[UNBLOCK] == []
+
+
+def test_skipped_block_is_not_unblocked_later():
+    reconciler = make_reconciler()
+    reconciler.update_debts({"2": 1000})
+    # ekey 12 was already frozen by hand: apply_access skips it
+    reconciler.mark_applied([{"kind": "ekey", "id": 12, "action": BLOCK, "result": "skipped"}])
+    actions = reconciler.update_debts({"2": 0})
+    assert ("ekey", 12) not in ids(actions[UNBLOCK])
+
+
+def test_load_blocked_by_us(tmp_path):
+    log_db = tmp_path / "block_actions.db"
+    conn = open_log(log_db)
+    with conn:
+        conn.executemany("INSERT INTO block_actions (run_id, ts, kind, cred_id, lock_id, apt_id, action, result) "
+                         "VALUES ('r', ?, 'ekey', ?, 1, '1', ?, ?)", [
+            (1, 10, BLOCK, "ok"),
+            (1, 11, BLOCK, "ok"), (2, 11, UNBLOCK, "ok"),
+            (1, 12, BLOCK, "error"),
+        ])
+        conn.execute("INSERT INTO blocked_card_periods VALUES (20, 1, 0, 0)")
+    conn.close()
+    assert load_blocked_by_us(log_db) == {("ekey", 10), ("card", 20)}
+
+
+def test_debt_applies_to_its_own_building_only(tmp_path):
+    access_db = str(tmp_path / "access.db")
+    # Apartment 1 exists in both buildings; only vake's owes
+    for building_id, key_id, debt in (("vake", 100, 900.0), ("saburtalo", 200, 0.0)):
+        owners = pd.DataFrame({"apt_id": ["1"], "monthly_fee": [100.0], "debt": [debt]})
+        replace_building(building_id, [(1, "01", "1")], {1: "Gate"},
+                         [(key_id, 1, 1, "user", KEY_NORMAL)], [], owners, db_path=access_db)
+
+    owners = load_owners(access_db)
+    assert sorted(zip(owners["building_id"], owners["debt"])) == [("saburtalo", 0.0), ("vake", 900.0)]
+    reconciler = Reconciler(owners, load_credentials(access_db), now=NOW, **RULES)
+    assert ids(reconciler.plan()[BLOCK]) == [("ekey", 100)]
+
+    actions = reconciler.update_debts({"1": 900}, building_id="saburtalo")
+    assert ids(actions[BLOCK]) == [("ekey", 200)]
+
+
+class FakeClient:
+    """Records which eKeys were frozen through it."""
+
+    def __init__(self):
+        self.frozen = []
+
+    async def freeze_ekey(self, key_id):
+        self.frozen.append(key_id)
+        return {"errcode": 0}
+
+    async def aclose(self):
+        pass
+
+
+def test_each_building_is_blocked_through_its_own_account(tmp_path, monkeypatch):
+    access_db = str(tmp_path / "access.db")
+    for building_id, key_id in (("vake", 100), ("saburtalo", 200)):
+        owners = pd.DataFrame({"apt_id": ["1"], "monthly_fee": [100.0], "debt": [900.0]})
+        replace_building(building_id, [(1, "01", "1")], {key_id: "Gate"},
+                         [(key_id, 1, key_id, "user", KEY_NORMAL)], [], owners, db_path=access_db)
+    clients = {"vake": FakeClient(), "saburtalo": FakeClient()}
+    monkeypatch.setattr(blocker, "account_client", lambda account: clients[account.building_id])
+    accounts = {b: Account(b, f"{b}-client", access_token="t") for b in clients}
+
+    targets = debtor_targets(access_db)
+    assert sorted((t["building_id"], t["id"]) for t in targets) == [("saburtalo", 200), ("vake", 100)]
+    results = asyncio.run(apply_access(targets, BLOCK, log_db=tmp_path / "log.db", accounts=accounts))
+    assert {(r["building_id"], r["result"]) for r in results} == {("vake", "ok"), ("saburtalo", "ok")}
+    assert clients["vake"].frozen == [100] and clients["saburtalo"].frozen == [200]
+
+
+def test_building_without_account_is_an_error(tmp_path):
+    target = {"kind": "ekey", "id": 1, "building_id": "nowhere", "apt_id": "1", "lockId": 1, "status": KEY_NORMAL}
+    [result] = asyncio.run(apply_access([target], BLOCK, log_db=tmp_path / "log.db", accounts={}))
+    assert result["result"] == "error" and "nowhere" in result["detail"]
+
+
+def blocked_key_rerun(tmp_path, synced_at):
+    """Blocks eKey 1 at NOW, then re-runs the block on a sync taken at `synced_at` that still shows it normal."""
+    log_db = tmp_path / "log.db"
+    conn = open_log(log_db)
+    with conn:
+        conn.execute("INSERT INTO block_actions (run_id, ts, kind, cred_id, lock_id, apt_id, action, result) "
+                     "VALUES ('r', ?, 'ekey', 1, 1, '1', ?, 'ok')", (NOW, BLOCK))
+    conn.close()
+    client = FakeClient()
+    target = {"kind": "ekey", "id": 1, "apt_id": "1", "lockId": 1, "status": KEY_NORMAL, "synced_at": synced_at}
+    [result] = asyncio.run(apply_access([target], BLOCK, client=client, log_db=log_db))
+    return result["result"], client.frozen
+
+
+def test_stale_sync_does_not_resend(tmp_path):
+    assert blocked_key_rerun(tmp_path, synced_at=PAST) == ("skipped", [])
+
+
+def test_sync_after_the_block_wins(tmp_path):
+    # Unfrozen by hand after we blocked it
+    assert blocked_key_rerun(tmp_path, synced_at=NOW + 1) == ("ok", [1])
@@ -0,0 +1,45 @@
+"""
+Tests for transactions_ingest. Run from the app/ folder:
+    python -m pytest test_transactions_ingest.py
+"""
+from database import build_apt_partner_map
+from transactions_ingest import ingest_transactions, load_apt_partner_map
+
+HEADER = "Bank statement\nDate,Partner's Name,Description\n"
+
+
+def write_csv(path, rows):
+    path.write_text(HEADER + "".join(f"{date},{partner},{desc}\n" for date, partner, desc in rows), encoding="utf-8")
+
+
+def test_latest_date_wins_across_chunks(tmp_path):
+    csv_path = tmp_path / "trans.csv"
+    write_csv(csv_path, [("01/03/2025", "NEW OWNER", "apt 5"), ("01/01/2024", "OLD OWNER", "apt 5")])
+    ingest_transactions(csv_path, db_path=tmp_path / "fin.db", chunksize=1, date_col="Date")
+    assert load_apt_partner_map(tmp_path / "fin.db") == {"5": "NEW OWNER"}
+
+
+def test_appended_older_payment_does_not_win(tmp_path):
+    csv_path, db_path = tmp_path / "trans.csv", tmp_path / "fin.db"
+    # Past the hashed head of the file, so appending resumes from the checkpoint
+    padding = [("01/01/2020", "SOMEONE", "service fee")] * 3000
+    rows = padding + [("01/03/2025", "NEW OWNER", "apt 5")]
+    write_csv(csv_path, rows)
+    ingest_transactions(csv_path, db_path=db_path, date_col="Date")
+    write_csv(csv_path, rows + [("01/01/2024", "OLD OWNER", "apt 5"), ("01/03/2025", "CO-OWNER", "apt 5")])
+    assert ingest_transactions(csv_path, db_path=db_path, date_col="Date") == 2
+    # Same date as NEW OWNER, later row
+    assert load_apt_partner_map(db_path) == {"5": "CO-OWNER"}
+
+
+def test_ingest_matches_the_full_read(tmp_path):
+    import pandas as pd
+
+    csv_path = tmp_path / "trans.csv"
+    write_csv(csv_path, [
+        ("02/02/2025", "A", "apt 1"), ("", "B", "apt 1"), ("05/01/2025", "C", "apt 2"),
+        ("01/01/2025", "D", "apt 2"), ("03/02/2025", "E", "apt 01"),
+    ])
+    ingest_transactions(csv_path, db_path=tmp_path / "fin.db", chunksize=2, date_col="Date")
+    full = build_apt_partner_map(pd.read_csv(csv_path, skiprows=1), date_col="Date")
+    assert load_apt_partner_map(tmp_path / "fin.db") == full == {"1": "E", "2": "C"}
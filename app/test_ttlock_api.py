@@ -2,7 +2,8 @@ import httpx
 import os
 import time
 from dotenv import load_dotenv
-import hashlib
+from auth import TokenManager, hash_password_md5
+from instrumentation import debug_body, get_logger
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,10 +16,8 @@ USERNAME = os.getenv("TTLOCK_USERNAME")
 PLAIN_PASSWORD = os.getenv("TTLOCK_PASSWORD")
 # ---------------------
 
+log = get_logger("api_test")
 
-def hash_password_md5(password: str) -> str:
-    """Encrypts a plain-text password using MD5 and returns the 32-character lowercase hash."""
-    return hashlib.md5(password.encode('utf-8')).hexdigest()
 
 # async def get_access_token() -> str:
 #     """
@@ -91,12 +90,12 @@ async def get_lock_list(token: str, group_id: int | None = None):
     async with httpx.AsyncClient(timeout=10.0) as client:
         response = await client.get(url, params=params)
 
-        # print the final URL for exact parity check with curl
-        print("REQUEST URL:", response.url)
+        # final URL for exact parity check with curl (accessToken is redacted)
+        log.debug(f"REQUEST URL: {response.url}")
+        log.info(f"STATUS: {response.status_code}")
 
-        # always print raw response for debugging
-        print("STATUS:", response.status_code)
-        print("RAW RESPONSE:", response.text)
+        # raw response only with TTLOCK_DEBUG_BODIES=1
+        debug_body(log, path, response.text)
 
         # quick HTTP error handling
         if response.status_code >= 400:
@@ -109,7 +108,7 @@ async def get_lock_list(token: str, group_id: int | None = None):
             return None
 
         if data.get("errcode") != 0:
-            print("TTLock error:", data.get("errcode"), data.get("errmsg"))
+            log.error(f"TTLock error: {data.get('errcode')} {data.get('errmsg')}")
             return None
 
         return data.get("list", [])
@@ -270,8 +269,9 @@ def display_user_report(user_registry):
     print("="*80)
 
 async def main():
-    # Use your confirmed token
-    CONFIRMED_TOKEN = "e1986129bee22be76156c95a076a0f40" # "7f37b29390e92b7255c87b63d87a966b" This is 20skavtaradze token.
+    # Cached / refreshed by the token manager (needs TTLOCK_USERNAME + TTLOCK_PASSWORD,
+    # otherwise TTLOCK_ACCESS_TOKEN is used as is)
+    CONFIRMED_TOKEN = await TokenManager().get_token()
     
     # # 1. Get the lock list
     # locks = await get_lock_list(CONFIRMED_TOKEN)
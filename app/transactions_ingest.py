@@ -0,0 +1,223 @@
+import csv
+import hashlib
+import io
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from instrumentation import get_logger, metrics
+
+# --- Configuration ---
+FIN_DB = 'financial_data.db'
+CHUNK_SIZE = 50_000
+# Bytes hashed at the start of the file and just before the checkpoint
+HASH_WINDOW = 64 * 1024
+# ---------------------
+
+log = get_logger("ingest")
+
+
+def _sha1(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def _read_window(f, start, end) -> bytes:
+    f.seek(max(0, start))
+    return f.read(max(0, end - max(0, start)))
+
+
+def _header(f, skiprows):
+    """
+    Returns (column names, byte offset where the data rows start).
+    The first `skiprows` lines are a title, the next line is the header.
+    """
+    f.seek(0)
+    for _ in range(skiprows):
+        f.readline()
+    header_line = f.readline()
+    columns = next(csv.reader([header_line.decode('utf-8-sig')]))
+    return columns, f.tell()
+
+
+def open_ingest_db(db_path=FIN_DB):
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+            source TEXT PRIMARY KEY,
+            byte_offset INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            head_hash TEXT NOT NULL,
+            tail_hash TEXT NOT NULL,
+            columns TEXT NOT NULL,
+            updated_at INTEGER NOT NULL
+        );
+        -- The payment that names each apartment's partner: latest paid_at, then latest row
+        CREATE TABLE IF NOT EXISTS apt_partners (
+            apt_id TEXT PRIMARY KEY,
+            partner TEXT,
+            row_no INTEGER NOT NULL,
+            paid_at TEXT                   -- ISO date from date_col, NULL without one
+        );
+        -- Every payer with the last apartment its descriptions mention (see database.payer_rows)
+        CREATE TABLE IF NOT EXISTS payer_apts (
+            partner TEXT PRIMARY KEY,
+            apt_id TEXT,
+            seq INTEGER NOT NULL           -- orders payers by first payment
+        );
+    """)
+    # Databases from before paid_at: their rows count as undated
+    if "paid_at" not in {row[1] for row in conn.execute("PRAGMA table_info(apt_partners)")}:
+        conn.execute("ALTER TABLE apt_partners ADD COLUMN paid_at TEXT")
+        conn.commit()
+    return conn
+
+
+def _create_transactions_table(conn, columns):
+    cols = ", ".join(f'"{c}" TEXT' for c in columns)
+    conn.execute("DROP TABLE IF EXISTS transactions")
+    conn.execute(f"CREATE TABLE transactions (row_no INTEGER PRIMARY KEY, {cols})")
+    conn.execute("DELETE FROM apt_partners")
+    conn.execute("DELETE FROM payer_apts")
+
+
+def _upsert_payers(conn, chunk, first_row):
+    """Folds one chunk of rows (starting at row `first_row`) into payer_apts; later mentions win."""
+    from database import payer_rows
+
+    conn.executemany(
+        "INSERT INTO payer_apts (partner, apt_id, seq) VALUES (?, ?, ?) "
+        "ON CONFLICT(partner) DO UPDATE SET apt_id = excluded.apt_id WHERE excluded.apt_id IS NOT NULL",
+        [(partner, apt, first_row + i) for i, (partner, apt) in enumerate(payer_rows(chunk))],
+    )
+
+
+def _backfill_payers(conn, columns, chunksize):
+    """Builds payer_apts once from the stored transactions (files ingested before it existed)."""
+    if "Partner's Name" not in columns:
+        return
+    if conn.execute("SELECT 1 FROM payer_apts LIMIT 1").fetchone():
+        return
+    if not conn.execute("SELECT 1 FROM transactions LIMIT 1").fetchone():
+        return
+    col_list = ", ".join(f'"{c}"' for c in ("Partner's Name", "Description") if c in columns)
+    log.info("Building payer_apts from the ingested transactions")
+    first_row = 0
+    with conn:
+        for chunk in pd.read_sql_query(f"SELECT {col_list} FROM transactions ORDER BY row_no", conn,
+                                       chunksize=chunksize):
+            _upsert_payers(conn, chunk, first_row)
+            first_row += len(chunk)
+
+
+def ingest_transactions(csv_path, db_path=FIN_DB, skiprows=1, chunksize=CHUNK_SIZE, date_col=None):
+    """
+    Loads only the rows appended to the bank CSV since the last run.
+
+    A checkpoint per file keeps the byte offset reached last time, the row
+    count, and hashes of the first HASH_WINDOW bytes and of the bytes just
+    before the offset. If both hashes still match, only the bytes after the
+    offset are parsed (chunked read_csv) and upserted into `transactions`,
+    keyed by their row number in the file. If the file was rewritten,
+    truncated or got a new header, everything is ingested from scratch.
+
+    The apartment -> payment partner map is kept up to date in `apt_partners`
+    from the new rows only, and so is every payer's apartment in `payer_apts`
+    (as in payer_rows). A stored partner is only replaced by a payment that
+    build_apt_partner_map would also pick: a later `date_col` date (undated
+    rows lose to dated ones), or the same date and a later row.
+    Returns the number of rows ingested this run.
+    """
+    from database import apt_partner_rows
+
+    source = os.path.abspath(csv_path)
+    size = os.path.getsize(csv_path)
+    conn = open_ingest_db(db_path)
+    try:
+        with open(csv_path, 'rb') as f:
+            columns, data_start = _header(f, skiprows)
+            head_hash = _sha1(_read_window(f, 0, HASH_WINDOW))
+
+            cp = conn.execute(
+                "SELECT byte_offset, rows, head_hash, tail_hash, columns FROM ingest_checkpoints WHERE source = ?",
+                (source,),
+            ).fetchone()
+            resume = (
+                cp is not None
+                and cp[4] == "\x1f".join(columns)
+                and cp[2] == head_hash
+                and cp[0] <= size
+                and cp[3] == _sha1(_read_window(f, cp[0] - HASH_WINDOW, cp[0]))
+            )
+            if resume:
+                offset, row_no = cp[0], cp[1]
+                _backfill_payers(conn, columns, chunksize)
+            else:
+                log.info(f"No valid checkpoint for {csv_path}, ingesting from the start")
+                offset, row_no = data_start, 0
+                _create_transactions_table(conn, columns)
+
+            f.seek(offset)
+            new_bytes = f.read(size - offset)
+            tail_hash = _sha1(_read_window(f, size - HASH_WINDOW, size))
+
+        start_rows = row_no
+        if new_bytes.strip():
+            placeholders = ", ".join("?" * (len(columns) + 1))
+            col_list = ", ".join(f'"{c}"' for c in columns)
+            updates = ", ".join(f'"{c}" = excluded."{c}"' for c in columns)
+            reader = pd.read_csv(io.BytesIO(new_bytes), header=None, names=columns, dtype=str,
+                                 chunksize=chunksize)
+            with conn:
+                for chunk in reader:
+                    chunk.index = range(row_no, row_no + len(chunk))
+                    conn.executemany(
+                        f"INSERT INTO transactions (row_no, {col_list}) VALUES ({placeholders}) "
+                        f"ON CONFLICT(row_no) DO UPDATE SET {updates}",
+                        [(i, *(None if pd.isna(v) else v for v in row))
+                         for i, row in zip(chunk.index, chunk.itertuples(index=False, name=None))],
+                    )
+                    conn.executemany(
+                        "INSERT INTO apt_partners (apt_id, partner, row_no, paid_at) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(apt_id) DO UPDATE SET partner = excluded.partner, "
+                        "row_no = excluded.row_no, paid_at = excluded.paid_at "
+                        # (paid_at, row_no) order, NULL dates first
+                        "WHERE (excluded.paid_at IS NOT NULL AND (apt_partners.paid_at IS NULL "
+                        "       OR excluded.paid_at > apt_partners.paid_at)) "
+                        "   OR (excluded.paid_at IS apt_partners.paid_at AND excluded.row_no >= apt_partners.row_no)",
+                        [(apt, partner, int(i), None if pd.isna(date) else date.isoformat())
+                         for i, apt, partner, date in apt_partner_rows(chunk, date_col).itertuples(name=None)],
+                    )
+                    _upsert_payers(conn, chunk, int(chunk.index[0]))
+                    row_no += len(chunk)
+
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ingest_checkpoints VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source, size, row_no, head_hash, tail_hash, "\x1f".join(columns), int(time.time())),
+            )
+    finally:
+        conn.close()
+
+    metrics.inc("transactions_ingested_total", row_no - start_rows)
+    log.info(f"Ingested {row_no - start_rows} new transactions ({row_no} total) from {csv_path}")
+    return row_no - start_rows
+
+
+def load_apt_partner_map(db_path=FIN_DB) -> dict:
+    """apt_id -> partner name, as maintained by ingest_transactions."""
+    conn = open_ingest_db(db_path)
+    try:
+        return dict(conn.execute("SELECT apt_id, partner FROM apt_partners"))
+    finally:
+        conn.close()
+
+
+def load_payer_rows(db_path=FIN_DB) -> list:
+    """(partner, apt_id or None) per payer, as maintained by ingest_transactions; same as payer_rows."""
+    conn = open_ingest_db(db_path)
+    try:
+        return conn.execute("SELECT partner, apt_id FROM payer_apts ORDER BY seq").fetchall()
+    finally:
+        conn.close()
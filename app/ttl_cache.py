@@ -0,0 +1,75 @@
+import json
+import os
+import time
+
+
+class TTLCache:
+    """
+    Small key -> JSON-able value cache with a time-to-live.
+
+    Values live in memory and, if `path` is given, in a JSON file on disk so
+    a fresh process can reuse them until they expire. Hits and misses are
+    counted in `stats` (memory_hits / disk_hits / misses).
+    """
+
+    def __init__(self, ttl: float, path: str | None = None):
+        self.ttl = ttl
+        self.path = path
+        self._memory = {}  # key -> (stored_at, value)
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _fresh(self, stored_at):
+        return time.time() - stored_at < self.ttl
+
+    def _read_disk(self) -> dict:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # A corrupt cache file is just a miss
+            return {}
+
+    def get(self, key: str):
+        """Returns the cached value, or None if missing or expired."""
+        entry = self._memory.get(key)
+        if entry and self._fresh(entry[0]):
+            self.stats["memory_hits"] += 1
+            return entry[1]
+
+        disk_entry = self._read_disk().get(key)
+        if disk_entry and self._fresh(disk_entry["stored_at"]):
+            self.stats["disk_hits"] += 1
+            self._memory[key] = (disk_entry["stored_at"], disk_entry["value"])
+            return disk_entry["value"]
+
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value):
+        stored_at = time.time()
+        self._memory[key] = (stored_at, value)
+        if not self.path:
+            return
+        entries = self._read_disk()
+        entries[key] = {"stored_at": stored_at, "value": value}
+        # Write-then-rename so a crash never leaves half a cache file
+        # (per-process temp name: several sync workers may share the file)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def invalidate(self, key: str | None = None):
+        """Drops one key (or everything) from memory and disk."""
+        if key is None:
+            self._memory.clear()
+            entries = {}
+        else:
+            self._memory.pop(key, None)
+            entries = self._read_disk()
+            entries.pop(key, None)
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False)
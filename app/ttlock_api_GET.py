@@ -1,7 +1,15 @@
-import httpx
+import asyncio
+import json
 import os
 from dotenv import load_dotenv
-from utils import now_ms
+from ttlock_client import TTLockClient
+from auth import TokenManager
+from ttl_cache import TTLCache
+from access_index import AccessIndex
+from records import RECORD_TYPES, LockTable, json_default
+from pager import PageSpec, paginate, paginate_lock
+from instrumentation import export_metrics, get_logger, metrics
+from utils import load_locks
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,219 +19,387 @@ BASE_URL = os.getenv("TTLOCK_API_URL")
 CLIENT_ID = os.getenv("TTLOCK_CLIENT_ID")
 CLIENT_SECRET = os.getenv("TTLOCK_CLIENT_SECRET")
 ACCESS_TOKEN = os.getenv("TTLOCK_ACCESS_TOKEN")
+# Max TTLock requests in flight during a sync (1 = one at a time)
+SYNC_CONCURRENCY = int(os.getenv("TTLOCK_SYNC_CONCURRENCY", "8"))
+PAGE_SIZE = 50
+# "full" refetches everything, "delta" uses the credential snapshot (delta_sync.py),
+# "stream" writes NDJSON page by page (export_access_ndjson)
+SYNC_MODE = os.getenv("TTLOCK_SYNC_MODE", "full")
+# Lock list is paged 100 at a time and cached for LOCK_LIST_TTL seconds
+LOCK_PAGE_SIZE = 100
+LOCK_LIST_TTL = float(os.getenv("TTLOCK_LOCK_LIST_TTL", "3600"))
+LOCK_CACHE_FILE = os.getenv("TTLOCK_LOCK_CACHE_FILE", "lock_list_cache.json")
+# Locks to sync (JSON file or "id=name,id,..."); unset = every lock on the account
+SYNC_LOCKS = os.getenv("TTLOCK_LOCKS")
+# Used when the lock list can't be fetched
+FALLBACK_LOCKS = os.getenv("TTLOCK_FALLBACK_LOCKS", "locks.json")
+REGISTRY_FILE = os.getenv("TTLOCK_REGISTRY_FILE", "building_access_master_2.json")
+NDJSON_FILE = os.getenv("TTLOCK_NDJSON_FILE", "building_access_master.ndjson")
+CHANGES_FILE = os.getenv("TTLOCK_CHANGES_FILE", "building_access_changes.json")
+# Credential types an export downloads by default (any of ekeys, cards, passcodes,
+# fingerprints); stream mode writes all of them to the NDJSON
+SYNC_KINDS = os.getenv("TTLOCK_SYNC_KINDS", "ekeys,cards,passcodes,fingerprints")
+# The ones the access DB, reports and blocker are built from. Syncs feeding
+# them ask for just these, so a passcode / fingerprint error can't fail them.
+ACCESS_KINDS = "ekeys,cards"
 # ---------------------
 
-# Assuming BASE_URL is still https://euapi.ttlock.com
-async def get_lock_list():
-    # normalize BASE_URL to avoid double slashes
-    base = BASE_URL.rstrip('/')
-    path = '/v3/lock/list'
-    url = f"{base}{path}"
-
-    params = {
-        "clientId": CLIENT_ID,
-        "accessToken": ACCESS_TOKEN,
-        "pageNo": "1",
-        "pageSize": "20",
-        "date": now_ms,
-    }
+_client = None
+lock_list_cache = TTLCache(LOCK_LIST_TTL, LOCK_CACHE_FILE)
+log = get_logger("sync")
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.get(url, params=params)
+def _count_page(kind, items):
+    metrics.inc("ttlock_pages_total", kind=kind)
+    metrics.inc("ttlock_items_total", len(items), kind=kind)
 
-        # print the final URL for exact parity check with curl
-        print("REQUEST URL:", response.url)
+def get_client() -> TTLockClient:
+    """
+    Returns the process-wide TTLockClient, creating it on first use.
+    Every sync in this process shares its connection pool.
+    """
+    global _client
+    if _client is None:
+        # Logs in with TTLOCK_USERNAME / TTLOCK_PASSWORD if set, else uses ACCESS_TOKEN as is
+        tokens = TokenManager(BASE_URL, CLIENT_ID, CLIENT_SECRET, access_token=ACCESS_TOKEN)
+        _client = TTLockClient(BASE_URL, CLIENT_ID, ACCESS_TOKEN, tokens=tokens)
+    return _client
 
-        # always print raw response for debugging
-        print("STATUS:", response.status_code)
-        print("RAW RESPONSE:", response.text)
+async def close_client():
+    """Closes the shared client (call once on shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
 
-        # quick HTTP error handling
-        if response.status_code >= 400:
-            return None
+# Assuming BASE_URL is still https://euapi.ttlock.com
+async def get_lock_list(client: TTLockClient | None = None, group_id: int | None = None,
+                        use_cache: bool = True, cache: TTLCache | None = None):
+    """
+    Returns every lock on the account (optionally only those in `group_id`).
 
-        # try parse JSON
+    Pages through /v3/lock/list until the last page, so accounts with more
+    than one page of locks are no longer truncated. The result is cached
+    (memory + LOCK_CACHE_FILE) for LOCK_LIST_TTL seconds, so repeated syncs
+    inside the TTL make no lock-list requests at all. Hit/miss counters are
+    in lock_list_cache.stats. Returns None on an API error.
+
+    Pass `cache` to use another TTLCache instead (multi_sync gives each
+    building its own file, since token-only accounts have no username to
+    tell them apart in the key).
+    """
+    client = client or get_client()
+    cache = cache or lock_list_cache
+    # One app (client_id) can serve several TTLock accounts: key on the user too
+    user = client.tokens.username if client.tokens and client.tokens.username else ""
+    cache_key = f"{client.client_id}:{user}:{group_id if group_id is not None else '*'}"
+    if use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            log.info(f"Lock list: {len(cached)} locks from cache")
+            return cached
+
+    locks = []
+    page = 1
+    while True:
         try:
-            data = response.json()
-        except Exception:
+            data = await client.list_locks(page, LOCK_PAGE_SIZE, group_id=group_id)
+        except Exception as e:
+            log.error(f"Exception fetching lock list page {page}: {e}")
             return None
 
-        if data.get("errcode") != 0:
-            print("TTLock error:", data.get("errcode"), data.get("errmsg"))
+        if data.get("errcode", 0) != 0:
+            log.error(f"TTLock error fetching lock list: {data.get('errcode')} {data.get('errmsg')}")
             return None
 
-        return data.get("list", [])
+        items = data.get("list", [])
+        locks.extend(items)
+        _count_page("locks", items)
+        log.debug(f"Fetched {len(items)} locks (Page {page})")
+
+        # Stop on a short page, or once the API says there are no more pages
+        if len(items) < LOCK_PAGE_SIZE or page >= (data.get("pages") or page + 1):
+            break
+        page += 1
+
+    cache.set(cache_key, locks)
+    return locks
+
+def _ekey_person(k):
+    return k.get("keyName") or k.get("username") or "Unknown"
+
+def _card_person(c):
+    return c.get("cardName") or "Unnamed Card"
+
+def _ekey_record(k, lock_name):
+    """Maps a raw eKey item to (person, registry record)."""
+    person = _ekey_person(k)
+    return person, {
+        "username": k.get("username"),
+        "lockId": k.get("lockId"),
+        "keyId": k.get("keyId"),
+        "status": k.get("keyStatus"),
+        "lockName": lock_name # Added for context
+    }
+
+def _card_record(c, lock_name):
+    """Maps a raw IC card item to (person, registry record)."""
+    person = _card_person(c)
+    return person, {
+        "cardNumber": c.get("cardNumber"),
+        "lockId": c.get("lockId"),
+        "cardId": c.get("cardId"),
+        "startDate": c.get("startDate"),
+        "endDate": c.get("endDate"),
+        "createDate": c.get("createDate"),
+        "lockName": lock_name
+    }
+
+def _passcode_person(p):
+    return p.get("keyboardPwdName") or "Unnamed Passcode"
+
+def _fingerprint_person(f):
+    return f.get("fingerprintName") or "Unnamed Fingerprint"
+
+def _passcode_record(p, lock_name):
+    """Maps a raw keyboard passcode item to (person, registry record). The code itself is not copied."""
+    person = _passcode_person(p)
+    return person, {
+        "lockId": p.get("lockId"),
+        "keyboardPwdId": p.get("keyboardPwdId"),
+        "keyboardPwdType": p.get("keyboardPwdType"),
+        "startDate": p.get("startDate"),
+        "endDate": p.get("endDate"),
+        "sendDate": p.get("sendDate"),
+        "lockName": lock_name
+    }
+
+def _fingerprint_record(f, lock_name):
+    """Maps a raw fingerprint item to (person, registry record)."""
+    person = _fingerprint_person(f)
+    return person, {
+        "lockId": f.get("lockId"),
+        "fingerprintId": f.get("fingerprintId"),
+        "fingerprintType": f.get("fingerprintType"),
+        "startDate": f.get("startDate"),
+        "endDate": f.get("endDate"),
+        "createDate": f.get("createDate"),
+        "lockName": lock_name
+    }
+
+# Every credential type a lock can hold, in registry order
+CREDENTIAL_SPECS = {
+    "ekeys": PageSpec("ekeys", "/v3/lock/listKey", "keyId", PAGE_SIZE,
+                      _ekey_person, _ekey_record, "date"),
+    "cards": PageSpec("cards", "/v3/identityCard/list", "cardId", PAGE_SIZE,
+                      _card_person, _card_record, "createDate"),
+    "passcodes": PageSpec("passcodes", "/v3/lock/listKeyboardPwd", "keyboardPwdId", PAGE_SIZE,
+                          _passcode_person, _passcode_record, "sendDate"),
+    "fingerprints": PageSpec("fingerprints", "/v3/fingerprint/list", "fingerprintId", PAGE_SIZE,
+                             _fingerprint_person, _fingerprint_record, "createDate"),
+}
+
+def credential_specs(kinds=SYNC_KINDS) -> list:
+    """PageSpecs for `kinds` (a list or "ekeys,cards,..."), in CREDENTIAL_SPECS order."""
+    if isinstance(kinds, str):
+        kinds = [k.strip() for k in kinds.split(",") if k.strip()]
+    unknown = set(kinds) - set(CREDENTIAL_SPECS)
+    if unknown:
+        raise ValueError(f"Unknown credential kinds: {', '.join(sorted(unknown))}")
+    return [spec for kind, spec in CREDENTIAL_SPECS.items() if kind in kinds]
 
-async def sync_access_IC_ekey(locks: list):
+def _add_items(master_registry, kind, items, lock_name, lock=None):
     """
-    Fetches both eKeys and IC Cards for all locks.
-    Groups them into a single 'Master Registry' for database import.
+    Groups raw items of one credential type into master_registry[kind] by person.
+    With a shared `lock` (see records.LockTable), eKeys and cards become
+    compact EKey / Card records; the other types stay dicts.
     """
+    spec = CREDENTIAL_SPECS[kind]
+    people = master_registry.setdefault(kind, {})
+    compact_type = RECORD_TYPES.get(kind) if lock is not None else None
+    for item in items:
+        if compact_type is not None:
+            people.setdefault(spec.person(item), []).append(compact_type.from_item(item, lock))
+        else:
+            person, record = spec.record(item, lock_name)
+            people.setdefault(person, []).append(record)
+
+async def sync_access_IC_ekey(locks: list, concurrency: int = SYNC_CONCURRENCY,
+                              client: TTLockClient | None = None, compact: bool = False,
+                              kinds=SYNC_KINDS):
+    """
+    Fetches every credential type in `kinds` (eKeys, IC cards, passcodes,
+    fingerprints) for all locks.
+    Groups them into a single 'Master Registry' for database import:
+    {kind: {person: [record, ...]}}.
+
+    Every lock, and every credential list inside each lock, runs as a
+    separate asyncio task paged by pager.paginate, so an extra type costs
+    no extra serial round-trips. At most `concurrency` requests are in
+    flight at once (1 = one request at a time, like the old serial loop).
+    Requests go through `client` (default: the shared get_client() pool).
+    Results are merged in the order of `locks`, so the registry is identical
+    no matter which request finishes first.
+    With compact=True eKeys and cards are EKey / Card objects (see records.py)
+    instead of dicts; json.dump them with default=records.json_default.
+    """
+    specs = credential_specs(kinds)
     # master_registry structure:
-    master_registry = {"ekeys": {}, "cards": {}}
-    pageSize = 50
+    master_registry = {spec.kind: {} for spec in specs}
+    concurrency = max(1, int(concurrency))
+    sem = asyncio.Semaphore(concurrency)
+
+    async def fetch_lock(lock):
+        lock_id = lock.get('lockId') or lock.get('id')
+        lock_name = lock.get('lockAlias') or lock.get('name')
+        log.debug(f"Processing lock {lock_name}")
+        per_kind = await paginate_lock(client, sem, specs, lock_id, lock_name)
+        log.debug(f"Done: {lock_name}")
+        return lock_id, lock_name, per_kind
+
+    client = client or get_client()
+    with metrics.span("sync"):
+        results = await asyncio.gather(*(fetch_lock(lock) for lock in locks))
+
+    with metrics.span("merge"):
+        # Merge in lock order -> same registry as a one-by-one sync
+        lock_table = LockTable()
+        for lock_id, lock_name, per_kind in results:
+            lock = lock_table.get(lock_id, lock_name) if compact else None
+            for kind, items in per_kind.items():
+                _add_items(master_registry, kind, items, lock_name, lock)
+
+    log.info(f"Synced {len(locks)} locks", extra={"fields": {
+        spec.kind: sum(len(r[2][spec.kind]) for r in results) for spec in specs}})
+    return master_registry
+
+async def export_access_ndjson(path: str, locks: list, concurrency: int = SYNC_CONCURRENCY,
+                              client: TTLockClient | None = None, kinds=SYNC_KINDS):
+    """
+    Streaming alternative to sync_access_IC_ekey + json.dump.
+
+    Every page is written to `path` as newline-delimited JSON the moment it
+    arrives, one flat record per credential:
+        {"kind": "ekey"|"card"|"passcode"|"fingerprint", "person": ..., "lockId": ..., "id": ..., "status": ..., ...}
+    followed by the rest of the registry fields (username, cardNumber, dates, lockName).
+    Memory stays at roughly one page per running request, and readers can
+    tail the file while the sync is still going. Record order follows arrival,
+    not lock order. Returns the number of records written.
+    """
+    client = client or get_client()
+    sem = asyncio.Semaphore(max(1, int(concurrency)))
+    specs = credential_specs(kinds)
+    written = 0
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        for lock in locks:
+    with open(path, "w", encoding="utf-8") as f:
+        def writer(spec, lock_name):
+            kind = spec.kind[:-1]  # "ekeys" -> "ekey"
+            def on_page(items):
+                nonlocal written
+                lines = []
+                for item in items:
+                    person, record = spec.record(item, lock_name)
+                    flat = {"kind": kind, "person": person, "lockId": record.get("lockId"),
+                            "id": item.get(spec.id_field), "status": record.get("status")}
+                    flat.update(record)
+                    lines.append(json.dumps(flat, ensure_ascii=False) + "\n")
+                f.write("".join(lines))
+                f.flush()
+                written += len(lines)
+            return on_page
+
+        async def fetch_lock(lock):
             lock_id = lock.get('lockId') or lock.get('id')
             lock_name = lock.get('lockAlias') or lock.get('name')
-            print(f"--- Processing Lock: {lock_name} ---")
-
-            # ==========================================
-            # 1. FETCH E-KEYS - PAGINATED
-            # ==========================================
-            page = 1
-            while True:
-                ekey_url = f"{BASE_URL}/v3/lock/listKey"
-                ekey_params = {
-                    "clientId": CLIENT_ID, "accessToken": ACCESS_TOKEN,
-                    "lockId": lock_id, 
-                    "pageNo": str(page), 
-                    "pageSize": str(pageSize), 
-                    "date": now_ms()
-                }
-
-                try:
-                    resp = await client.get(ekey_url, params=ekey_params)
-                    data = resp.json()
-                except Exception as e:
-                    print(f"  [!] Exception fetching eKeys page {page}: {e}")
-                    break
-
-                # FIX: Check if errcode is 0 (Success) or missing (Success)
-                # '0 is None' is False, so previous code failed on success.
-                if data.get("errcode", 0) != 0:
-                    print(f"  [!] API Error eKeys: {data}")
-                    break
-
-                items = data.get("list", [])
-                if not items:
-                    break  # Stop if list is empty
-
-                # Process this page
-                for k in items:
-                    person = k.get("keyName") or k.get("username") or "Unknown"
-                    if person not in master_registry["ekeys"]:
-                        master_registry["ekeys"][person] = []
-                    
-                    master_registry["ekeys"][person].append({
-                        "username": k.get("username"),
-                        "lockId": k.get("lockId"),
-                        "keyId": k.get("keyId"),
-                        "status": k.get("keyStatus"),
-                        "lockName": lock_name # Added for context
-                    })
-                
-                print(f"  -> Fetched {len(items)} eKeys (Page {page})")
-
-                # If fewer items than requested, we are on the last page
-                # And the infinite while loop breaks
-                if len(items) < pageSize:
-                    break
-                page += 1
-            
-            # ==========================================
-            # 2. FETCH IC CARDS - PAGINATED -> Same download logic -> different URL and Storing logic
-            # ==========================================
-            page = 1
-            while True:
-                card_url = f"{BASE_URL}/v3/identityCard/list"
-                card_params = {
-                    "clientId": CLIENT_ID, "accessToken": ACCESS_TOKEN,
-                    "lockId": lock_id, 
-                    "pageNo": str(page), 
-                    "pageSize": str(pageSize), 
-                    "date": now_ms()
-                }
-
-                try:
-                    resp = await client.get(card_url, params=card_params)
-                    data = resp.json()
-                except Exception as e:
-                    print(f"  [!] Exception fetching Cards page {page}: {e}")
-                    break
-
-                # FIX: Correct Error Check
-                if data.get("errcode", 0) != 0:
-                    print(f"  [!] API Error Cards: {data}")
-                    break
-
-                items = data.get("list", [])
-                if not items:
-                    break
-
-                # Process this page
-                for c in items:
-                    person = c.get("cardName") or "Unnamed Card"
-                    if person not in master_registry["cards"]:
-                        master_registry["cards"][person] = []
-                    
-                    master_registry["cards"][person].append({
-                        "cardNumber": c.get("cardNumber"),
-                        "lockId": c.get("lockId"),
-                        "cardId": c.get("cardId"),
-                        "startDate": c.get("startDate"),
-                        "endDate": c.get("endDate"),
-                        "createDate": c.get("createDate"),
-                        "lockName": lock_name
-                    })
-
-                print(f"  -> Fetched {len(items)} Cards (Page {page})")
-
-                if len(items) < pageSize:
-                    break
-                page += 1
-            
-            print(f"Done : {lock_name}")
+            log.debug(f"Processing lock {lock_name}")
+            await asyncio.gather(*(
+                paginate(client, sem, spec, lock_id, lock_name, on_page=writer(spec, lock_name))
+                for spec in specs
+            ))
+            log.debug(f"Done: {lock_name}")
 
-    return master_registry
+        with metrics.span("stream"):
+            await asyncio.gather(*(fetch_lock(lock) for lock in locks))
+
+    return written
 
 def display_user_report(user_registry):
-    """Prints a clean summary of who has access to what."""
+    """
+    Prints a clean summary of who has access to what.
+    Takes an AccessIndex or a master registry (indexed on the fly).
+    """
+    index = user_registry if isinstance(user_registry, AccessIndex) else AccessIndex.from_registry(user_registry)
     print("\n" + "="*80)
     print(f"{'USERNAME':<30} | {'ACCESS TO LOCKS'}")
     print("-" * 80)
     
-    for user, lock_list in user_registry.items():
+    for user in index.person_mask:
         # Combine lock names into a string for display
-        lock_names = ", ".join([l['lockName'] for l in lock_list])
+        lock_names = ", ".join(str(index.lock_names.get(l, l)) for l in index.locks_of_person(user))
         print(f"{user:<30} | {lock_names}")
     print("="*80)
 
-async def main():
-    # # 1. Get the lock list
-    # locks = await get_lock_list(CONFIRMED_TOKEN)
-    # #############
-    # OR Use below during development
-    # ##############
-    # 8 locks extracted from previous command above
-    locks = [
-    {"lockId": 26986212, "name": "ტერასა (Terrace)"},
-    {"lockId": 26436420, "name": "II Hall Door"},
-    {"lockId": 26411294, "name": "Parking 2"},
-    {"lockId": 26382284, "name": "Parking 1"},
-    {"lockId": 26294486, "name": "I Hall Door"},
-    {"lockId": 22474898, "name": "II Hall Elevator"},
-    {"lockId": 22166420, "name": "Right [I Hall]"},
-    {"lockId": 21127013, "name": "Left [I Hall]"}
-    ]
+async def main(mode: str = SYNC_MODE, locks: list | None = None, output: str = REGISTRY_FILE):
+    """
+    One sync run. `locks` defaults to TTLOCK_LOCKS, else the account's whole
+    lock list (every page, cached for LOCK_LIST_TTL).
+    """
+    # 1. Get the lock list
+    locks = locks or load_locks(SYNC_LOCKS)
+    whole_account = False
+    if not locks:
+        locks = await get_lock_list()
+        whole_account = bool(locks)
+        log.info(f"Lock list cache: {lock_list_cache.stats}")
+
+    if not locks:
+        # API unavailable -> fall back to the locks in TTLOCK_FALLBACK_LOCKS
+        locks = load_locks(FALLBACK_LOCKS)
     
+    if locks and mode == "stream":
+        # Write records out page by page instead of building the registry
+        try:
+            count = await export_access_ndjson(NDJSON_FILE, locks)
+        finally:
+            await close_client()
+        log.info(f"{count} records streamed to {NDJSON_FILE}")
+        return
+
     if locks:
         # Map users to those locks
-        user_data = await sync_access_IC_ekey(locks)
+        try:
+            if mode == "delta":
+                # Only re-download locks whose fingerprint changed
+                from delta_sync import sync_access_delta
+                user_data, changes = await sync_access_delta(locks, kinds=ACCESS_KINDS, complete=whole_account)
+            else:
+                user_data, changes = await sync_access_IC_ekey(locks, compact=True, kinds=ACCESS_KINDS), None
+            # Retries / rate-limit waits per endpoint
+            log.info(f"API metrics: {get_client().metrics_summary()}")
+        finally:
+            await close_client()
         
         # Print the report
         #display_user_report(user_data)
         
         # Save to a JSON
-        import json
         # with open("user_lock_map.json", "w", encoding="utf-8") as f:
         #     json.dump(user_data, f, ensure_ascii=False, indent=4)
 
-        with open("building_access_master_2.json", "w", encoding="utf-8") as f:
-            json.dump(user_data, f, ensure_ascii=False, indent=4)
-        print("\nData exported to building_access_master.json")
+        if changes is not None:
+            with open(CHANGES_FILE, "w", encoding="utf-8") as f:
+                json.dump(changes, f, ensure_ascii=False)
+            log.info(f"Change set exported to {CHANGES_FILE}")
+            if not any(changes[k] for k in ("added", "removed", "modified")):
+                log.info(f"No credential changes, keeping {output}")
+                return
+
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(user_data, f, ensure_ascii=False, indent=4, default=json_default)
+        log.info(f"Data exported to {output}")
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    finally:
+        # JSON summary or Prometheus text, if TTLOCK_METRICS_FILE is set
+        export_metrics()
\ No newline at end of file
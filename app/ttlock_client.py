@@ -0,0 +1,262 @@
+import asyncio
+import importlib.util
+import os
+import time
+from typing import TypedDict
+
+import httpx
+from dotenv import load_dotenv
+from utils import now_ms
+from instrumentation import debug_body, get_logger, metrics
+from auth import INVALID_TOKEN_ERRCODES, TokenManager
+from ratelimit import (AdaptiveRateLimiter, RetryPolicy, TTLockError, new_metrics,
+                       THROTTLE_HTTP_STATUS, TRANSIENT_ERRCODES, TRANSIENT_HTTP_STATUS)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Connection pool configuration ---
+MAX_CONNECTIONS = int(os.getenv("TTLOCK_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("TTLOCK_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("TTLOCK_KEEPALIVE_EXPIRY", "30"))
+HTTP2 = os.getenv("TTLOCK_HTTP2", "0").lower() in ("1", "true", "yes")
+# ---------------------
+
+log = get_logger("client")
+
+
+class TTLockPage(TypedDict, total=False):
+    """One page of a TTLock list endpoint (lock list, eKey list, card list)."""
+    list: list
+    pageNo: int
+    pageSize: int
+    pages: int
+    total: int
+    errcode: int
+    errmsg: str
+
+
+class TTLockClient:
+    """
+    One long-lived, pooled connection to the TTLock Open API.
+
+    The underlying httpx.AsyncClient is created on first use and kept open,
+    so TCP/TLS handshakes and keep-alive connections are shared by every call
+    made through this object. clientId, accessToken and the `date` timestamp
+    are filled in on every request.
+
+    All JSON calls share one AdaptiveRateLimiter and are retried with
+    jittered exponential backoff on transient HTTP errors and errcodes.
+    Per-endpoint counters (requests, retries, waits) are kept in `metrics`.
+
+    Use it as `async with TTLockClient() as client: ...` or call aclose()
+    when the process shuts down.
+    """
+
+    def __init__(self, base_url: str | None = None, client_id: str | None = None,
+                 access_token: str | None = None, *, timeout: float = 15.0,
+                 max_connections: int = MAX_CONNECTIONS,
+                 max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry: float = KEEPALIVE_EXPIRY,
+                 http2: bool = HTTP2, transport: httpx.AsyncBaseTransport | None = None,
+                 limiter: AdaptiveRateLimiter | None = None, retry: RetryPolicy | None = None,
+                 tokens: TokenManager | None = None, env_fallback: bool = True):
+        # normalize BASE_URL to avoid double slashes
+        self.base_url = (base_url or os.getenv("TTLOCK_API_URL") or "").rstrip('/')
+        # env_fallback=False: a per-account client never borrows the TTLOCK_* credentials
+        env = os.getenv if env_fallback else (lambda name: None)
+        self.client_id = client_id or env("TTLOCK_CLIENT_ID")
+        self.access_token = access_token or env("TTLOCK_ACCESS_TOKEN")
+        # When set, every request asks it for the current token instead of using access_token
+        self.tokens = tokens
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        # HTTP/2 needs the optional 'h2' package (pip install httpx[http2])
+        if http2 and importlib.util.find_spec("h2") is None:
+            log.warning("TTLOCK_HTTP2 is set but 'h2' is not installed, falling back to HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.transport = transport
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.retry = retry or RetryPolicy()
+        self.metrics = new_metrics()
+        self._http = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """The shared httpx.AsyncClient (opened lazily)."""
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+                transport=self.transport,
+            )
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    # ==========================================
+    # Raw requests
+    # ==========================================
+    async def _token(self) -> str | None:
+        return await self.tokens.get_token() if self.tokens else self.access_token
+
+    def _params(self, params: dict, token: str | None) -> dict:
+        return {
+            "clientId": self.client_id,
+            "accessToken": token,
+            **{k: v for k, v in params.items() if v is not None},
+            "date": now_ms(),
+        }
+
+    async def _send(self, method: str, path: str, params: dict, token: str | None) -> httpx.Response:
+        if method == "GET":
+            return await self.http.get(path, params=self._params(params, token))
+        return await self.http.post(path, data=self._params(params, token))
+
+    async def get(self, path: str, **params) -> httpx.Response:
+        """GET `path` with the auth params filled in. Returns the raw response."""
+        return await self._send("GET", path, params, await self._token())
+
+    async def post(self, path: str, **data) -> httpx.Response:
+        """POST `path` as a form with the auth params filled in. Returns the raw response."""
+        return await self._send("POST", path, data, await self._token())
+
+    async def get_json(self, path: str, **params) -> dict:
+        """GET `path` and return the parsed JSON body (see _request_json)."""
+        return await self._request_json("GET", path, params)
+
+    async def post_json(self, path: str, **data) -> dict:
+        """POST `path` and return the parsed JSON body (see _request_json)."""
+        return await self._request_json("POST", path, data)
+
+    async def _request_json(self, method: str, path: str, params: dict) -> dict:
+        """
+        Sends the request and returns the parsed JSON body.
+
+        Waits for the rate limiter before every attempt. Connection errors,
+        timeouts, HTTP 429/5xx and transient TTLock errcodes are retried with
+        backoff; once retries run out the last error is raised (TTLockError
+        for errcodes). Other TTLock errcodes are left in the body for the
+        caller to check; other 4xx raise httpx.HTTPStatusError.
+        With a TokenManager, a rejected token is refreshed and the request
+        sent once more right away.
+        """
+        stats = self.metrics[path]
+        attempt = 0
+        token_renewed = False
+        while True:
+            stats["requests"] += 1
+            stats["rate_wait_s"] += await self.limiter.acquire(path)
+
+            retry_after = None
+            token = await self._token()
+            start = time.perf_counter()
+            try:
+                response = await self._send(method, path, params, token)
+            except httpx.TransportError as e:
+                error = e
+                metrics.observe("ttlock_request_seconds", time.perf_counter() - start, endpoint=path)
+                metrics.inc("ttlock_requests_total", endpoint=path, outcome="transport_error")
+            else:
+                metrics.observe("ttlock_request_seconds", time.perf_counter() - start, endpoint=path)
+                metrics.inc("ttlock_requests_total", endpoint=path, outcome=str(response.status_code))
+                if response.status_code in TRANSIENT_HTTP_STATUS:
+                    error = httpx.HTTPStatusError(
+                        f"HTTP {response.status_code}", request=response.request, response=response
+                    )
+                    if response.status_code in THROTTLE_HTTP_STATUS:
+                        stats["throttled"] += 1
+                        metrics.inc("ttlock_throttled_total", endpoint=path)
+                        self.limiter.on_throttle(path)
+                        retry_after = _retry_after(response)
+                else:
+                    response.raise_for_status()
+                    data = response.json()
+                    errcode = data.get("errcode", 0)
+                    debug_body(log, path, data)
+                    if errcode in INVALID_TOKEN_ERRCODES and self.tokens and not token_renewed:
+                        log.info(f"{path}: access token rejected, refreshing it")
+                        await self.tokens.invalidate(token)
+                        token_renewed = True
+                        continue
+                    if errcode not in TRANSIENT_ERRCODES:
+                        self.limiter.on_success(path)
+                        if errcode != 0:
+                            metrics.inc("ttlock_errors_total", endpoint=path, errcode=str(errcode))
+                        return data
+                    error = TTLockError(path, errcode, data.get("errmsg"))
+
+            if attempt >= self.retry.max_retries:
+                stats["failures"] += 1
+                metrics.inc("ttlock_errors_total", endpoint=path, errcode="retries_exhausted")
+                log.error(f"{path} failed after {attempt + 1} attempts: {error}")
+                raise error
+            delay = self.retry.delay(attempt, retry_after)
+            stats["retries"] += 1
+            stats["backoff_s"] += delay
+            metrics.inc("ttlock_retries_total", endpoint=path)
+            log.debug(f"{path} attempt {attempt + 1} failed ({error}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def metrics_summary(self) -> dict:
+        """Plain-dict snapshot of the per-endpoint counters and current rates."""
+        return {
+            "endpoints": {path: dict(stats) for path, stats in self.metrics.items()},
+            "rates": self.limiter.current_rates(),
+        }
+
+    # ==========================================
+    # Typed endpoints
+    # ==========================================
+    async def list_locks(self, page_no: int = 1, page_size: int = 20,
+                         group_id: int | None = None) -> TTLockPage:
+        return await self.get_json(
+            "/v3/lock/list", pageNo=str(page_no), pageSize=str(page_size), groupId=group_id
+        )
+
+    async def list_lock_records(self, lock_id: int, start_date: int, end_date: int,
+                                page_no: int = 1, page_size: int = 100) -> TTLockPage:
+        """Unlock / operation records of one lock with lockDate in [start_date, end_date] (ms), newest first."""
+        return await self.get_json(
+            "/v3/lockRecord/list", lockId=lock_id, startDate=start_date, endDate=end_date,
+            pageNo=str(page_no), pageSize=str(page_size)
+        )
+
+    async def freeze_ekey(self, key_id: int) -> dict:
+        return await self.post_json("/v3/key/freeze", keyId=key_id)
+
+    async def unfreeze_ekey(self, key_id: int) -> dict:
+        return await self.post_json("/v3/key/unfreeze", keyId=key_id)
+
+    async def change_card_period(self, lock_id: int, card_id: int, start_date: int, end_date: int,
+                                 change_type: int = 2) -> dict:
+        """change_type 1 = via phone bluetooth, 2 = via gateway (what a server can do)."""
+        return await self.post_json(
+            "/v3/identityCard/changePeriod", lockId=lock_id, cardId=card_id,
+            startDate=start_date, endDate=end_date, changeType=change_type,
+        )
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    """Seconds from a Retry-After header, if the server sent a numeric one."""
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
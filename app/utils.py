@@ -0,0 +1,32 @@
+import json
+import os
+import time
+
+
+def now_ms() -> int:
+    """Current time in epoch milliseconds (the TTLock `date` parameter)."""
+    return int(time.time() * 1000)
+
+
+def load_locks(spec: str | None) -> list:
+    """
+    Lock list from config, in the shape sync_access_IC_ekey takes
+    ([{"lockId": ..., "name": ...}]). `spec` is either
+
+    - a JSON file holding such a list, or
+    - comma-separated lock ids, each optionally followed by "=name":
+      "26986212=Terrace,26436420"
+
+    Empty / None gives an empty list.
+    """
+    if not spec:
+        return []
+    if os.path.exists(spec):
+        with open(spec, "r", encoding="utf-8") as f:
+            return [{"lockId": int(l["lockId"]), "name": l.get("name") or l.get("lockAlias")} for l in json.load(f)]
+    locks = []
+    for part in spec.split(","):
+        lock_id, _, name = part.strip().partition("=")
+        if lock_id:
+            locks.append({"lockId": int(lock_id), "name": name.strip() or None})
+    return locks